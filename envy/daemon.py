@@ -0,0 +1,176 @@
+"""Decompilation daemon.
+
+Starting the decompiler (imports, visitor registration, version tables)
+takes much longer than decompiling a typical pyc file.  The daemon pays for
+it once, and then serves requests over a UNIX domain socket:
+
+    python -m envy.daemon [--socket PATH] [--cache N]
+
+unpyc_client.py is a drop-in replacement for unpyc.py that talks to it.
+
+The protocol is JSON lines.  A request is an object with either "path" (a
+pyc file name, read by the daemon) or "data" (base64-encoded pyc contents),
+and optionally "output" (a list of envy.python.session.OUTPUTS items,
+default code and source, like unpyc.py) and "options" (an object with any
+of the OPTIONS below, as Decompiler takes them - limits as an object with
+the Limits fields).  The reply is {"ok": true,
+"lines": [...], "cached": bool}, or {"ok": false, "error": message}.
+Several requests may be sent over one connection.
+
+Results are kept in an LRU cache keyed by the hash of the pyc contents, so
+asking for the same file again is almost free.
+"""
+
+from collections import OrderedDict
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+
+from envy.format.helpers import FormatError
+from envy.python.deco.budget import Limits
+from envy.python.helpers import PythonError
+from envy.python.session import Decompiler
+
+DEFAULT_OUTPUT = ('code', 'source')
+
+# the Decompiler options a request may set
+OPTIONS = ['intern', 'parens', 'fallback', 'engine', 'limits']
+
+
+def default_socket():
+    return os.environ.get('ENVY_SOCKET') or '/tmp/envy-{}.sock'.format(os.getuid())
+
+
+class Daemon:
+    """The request handling logic, independent of the transport."""
+
+    def __init__(self, cache_size=256):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def session(self, output, options):
+        with self.lock:
+            try:
+                return self.sessions[output, options]
+            except KeyError:
+                kwargs = dict(options)
+                if kwargs.get('limits') is not None:
+                    kwargs['limits'] = Limits(**dict(kwargs['limits']))
+                res = self.sessions[output, options] = Decompiler(output=output, **kwargs)
+                return res
+
+    def decompile(self, data, output, options=()):
+        """Returns (lines, cached) for pyc contents given as bytes.  options
+        is a sorted tuple of (OPTIONS item, value)."""
+        key = hashlib.sha256(data).digest(), output, options
+        with self.lock:
+            try:
+                res = self.cache[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.cache.move_to_end(key)
+                return res, True
+        res = list(self.session(output, options).decompile(io.BytesIO(data)))
+        with self.lock:
+            self.cache[key] = res
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return res, False
+
+    def handle(self, req):
+        """Handles a decoded request, returns the reply."""
+        try:
+            output = tuple(req.get('output', DEFAULT_OUTPUT))
+            options = _options(req.get('options', {}))
+            if 'path' in req:
+                with open(req['path'], 'rb') as fp:
+                    data = fp.read()
+            else:
+                data = base64.b64decode(req['data'])
+            lines, cached = self.decompile(data, output, options)
+        except (PythonError, FormatError, OSError, ValueError, KeyError, TypeError) as e:
+            return {'ok': False, 'error': '{}: {}'.format(type(e).__name__, e)}
+        except Exception:
+            return {'ok': False, 'error': traceback.format_exc()}
+        return {'ok': True, 'lines': lines, 'cached': cached}
+
+
+def _options(opts):
+    # hashable, for the session and result keys
+    for name in opts:
+        if name not in OPTIONS:
+            raise ValueError("unknown option {}".format(name))
+    return tuple(sorted(
+        (name, tuple(sorted(val.items())) if isinstance(val, dict) else val)
+        for name, val in opts.items()
+    ))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                req = json.loads(line.decode('utf-8'))
+            except ValueError as e:
+                reply = {'ok': False, 'error': 'bad request: {}'.format(e)}
+            else:
+                reply = self.server.daemon.handle(req)
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, daemon):
+        self.daemon = daemon
+        if os.path.exists(path):
+            # don't take over the socket of a live daemon
+            probe = socket.socket(socket.AF_UNIX)
+            try:
+                probe.connect(path)
+            except OSError:
+                os.unlink(path)
+            else:
+                raise OSError("daemon already running on {}".format(path))
+            finally:
+                probe.close()
+        super().__init__(path, _Handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves decompilation requests over a UNIX socket.")
+    parser.add_argument('--socket', default=default_socket(), help="socket path (default: $ENVY_SOCKET or /tmp/envy-UID.sock)")
+    parser.add_argument('--cache', type=int, default=256, metavar='N', help="number of results to keep (default 256)")
+    args = parser.parse_args()
+    try:
+        server = Server(args.socket, Daemon(args.cache))
+    except OSError as e:
+        sys.exit(str(e))
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -155,6 +155,7 @@ import binascii
 from .helpers import read_byte, read_le, read_bytes, FormatError
 from envy.show import preindent, indent
 from envy.meta import Node, Field, ListField
+from envy.python.version import compile_flags
 
 class MarshalError(FormatError):
     pass
@@ -390,7 +391,7 @@ def _code(code, flag=None):
     the function is active if the flag is false.  Otherwise, the function
     is active if the flag is True."""
     def inner(function):
-        MARSHAL_CODES.setdefault(ord(code), []).append((function, flag))
+        MARSHAL_CODES.setdefault(ord(code), []).append((function, compile_flags(flag)))
         return function
     return inner
 
@@ -690,9 +691,10 @@ def load_ref(ctx, flag):
 
 
 class _MarshalContext:
-    def __init__(self, fp, version):
+    def __init__(self, fp, version, codes):
         self.fp = fp
         self.version = version
+        self.codes = codes
         self.refs = []
         self.level = 0
 
@@ -708,12 +710,10 @@ class _MarshalContext:
             code &= 0x7f
         else:
             ref = False
-        for fun, flags in MARSHAL_CODES.get(code, []):
-            if self.version.match(flags):
-                res = fun(self, ref)
-                break
-        else:
+        fun = self.codes[code]
+        if fun is None:
             raise MarshalError("marshal type unknown ({!r})".format(bytes([code])))
+        res = fun(self, ref)
         if res is None and not nullable:
             raise MarshalError("NULL in a funny place")
         return res
@@ -800,7 +800,8 @@ class _MarshalContext:
         return obj
 
 
-def load_marshal(fp, version):
-    """Deserializes a marshal stream from a given file.  Returns
-    a MarshalNode."""
-    return _MarshalContext(fp, version).load_object()
+def load_marshal(fp, version, codes):
+    """Deserializes a marshal stream from a given file.  codes maps type
+    codes to the reader functions active in version (see
+    envy.python.session.VersionTables).  Returns a MarshalNode."""
+    return _MarshalContext(fp, version, codes).load_object()
@@ -3,6 +3,7 @@ import datetime
 from .helpers import read_bytes, read_byte, read_le, read_eof, FormatError
 from .marshal import load_marshal
 from envy.python.version import PYC_VERSIONS
+from envy import stats
 
 class PycError(FormatError):
     pass
@@ -16,19 +17,30 @@ class PycFile:
     """
     __slots__ = 'version', 'timestamp', 'size', 'code'
 
-    def __init__(self, fp):
+    def __init__(self, fp, session=None):
         version_code = read_le(fp, 4)
         try:
             self.version = PYC_VERSIONS[version_code]
         except KeyError:
             raise PycError("pyc version unknown ({})".format(version_code))
+        if session is None:
+            from envy.python.session import VersionTables
+            tables = VersionTables(self.version)
+        else:
+            if session.version is not None and session.version is not self.version:
+                raise PycError("{} pyc expected, got {}".format(session.version.name, self.version.name))
+            tables = session.tables(self.version)
         self.timestamp = read_le(fp, 4)
         if self.version.has_size:
             self.size = read_le(fp, 4)
         else:
             self.size = None
-        self.code = load_marshal(fp, self.version)
-        read_eof(fp)
+        self.code = load_marshal(fp, self.version, tables.marshal)
+        if session is None or session.strict:
+            read_eof(fp)
+        st = stats.ACTIVE.stats
+        if st is not None:
+            st.bytes += fp.tell()
 
     def show(self):
         yield "pyc version {} ({}) {}".format(self.version.code, self.version.name, datetime.datetime.fromtimestamp(self.timestamp))
@@ -0,0 +1,145 @@
+"""Hooks around the pipeline stages.
+
+A hook is an object with enter and exit methods, called when a stage starts
+and ends.  Both get the stage name and a StageInfo describing what's being
+processed.  The stages are:
+
+- file: the whole file, from reading to rendering
+- pyc: reading the pyc header and the marshal stream
+- load: importing the visitor modules for the pyc's version - only takes
+  time for the first file of a version
+- code: parsing a code object and its bytecode, nested for inner code objects
+- deco: running the stack automaton on a code object, likewise nested
+- postproc: AST processing
+- show: rendering the source
+
+For file-level stages, info.name is the file name and info.size is the file
+size.  For code and deco, info.name is the code object name and info.size
+is the bytecode length; info.code is the Code object for deco (it doesn't
+exist yet when code starts).
+
+A stage can also be run in pieces, with other work in between (see
+Resumable) - the streamed top-level deco stage is.  Hooks see it entered
+and exited once, and paused and resumed between the pieces.  A hook that
+doesn't care about pauses counts the time in between as part of the stage.
+
+When no hooks are installed, stage returns a shared no-op context manager.
+Installed hooks are per thread.
+"""
+
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+import threading
+
+
+class _Active(threading.local):
+    hooks = ()
+
+ACTIVE = _Active()
+
+StageInfo = namedtuple('StageInfo', ['name', 'size', 'code'])
+
+
+class Hook:
+    __slots__ = ()
+
+    def enter(self, stage, info):
+        pass
+
+    def exit(self, stage, info):
+        pass
+
+    def pause(self, stage, info):
+        pass
+
+    def resume(self, stage, info):
+        pass
+
+
+_NOSTAGE = nullcontext()
+
+@contextmanager
+def _stage(stage, info, hooks):
+    for hook in hooks:
+        hook.enter(stage, info)
+    try:
+        yield info
+    finally:
+        for hook in reversed(hooks):
+            hook.exit(stage, info)
+
+def stage(stage, name=None, size=None, code=None):
+    """Runs the hooks around a stage, for use in a with statement."""
+    hooks = ACTIVE.hooks
+    if not hooks:
+        return _NOSTAGE
+    return _stage(stage, StageInfo(name, size, code), hooks)
+
+
+class Resumable:
+    """A stage run in pieces, see piece.  The hooks are the ones installed
+    when it's created."""
+    __slots__ = 'stage', 'info', 'hooks', 'started', 'done'
+
+    def __init__(self, stage, name=None, size=None, code=None):
+        self.stage = stage
+        self.info = StageInfo(name, size, code)
+        self.hooks = ACTIVE.hooks
+        self.started = False
+        self.done = False
+
+    @contextmanager
+    def piece(self):
+        """Runs a piece of the stage, for use in a with statement.  The
+        stage is entered by the first piece, and exited by the one that
+        calls finish (or raises) - the others are paused at the end."""
+        for hook in self.hooks:
+            if self.started:
+                hook.resume(self.stage, self.info)
+            else:
+                hook.enter(self.stage, self.info)
+        self.started = True
+        try:
+            yield self
+        except BaseException:
+            self.done = True
+            raise
+        finally:
+            for hook in reversed(self.hooks):
+                if self.done:
+                    hook.exit(self.stage, self.info)
+                else:
+                    hook.pause(self.stage, self.info)
+
+    def finish(self):
+        """Makes the current piece the last one."""
+        self.done = True
+
+    def close(self):
+        """Exits the stage if it was left paused."""
+        if self.started and not self.done:
+            with self.piece():
+                self.finish()
+
+
+@contextmanager
+def install(hook):
+    """Installs a hook for the duration of the with block."""
+    prev = ACTIVE.hooks
+    ACTIVE.hooks = prev + (hook,)
+    try:
+        yield hook
+    finally:
+        ACTIVE.hooks = prev
+
+
+@contextmanager
+def only(*hooks):
+    """Installs just the given hooks for the duration of the with block,
+    suspending the others."""
+    prev = ACTIVE.hooks
+    ACTIVE.hooks = hooks
+    try:
+        yield
+    finally:
+        ACTIVE.hooks = prev
@@ -0,0 +1,111 @@
+"""Hash-consing of immutable nodes.
+
+Decompiled code is full of repeated expressions - the same constants, the
+same names loaded over and over.  Every occurrence used to be a separate
+node.  While an Interner is installed as the active interner (see collect),
+every newly built node of an internable class is looked up in its table,
+and an equal node built earlier is returned instead, so equal nodes end up
+shared.  When no interner is active, ACTIVE.interner is None and node
+construction pays for a single attribute check.  The active interner is per
+thread.
+
+A node class is internable if it asks for it (intern=True, inherited - Expr
+does) and has no volatile fields, so its nodes can never change after they
+are built.  A node is only shared if all its subnodes are internable as
+well.  Internable nodes are also hashable, with the hash computed once.
+
+Sharing is decided on a stricter notion of equality than Node.__eq__:
+values are compared along with their types, and floats by repr, so 0.0 and
+-0.0 (or 1 and True) are never merged.
+"""
+
+from contextlib import contextmanager
+import threading
+
+from envy import stats
+
+class _Active(threading.local):
+    # the active interner, or None if interning is disabled
+    interner = None
+
+ACTIVE = _Active()
+
+
+class _Unshareable(Exception):
+    pass
+
+
+def _value_key(val):
+    if val is None:
+        return None
+    if isinstance(val, tuple):
+        return tuple([_value_key(x) for x in val])
+    t = type(val)
+    internable = getattr(t, '_internable', None)
+    if internable is not None:
+        # a node - subnodes are interned before their parents, so identity
+        # is enough.  The parent keeps the subnode alive, so the id stays
+        # valid for as long as the key is in the table.
+        if not internable:
+            raise _Unshareable()
+        return id(val)
+    if t is float or t is complex:
+        return t, repr(val)
+    return t, val
+
+
+class Interner:
+    """A table of shared nodes, normally kept for the duration of a single
+    file."""
+    __slots__ = 'table', 'converted', 'hits', 'misses'
+
+    def __init__(self):
+        self.table = {}
+        # id of marshal object -> (marshal object, expression), see convert
+        self.converted = {}
+        self.hits = 0
+        self.misses = 0
+
+    def intern(self, node):
+        """Returns the shared node equal to node, or node itself if it
+        cannot be shared or is the first of its kind."""
+        try:
+            key = (type(node),) + tuple([
+                _value_key(getattr(node, field.name))
+                for field in node._fields
+            ])
+            res = self.table.setdefault(key, node)
+        except (_Unshareable, TypeError):
+            return node
+        if res is node:
+            self.misses += 1
+        else:
+            self.hits += 1
+            st = stats.ACTIVE.stats
+            if st is not None:
+                st.shared += 1
+        return res
+
+    def convert(self, obj, fun):
+        """Returns fun(obj), computed only once for a given object.  Used
+        for marshal objects that are referenced more than once ('r' refs in
+        3.4+), which are converted to mutable nodes that can't be interned
+        by value."""
+        try:
+            return self.converted[id(obj)][1]
+        except KeyError:
+            res = fun(obj)
+            self.converted[id(obj)] = obj, res
+            return res
+
+
+@contextmanager
+def collect(interner):
+    """Installs interner as the active interner for the duration of the
+    with block.  None is allowed and disables interning."""
+    prev = ACTIVE.interner
+    ACTIVE.interner = interner
+    try:
+        yield interner
+    finally:
+        ACTIVE.interner = prev
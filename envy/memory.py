@@ -0,0 +1,154 @@
+"""Memory accounting for the pipeline stages.
+
+MemoryReport is a hook that, for every file, records:
+
+- traced memory (current and peak, via tracemalloc) at the end of every
+  file-level stage,
+- a census of live Node and Opcode instances by class at the end of every
+  file-level stage,
+- the peak RSS of the process while the file was processed.  On Linux, the
+  RSS high-water mark is reset before each file; elsewhere, the reported
+  value is the process-wide peak so far.
+
+This is a diagnostic mode: the census walks all gc-tracked objects, and
+tracemalloc itself slows everything down considerably.
+"""
+
+from collections import Counter
+import gc
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from envy import hooks
+from envy.meta import Node
+from envy.python.bytecode import Opcode
+
+STAGES = ['pyc', 'load', 'code', 'deco', 'postproc', 'show']
+
+
+def census():
+    """Counts live Node and Opcode instances by class name."""
+    res = Counter()
+    for obj in gc.get_objects():
+        if isinstance(obj, (Node, Opcode)):
+            res[type(obj).__name__] += 1
+    return res
+
+
+def _reset_rss_peak():
+    try:
+        with open('/proc/self/clear_refs', 'w') as fp:
+            fp.write('5')
+    except OSError:
+        pass
+
+def _rss_peak():
+    """Returns the peak RSS in kilobytes, or None if unknown."""
+    try:
+        with open('/proc/self/status') as fp:
+            for line in fp:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None
+
+
+class FileMemory:
+    __slots__ = 'name', 'stages', 'nodes', 'peak', 'rss'
+
+    def __init__(self, name):
+        self.name = name
+        # stage -> (current, peak, live nodes)
+        self.stages = {}
+        # census at the stage with most live nodes
+        self.nodes = Counter()
+        self.peak = 0
+        self.rss = None
+
+    def show(self, top):
+        yield "memory for {}:".format(self.name)
+        for stage in STAGES:
+            if stage in self.stages:
+                cur, peak, nodes = self.stages[stage]
+                yield "\t{:<10} {:10.1f} kB now {:10.1f} kB peak {:8} nodes".format(
+                    stage, cur / 1024, peak / 1024, nodes
+                )
+        if self.rss is not None:
+            yield "\tpeak RSS {} kB".format(self.rss)
+        for name, count in self.nodes.most_common(top):
+            yield "\t{:8} {}".format(count, name)
+
+
+class MemoryReport(hooks.Hook):
+    __slots__ = 'files', 'cur', 'depth', 'owned'
+
+    def __init__(self):
+        self.files = []
+        self.cur = None
+        self.depth = Counter()
+        self.owned = False
+
+    def enter(self, stage, info):
+        if stage == 'file':
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.owned = True
+            tracemalloc.reset_peak()
+            _reset_rss_peak()
+            self.cur = FileMemory(info.name)
+        elif stage in STAGES:
+            self.depth[stage] += 1
+
+    def exit(self, stage, info):
+        if stage == 'file':
+            self.cur.rss = _rss_peak()
+            self.files.append(self.cur)
+            self.cur = None
+            if self.owned:
+                tracemalloc.stop()
+                self.owned = False
+        elif stage in STAGES:
+            self.depth[stage] -= 1
+            if self.depth[stage] or self.cur is None:
+                return
+            cur, peak = tracemalloc.get_traced_memory()
+            nodes = census()
+            total = sum(nodes.values())
+            self.cur.stages[stage] = cur, peak, total
+            self.cur.peak = max(self.cur.peak, peak)
+            if total >= sum(self.cur.nodes.values()):
+                self.cur.nodes = nodes
+
+    # the snapshot is taken once, when the stage is done
+    def pause(self, stage, info):
+        if stage in STAGES:
+            self.depth[stage] -= 1
+
+    def resume(self, stage, info):
+        if stage in STAGES:
+            self.depth[stage] += 1
+
+    def show(self, top):
+        """Yields the batch summary: the top memory consumers, and the node
+        classes taking up most instances across them."""
+        files = sorted(self.files, key=lambda f: f.peak, reverse=True)
+        yield "top memory consumers:"
+        for f in files[:top]:
+            yield "\t{:10.1f} kB peak {:>10} kB RSS  {}".format(
+                f.peak / 1024,
+                f.rss if f.rss is not None else '?',
+                f.name
+            )
+        nodes = Counter()
+        for f in files[:top]:
+            nodes.update(f.nodes)
+        yield "most common live node classes:"
+        for name, count in nodes.most_common(top):
+            yield "\t{:8} {}".format(count, name)
@@ -2,6 +2,8 @@ from collections import OrderedDict
 from itertools import zip_longest
 from enum import Enum
 
+from envy import intern, stats
+
 class BaseField:
     def __init__(self, type_, volatile=False, optional=False):
         self.type = type_
@@ -14,10 +16,10 @@ class BaseField:
                 if not (type_ in (int, bool, str, bytes, float, complex, object) or issubclass(type_, Enum)):
                     raise TypeError("weird field type {}".format(type_))
 
-    def __get__(self, obj, type=None):
-        return self.slot.__get__(obj, type)
+    # not a descriptor: fields are read straight from their slots, and
+    # written through Node.__setattr__, which calls set
 
-    def __set__(self, obj, val):
+    def set(self, obj, val):
         if not self.typecheck(val):
             raise TypeError("wrong type for {}.{}: wanted {}, got {}".format(
                 self.cls.__name__,
@@ -30,9 +32,6 @@ class BaseField:
             raise TypeError("field already set")
         self.slot.__set__(obj, val)
 
-    def __delete__(self, obj):
-        raise TypeError("cannot delete node attribute")
-
     def process(self, val):
         return val
 
@@ -46,6 +45,9 @@ class Field(BaseField):
         else:
             return val
 
+    def children(self, val):
+        return () if val is None else (val,)
+
 class ListField(BaseField):
     def typecheck(self, val):
         if val is None and self.optional:
@@ -60,6 +62,9 @@ class ListField(BaseField):
         else:
             return val
 
+    def children(self, val):
+        return () if val is None else val
+
     def process(self, val):
         if val is not None and not self.volatile:
             return tuple(val)
@@ -84,12 +89,15 @@ class DictField(BaseField):
         else:
             return val
 
+    def children(self, val):
+        return () if val is None else val.values()
+
 
 class NodeMeta(type):
-    def __prepare__(name, bases, abstract=False):
+    def __prepare__(name, bases, abstract=False, intern=False):
         return OrderedDict()
 
-    def __new__(meta, name, bases, namespace, abstract=False):
+    def __new__(meta, name, bases, namespace, abstract=False, intern=False):
         for base in bases:
             if not issubclass(base, Node):
                 raise TypeError("base not derived from node")
@@ -103,29 +111,79 @@ class NodeMeta(type):
         for field in fields:
             del namespace[field.name]
         namespace['__slots__'] = [field.name for field in fields]
+        if intern:
+            # the root of an internable hierarchy: add the cached hash (see
+            # Node.__hash__), and switch to the metaclass that does the
+            # interning, which subclasses inherit.  Other node classes
+            # don't pay for it.
+            namespace['__slots__'].append('_hash')
+            meta = InternNodeMeta
         cls = super().__new__(meta, name, bases, namespace)
         for field in fields:
             field.cls = cls
             field.slot = getattr(cls, field.name)
-            setattr(cls, field.name, field)
         cls._fields = cls._fields + fields
+        cls._fieldmap = {field.name: field for field in cls._fields}
+        # the fields with subnodes (see children)
+        cls._subfields = [field for field in cls._fields if field.sub]
         cls._abstract = abstract
+        cls._internable = isinstance(cls, InternNodeMeta) and not abstract and not any(
+            field.volatile or isinstance(field, DictField)
+            for field in cls._fields
+        )
         return cls
 
-    def __init__(meta, name, bases, namespace, abstract=False):
+    def __init__(meta, name, bases, namespace, abstract=False, intern=False):
         return super().__init__(name, bases, namespace)
 
 
+class InternNodeMeta(NodeMeta):
+    """Metaclass of internable node classes, see envy.intern."""
+
+    def __call__(cls, *args):
+        node = type.__call__(cls, *args)
+        interner = intern.ACTIVE.interner
+        if interner is not None and cls._internable:
+            return interner.intern(node)
+        return node
+
+
 class Node(metaclass=NodeMeta, abstract=True):
     _fields = []
+    _fieldmap = {}
+    _subfields = []
 
     def __init__(self, *args):
         if self._abstract:
             raise TypeError("instantiating an abstract node type")
+        st = stats.ACTIVE.stats
+        if st is not None:
+            st.nodes += 1
         if len(args) > len(self._fields):
             raise ValueError("arg and field counts don't match")
         for field, val in zip_longest(self._fields, args):
-            setattr(self, field.name, val)
+            field.set(self, val)
+
+    def __setattr__(self, name, val):
+        field = self._fieldmap.get(name)
+        if field is None:
+            object.__setattr__(self, name, val)
+        else:
+            field.set(self, val)
+
+    def __delattr__(self, name):
+        if name in self._fieldmap:
+            raise TypeError("cannot delete node attribute")
+        object.__delattr__(self, name)
+
+    def __reduce__(self):
+        # rebuilt through the constructor: compact, type checked, and
+        # interned if an interner is active - the cached hash is not saved,
+        # as str hashes differ between processes
+        return type(self), tuple([
+            getattr(self, field.name)
+            for field in self._fields
+        ])
 
     def subprocess(self, process):
         return type(self)(*[
@@ -133,8 +191,42 @@ class Node(metaclass=NodeMeta, abstract=True):
             for field in self._fields
         ])
 
+    def children(self):
+        """Returns a list of the subnodes, in the order subprocess processes
+        them."""
+        res = []
+        for field in self._subfields:
+            res.extend(field.children(getattr(self, field.name)))
+        return res
+
     def __eq__(self, other):
-        return type(self) is type(other) and all(
+        if self is other:
+            return True
+        if type(self) is not type(other):
+            return False
+        if self._internable:
+            # equal nodes have equal hashes - if both are already known,
+            # they're usually enough to tell the nodes apart
+            mine = getattr(self, '_hash', None)
+            if mine is not None:
+                theirs = getattr(other, '_hash', None)
+                if theirs is not None and mine != theirs:
+                    return False
+        return all(
             getattr(self, field.name) == getattr(other, field.name)
             for field in self._fields
         )
+
+    def __hash__(self):
+        if not self._internable:
+            raise TypeError("unhashable node type {}".format(type(self).__name__))
+        try:
+            return self._hash
+        except AttributeError:
+            pass
+        # fails if a subnode isn't hashable
+        res = self._hash = hash((type(self),) + tuple(
+            getattr(self, field.name)
+            for field in self._fields
+        ))
+        return res
@@ -0,0 +1,87 @@
+"""Profiling hooks for the pipeline stages.
+
+Profiler runs cProfile while any of the selected stages is active, and
+accumulates the data over all profiled files.  CodeTimer measures the time
+spent in the deco stage of every code object, so that a slow nested function
+can be told apart from its slow parent.
+"""
+
+import cProfile
+import time
+
+from envy import hooks
+
+
+class Profiler(hooks.Hook):
+    __slots__ = 'stages', 'prof', 'depth'
+
+    def __init__(self, stages=('file',)):
+        self.stages = set(stages)
+        self.prof = cProfile.Profile()
+        self.depth = 0
+
+    def enter(self, stage, info):
+        if stage in self.stages:
+            if not self.depth:
+                self.prof.enable()
+            self.depth += 1
+
+    def exit(self, stage, info):
+        if stage in self.stages:
+            self.depth -= 1
+            if not self.depth:
+                self.prof.disable()
+
+    # a paused stage isn't profiled
+    pause = exit
+    resume = enter
+
+    def dump(self, fname):
+        """Writes the collected data to a pstats file."""
+        self.prof.dump_stats(fname)
+
+
+class CodeTimer(hooks.Hook):
+    """Collects (exclusive time, inclusive time, file name, code name,
+    bytecode size) for every decompiled code object."""
+    __slots__ = 'times', 'file', 'pending', 'paused'
+
+    def __init__(self):
+        self.times = []
+        self.file = None
+        self.pending = []
+        # id of info -> [time so far, nested time] of paused stages
+        self.paused = {}
+
+    def enter(self, stage, info):
+        if stage == 'file':
+            self.file = info.name
+        elif stage == 'deco':
+            self.pending.append([time.perf_counter(), 0])
+
+    def exit(self, stage, info):
+        if stage == 'deco':
+            start, nested = self.pending.pop()
+            total = time.perf_counter() - start
+            if self.pending:
+                self.pending[-1][1] += total
+            self.times.append((total - nested, total, self.file, info.name, info.size))
+
+    def pause(self, stage, info):
+        if stage == 'deco':
+            frame = self.pending.pop()
+            frame[0] = time.perf_counter() - frame[0]
+            self.paused[id(info)] = frame
+
+    def resume(self, stage, info):
+        if stage == 'deco':
+            frame = self.paused.pop(id(info))
+            frame[0] = time.perf_counter() - frame[0]
+            self.pending.append(frame)
+
+    def show(self, count):
+        yield "slowest code objects:"
+        for excl, incl, fname, name, size in sorted(self.times, key=lambda x: x[0], reverse=True)[:count]:
+            yield "\t{:10.3f} ms {:10.3f} ms {:>8} bytes  {} in {}".format(
+                excl * 1000, incl * 1000, size, name, fname
+            )
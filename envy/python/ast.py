@@ -1,22 +1,40 @@
 from envy.meta import Node, Field, ListField, DictField
+from envy.show import emitted
 
+from .printer import PRIMARY, render
 
-class Expr(Node, abstract=True):
-    pass
+
+class Expr(Node, abstract=True, intern=True):
+    # printing - see envy.python.printer
+    prec = PRIMARY
+    paren = False
+
+    def show(self, ctx):
+        return render(self)
 
 
 class Stmt(Node, abstract=True):
-    pass
+    # simple statements implement show, compound ones emit (see
+    # envy.show.Emitter) - each gets the other one from here
+
+    def show(self):
+        return emitted(self)
+
+    def emit(self, em):
+        em.lines(self.show())
 
 
 class Block(Node):
     stmts = ListField(Stmt, volatile=True)
 
-    def show(self):
+    def emit(self, em):
         for stmt in self.stmts:
-            yield from stmt.show()
+            stmt.emit(em)
         if not self.stmts:
-            yield 'pass'
+            em.line('pass')
+
+    def show(self):
+        return emitted(self)
 
 
 class FunArgs(Node):
@@ -27,6 +45,8 @@ class FunArgs(Node):
     defkwargs = DictField(str, Expr)
     varkw = Field(Expr, optional=True)
     ann = DictField(str, Expr)
+    prec = PRIMARY
+    paren = False
 
     def setdefs(self, defargs, defkwargs, ann):
         return FunArgs(
@@ -39,7 +59,7 @@ class FunArgs(Node):
             ann
         )
 
-    def show(self):
+    def parts(self):
         from .expr import ExprFast
         def _ann(arg):
             if not isinstance(arg, ExprFast):
@@ -56,39 +76,59 @@ class FunArgs(Node):
         chunks.extend([('', arg, self.defkwargs.get(arg.name), _ann(arg)) for arg in self.kwargs])
         if self.varkw:
             chunks.append(('**', self.varkw, None, _ann(self.varkw)))
-        return ', '.join(
-            '{}{}{}{}'.format(
-                pref,
-                arg.show(None) if arg else '',
-                ": {}".format(ann.show(None)) if ann else '',
-                "={}".format(defarg.show(None)) if defarg else ''
-            )
-            for pref, arg, defarg, ann in chunks
-        )
+        res = []
+        for pref, arg, defarg, ann in chunks:
+            if res:
+                res.append(', ')
+            res.append(pref)
+            if arg:
+                res.append(arg)
+            if ann:
+                res += [': ', ann]
+            if defarg:
+                res += ['=', defarg]
+        return res
+
+    def show(self):
+        return render(self)
 
 
 class CallArg(Node, abstract=True):
     expr = Field(Expr)
+    prec = PRIMARY
+    paren = False
 
 class CallArgPos(CallArg):
-    def show(self):
-        return self.expr.show(None)
+    def parts(self):
+        return [self.expr]
 
 class CallArgKw(CallArg):
     name = Field(str)
-    def show(self):
-        return '{}={}'.format(self.name, self.expr.show(None))
+    def parts(self):
+        return [self.name, '=', self.expr]
 
 class CallArgVar(CallArg):
-    def show(self):
-        return '*{}'.format(self.expr.show(None))
+    def parts(self):
+        return ['*', self.expr]
 
 class CallArgVarKw(CallArg):
-    def show(self):
-        return '**{}'.format(self.expr.show(None))
+    def parts(self):
+        return ['**', self.expr]
 
 class CallArgs(Node):
     args = ListField(CallArg)
+    prec = PRIMARY
+    paren = False
+
+    def parts(self):
+        # the arguments are spliced in, see ExprDict
+        res = []
+        for arg in self.args:
+            res += arg.parts()
+            res.append(', ')
+        if res:
+            res.pop()
+        return res
 
     def show(self):
-        return ', '.join(x.show() for x in self.args)
+        return render(self)
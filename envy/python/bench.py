@@ -0,0 +1,259 @@
+"""Performance regression harness.
+
+Runs the test corpus of envy.python.test through the pipeline several times,
+and records the median time of every stage for every test.  The results can
+be saved as a JSON baseline, and compared against a previously saved one:
+
+    python -m envy.python.bench --save base.json 2.7 3.4
+    python -m envy.python.bench --baseline base.json 2.7 3.4
+
+The comparison is done per version and per test category (the directory
+part of the test name, like binary or stmt), where the noise is low enough
+to be useful, on every stage and the total - a stage can get slower while
+the others make up for it.  The exit status is 1 if any of them got slower
+than the tolerance allows, or if a test of the baseline no longer
+compiles or decompiles (it would be missing from the totals otherwise).
+
+With --startup, the startup time is measured as well: unpyc.py itself is
+run with each of the STARTUP argument lists, on the smallest pyc of the
+first version benchmarked, and the median wall time is recorded and
+compared like the rest.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from envy import stats
+from envy.format.helpers import FormatError
+from envy.python.helpers import PythonError
+from envy.python.test import VERSIONS, prepare, decompile, root_dir
+
+STAGES = stats.STAGES + ['total']
+
+STARTUP = {
+    # the imports and the argument parsing
+    'help': ['--help'],
+    # a whole run on a single (small) file
+    'one': ['{pyc}'],
+    # with stats, which most tooling asks for
+    'stats': ['--stats', '{pyc}'],
+}
+
+
+def bench_test(pycfile, runs):
+    """Decompiles a pyc file runs times, returns the median time of every
+    stage, or None if the decompilation fails."""
+    times = {stage: [] for stage in STAGES}
+    for _ in range(runs):
+        st = stats.Stats(str(pycfile))
+        with stats.collect(st):
+            try:
+                decompile(pycfile)
+            except (PythonError, FormatError):
+                return None
+        for stage in stats.STAGES:
+            times[stage].append(st.times.get(stage, 0))
+        times['total'].append(sum(st.times.values()))
+    return {
+        stage: statistics.median(vals)
+        for stage, vals in times.items()
+    }
+
+
+def bench_version(v, runs):
+    """Returns {test: stage medians} for all tests of a version that could
+    be compiled and decompiled, or None if the old python is missing.  The
+    tests that couldn't are left out, see failures."""
+    version, rversion, cmode, tag, pycver, tests = v
+    fixtures = prepare(v)
+    if fixtures is None:
+        return None
+    res = {}
+    for test in sorted(tests):
+        pycfile, _ = fixtures[test]
+        if pycfile is None:
+            print("compiling {} did not succeed".format(test))
+            continue
+        times = bench_test(pycfile, runs)
+        if times is None:
+            print("FAIL {}".format(test))
+            continue
+        res[test] = times
+    return res
+
+
+def bench_startup(pycfile, runs):
+    """Returns the median wall time of running unpyc.py on pycfile with
+    every STARTUP argument list."""
+    res = {}
+    for name, args in STARTUP.items():
+        cmd = [sys.executable, str(root_dir / 'unpyc.py')]
+        cmd += [arg.format(pyc=pycfile) for arg in args]
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.check_call(cmd, cwd=str(root_dir), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        res[name] = statistics.median(times)
+    return res
+
+
+def startup_pyc(versions):
+    """Returns the smallest compiled test of the first version (out of
+    versions, or all if empty) that has its old python, or None."""
+    for v in VERSIONS:
+        if versions and v[0] not in versions:
+            continue
+        fixtures = prepare(v)
+        if fixtures is None:
+            continue
+        pycs = [pycfile for pycfile, _ in fixtures.values() if pycfile is not None]
+        if pycs:
+            return min(pycs, key=lambda p: p.stat().st_size)
+    return None
+
+
+def summarize(results):
+    """Sums up the per-test medians into {version: {category: stage times}},
+    with the version total under the '' category."""
+    res = {}
+    for version, tests in results.items():
+        groups = res[version] = {}
+        for test, times in tests.items():
+            category = test.partition('/')[0]
+            for group in '', category:
+                acc = groups.setdefault(group, dict.fromkeys(STAGES, 0))
+                for stage in STAGES:
+                    acc[stage] += times[stage]
+    return res
+
+
+def compare(old, new, tolerance, slack):
+    """Yields (version, category, stage, old time, new time, regressed) for
+    every stage of every group present in both summaries.  A stage has
+    regressed if it got slower by more than tolerance (a fraction) and more
+    than slack (in seconds)."""
+    for version, groups in sorted(new.items()):
+        if version not in old:
+            continue
+        for group, times in sorted(groups.items()):
+            if group not in old[version]:
+                continue
+            otimes = old[version][group]
+            for stage in STAGES:
+                # baselines from before a stage was added don't have it
+                if stage not in otimes or stage not in times:
+                    continue
+                otime = otimes[stage]
+                ntime = times[stage]
+                regressed = ntime > otime * (1 + tolerance) and ntime - otime > slack
+                yield version, group, stage, otime, ntime, regressed
+
+
+def failures(old, new):
+    """Yields (version, test) for every test of the old results missing from
+    the new ones, for the versions benchmarked in both."""
+    for version, tests in sorted(new.items()):
+        for test in sorted(old.get(version, ())):
+            if test not in tests:
+                yield version, test
+
+
+def show_summary(summary):
+    for version, groups in sorted(summary.items()):
+        for group, times in sorted(groups.items()):
+            yield "{:<6} {:<10} {}".format(
+                version,
+                group or 'all',
+                ' '.join(
+                    '{}={:.3f}'.format(stage, times[stage] * 1000)
+                    for stage in STAGES
+                )
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the decompiler on the test corpus.")
+    parser.add_argument('-n', '--runs', type=int, default=5, help="number of runs per test (default 5)")
+    parser.add_argument('--save', metavar='FILE', help="save the results as a baseline")
+    parser.add_argument('--baseline', metavar='FILE', help="compare the results against a baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown, as a fraction (default 0.2)")
+    parser.add_argument('--slack', type=float, default=0.5, help="ignore slowdowns below this many milliseconds (default 0.5)")
+    parser.add_argument('--startup', action='store_true', help="measure the startup time too")
+    parser.add_argument('versions', nargs='*', metavar='VERSION')
+    args = parser.parse_args()
+
+    startup = None
+    pycfile = startup_pyc(args.versions) if args.startup else None
+    if args.startup and pycfile is None:
+        print("No pyc to measure the startup time on")
+    elif args.startup:
+        startup = bench_startup(pycfile, args.runs)
+        print("startup [ms]: {}".format(' '.join(
+            '{}={:.3f}'.format(name, val * 1000)
+            for name, val in startup.items()
+        )))
+
+    results = {}
+    for v in VERSIONS:
+        version, rversion = v[:2]
+        if args.versions and version not in args.versions:
+            continue
+        print("version {} ({})...".format(version, rversion))
+        res = bench_version(v, args.runs)
+        if res is None:
+            print("No python {}".format(rversion))
+            continue
+        results[version] = res
+    summary = summarize(results)
+    print("median times [ms]:")
+    for line in show_summary(summary):
+        print('\t' + line)
+
+    if args.save:
+        with open(args.save, 'w') as fp:
+            json.dump({
+                'runs': args.runs,
+                'tests': results,
+                'summary': summary,
+                'startup': startup,
+            }, fp, indent=1, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as fp:
+            base = json.load(fp)
+        old, new = base['summary'], summary
+        if startup and base.get('startup'):
+            # startup times are compared like the group totals
+            old = dict(old, start={name: {'total': val} for name, val in base['startup'].items()})
+            new = dict(new, start={name: {'total': val} for name, val in startup.items()})
+        regressions = 0
+        print("compared to {}:".format(args.baseline))
+        for version, group, stage, otime, ntime, regressed in compare(old, new, args.tolerance, args.slack / 1000):
+            # the stages are only worth a line when they regress
+            if stage != 'total' and not regressed:
+                continue
+            print("\t{:<6} {:<10} {:<8} {:10.3f} ms -> {:10.3f} ms {:+7.1f}%{}".format(
+                version, group or 'all', stage, otime * 1000, ntime * 1000,
+                (ntime / otime - 1) * 100 if otime else 0,
+                '  REGRESSION' if regressed else '',
+            ))
+            regressions += regressed
+        failed = 0
+        for version, test in failures(base['tests'], results):
+            print("\t{:<6} {} FAILED".format(version, test))
+            failed += 1
+        if regressions:
+            print("{} regressions".format(regressions))
+        if failed:
+            print("{} tests of the baseline failed".format(failed))
+        if regressions or failed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
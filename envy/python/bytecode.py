@@ -1,6 +1,9 @@
 from collections import namedtuple
 
+from envy import stats
+
 from .helpers import PythonError
+from .version import compile_flags
 from .expr import Expr, ExprNone, CmpOp, ExprTuple, ExprString, Frozenset
 
 Flow = namedtuple('Flow', ['src', 'dst'])
@@ -228,7 +231,7 @@ def op_maker(base):
             globals()[camelname] = cls
         else:
             assert multi
-        OPCODES.setdefault(code, []).append((cls, flag))
+        OPCODES.setdefault(code, []).append((cls, compile_flags(flag)))
     return make_op_any
 
 make_op = op_maker(Opcode)
@@ -462,6 +465,7 @@ make_op_num(148, 'LOAD_CLASS_DEREF', 'has_classderef')
 class _BytecodeCtx:
     def __init__(self, version, code):
         self.version = version
+        self.opcodes = code.tables.opcodes
         self.code = code.rawcode
         self.consts = code.consts
         self.names = code.names
@@ -480,16 +484,16 @@ class _BytecodeCtx:
 
     def get_op(self, pos, ext):
         opc = self.bytes(1)[0]
-        for cls, flag in OPCODES.get(opc, []):
-            if self.version.match(flag):
-                op = cls.__new__(cls)
-                op.pos = pos
-                if hasattr(op, 'read_params'):
-                    param = int.from_bytes(self.bytes(2), 'little') | ext << 16
-                    op.read_params(param, self)
-                op.nextpos = self.pos
-                return op
-        raise PythonError("unknown opcode {}".format(opc))
+        cls = self.opcodes[opc]
+        if cls is None:
+            raise PythonError("unknown opcode {}".format(opc))
+        op = cls.__new__(cls)
+        op.pos = pos
+        if hasattr(op, 'read_params'):
+            param = int.from_bytes(self.bytes(2), 'little') | ext << 16
+            op.read_params(param, self)
+        op.nextpos = self.pos
+        return op
 
     def bytes(self, num):
         new = self.pos + num
@@ -508,7 +512,11 @@ class _BytecodeCtx:
         return res, idx
 
 def parse_bytecode(version, code):
-    return _BytecodeCtx(version, code).ops
+    ops = _BytecodeCtx(version, code).ops
+    st = stats.ACTIVE.stats
+    if st is not None:
+        st.ops += len(ops)
+    return ops
 
 
 def process_flow(ops):
@@ -0,0 +1,67 @@
+"""Profiling the visitors over a corpus.
+
+Decompiles some pyc files, counting the automaton inputs and visitor
+matches of every version (see envy.python.deco.order), and prints a report
+of the opcodes, constructs and visitors that dominate them.  The profile
+can be saved, and given to unpyc --visitor-profile (or to a Decompiler) to
+try the most likely visitors first:
+
+    python -m envy.python.census -o profile.json FILE.pyc...
+    python -m envy.python.census --merge -o profile.json MORE.pyc...
+    python -m envy.python.census --report profile.json
+
+Identical code objects are counted every time they occur.  Files that fail
+to decompile still count, as far as they got.
+"""
+
+import argparse
+import os
+import sys
+
+from envy.format.helpers import FormatError
+from envy.python.deco import order
+from envy.python.helpers import PythonError
+from envy.python.session import Decompiler
+
+
+def profile_files(fnames, profile):
+    """Decompiles pyc files, counting into profile.  Returns the number of
+    files that failed."""
+    session = Decompiler(output=('deco',), reuse=False)
+    failed = 0
+    with order.collect(profile):
+        for fname in fnames:
+            try:
+                for _ in session.decompile_file(fname):
+                    pass
+            except (PythonError, FormatError) as e:
+                print("{}: {}".format(fname, e), file=sys.stderr)
+                failed += 1
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Counts the automaton inputs and visitor matches over pyc files.")
+    parser.add_argument('-o', '--output', metavar='PROFILE', help="save the profile to PROFILE")
+    parser.add_argument('--merge', action='store_true', help="add the counts to the existing PROFILE")
+    parser.add_argument('--report', metavar='PROFILE', help="report on a saved profile instead of decompiling anything")
+    parser.add_argument('--top', type=int, default=10, metavar='N', help="report the N most common of everything (default 10)")
+    parser.add_argument('files', nargs='*', metavar='FILE.pyc')
+    args = parser.parse_args()
+    if args.report is not None:
+        profile = order.VisitorProfile.load(args.report)
+        failed = 0
+    else:
+        profile = order.VisitorProfile()
+        if args.merge and args.output is not None and os.path.exists(args.output):
+            profile = order.VisitorProfile.load(args.output)
+        failed = profile_files(args.files, profile)
+        if args.output is not None:
+            profile.save(args.output)
+    for line in profile.show(args.top):
+        print(line)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
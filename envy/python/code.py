@@ -1,6 +1,7 @@
 from envy.format.marshal import MarshalCode, MarshalDict, MarshalString, MarshalInt
 from envy.python.bytecode import parse_lnotab, parse_bytecode, process_flow
 from envy.show import preindent, indent
+from envy import hooks, stats
 
 from .stmt import FunArgs
 from .expr import from_marshal, ExprFast
@@ -167,12 +168,25 @@ class Code:
         'ops',
         'firstlineno',
         'lnotab',
+
+        'tables',
     )
 
-    def __init__(self, obj, version):
+    def __init__(self, obj, version, tables=None):
         if not isinstance(obj, MarshalCode):
             raise PythonError("code expected")
+        if tables is None:
+            from .session import VersionTables
+            tables = VersionTables(version)
+        with hooks.stage('code', obj.name, len(obj.code)):
+            self._init(obj, version, tables)
+
+    def _init(self, obj, version, tables):
+        st = stats.ACTIVE.stats
+        if st is not None:
+            st.codes += 1
         self.version = version
+        self.tables = tables
         # name & filename
         self.name = obj.name
         self.filename = obj.filename
@@ -201,7 +215,7 @@ class Code:
         self.consts = []
         for const in obj.consts:
             if isinstance(const, MarshalCode):
-                self.consts.append(Code(const, version))
+                self.consts.append(Code(const, version, tables))
             elif isinstance(const, MarshalDict):
                 self.consts.append(CodeDict(const.items))
             else:
@@ -219,6 +233,23 @@ class Code:
         self.rawcode = obj.code
         self.ops = parse_bytecode(version, self)
 
+    def __getstate__(self):
+        # the tables belong to a session, loaded code objects get the ones
+        # of envy.python.serial.  ops are parsed again, that's about as fast
+        # as loading them, and a lot more compact.
+        return {
+            slot: getattr(self, slot)
+            for slot in self.__slots__
+            if slot not in ('tables', 'ops') and hasattr(self, slot)
+        }
+
+    def __setstate__(self, state):
+        from .serial import tables
+        for slot, val in state.items():
+            setattr(self, slot, val)
+        self.tables = tables(self.version)
+        self.ops = parse_bytecode(self.version, self)
+
     def _init_args(self, obj):
         if obj.argcount is None:
             # python < 1.3
@@ -247,6 +278,15 @@ class Code:
                 varkw = None
             self.args = FunArgs(args, [], vararg, kwargs, {}, varkw, {})
 
+    def show_ops(self):
+        """Yields the disassembly, without the nested code objects."""
+        inflow = process_flow(self.ops)
+        for op in self.ops:
+            if inflow[op.pos]:
+                yield "\t{}\t{}".format(op.pos, op)
+            else:
+                yield "\t\t{}".format(op)
+
     def show(self):
         yield 'CODE'
         # name
@@ -277,11 +317,6 @@ class Code:
         if self.stacksize is not None:
             yield "stacksize: {}".format(self.stacksize)
         yield "code:"
-        inflow = process_flow(self.ops)
-        for op in self.ops:
-            if inflow[op.pos]:
-                yield "\t{}\t{}".format(op.pos, op)
-            else:
-                yield "\t\t{}".format(op)
+        yield from self.show_ops()
         if self.firstlineno is not None:
             yield "line: {} {}".format(self.firstlineno, self.lnotab)
@@ -0,0 +1,106 @@
+"""Cross-checking the deco engines.
+
+Decompiles every code object of some pyc files with both the automaton and
+the CFG engine (see envy.python.deco.cfg), and compares the raw trees they
+make.  Nested code objects are decompiled once, by the automaton, and
+shared - each code object is compared on its own.
+
+Run as:
+
+    python -m envy.python.crosscheck [-v] FILE.pyc...
+
+Prints how many code objects came out the same, how many differ, how many
+only one of the engines (or neither) could do, and how many the CFG engine
+doesn't support.  With -v, the differences are printed as diffs, along
+with the reasons the CFG engine gave up.  Exits with 1 if anything differs.
+"""
+
+import argparse
+import difflib
+import sys
+
+from envy.python.code import Code
+from envy.python.deco import cfg
+from envy.python.deco.ctx import DecoCtx
+from envy.python.deco.memo import DecoMemo, code_tree, collect
+from envy.python.helpers import PythonError
+from envy.python.session import Decompiler
+
+RESULTS = ['same', 'differ', 'cfg only', 'stack only', 'neither', 'unsupported']
+
+
+def compare(code):
+    """Decompiles a code object with both engines.  Returns (the lines of
+    the CfgCtx result, or the Unsupported raised, the lines of the DecoCtx
+    result, or the PythonError raised)."""
+    res = []
+    for ctx in cfg.CfgCtx, DecoCtx:
+        try:
+            res.append(list(ctx(code).res.block.show()))
+        except PythonError as e:
+            res.append(e)
+    return res
+
+
+def classify(cfg_res, stack_res):
+    """Returns the RESULTS item for a pair of compare results."""
+    cfg_ok = not isinstance(cfg_res, PythonError)
+    stack_ok = not isinstance(stack_res, PythonError)
+    if isinstance(cfg_res, cfg.Unsupported) and stack_ok:
+        return 'unsupported'
+    if cfg_ok and stack_ok:
+        return 'same' if cfg_res == stack_res else 'differ'
+    if cfg_ok:
+        return 'cfg only'
+    return 'stack only' if stack_ok else 'neither'
+
+
+def compare_tree(top):
+    """Compares the engines on every code object of a tree.  Returns a list
+    of (code object, RESULTS item, CfgCtx result, DecoCtx result)."""
+    res = []
+    with collect(DecoMemo()), cfg.install('stack'):
+        for code in code_tree(top):
+            cfg_res, stack_res = compare(code)
+            res.append((code, classify(cfg_res, stack_res), cfg_res, stack_res))
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decompiles every code object with both deco engines, and compares the results.")
+    parser.add_argument('-v', '--verbose', action='store_true', help="print the differences, and why the CFG engine gave up")
+    parser.add_argument('files', nargs='+', metavar='FILE.pyc')
+    args = parser.parse_args()
+    session = Decompiler()
+    counts = {name: 0 for name in RESULTS}
+    reasons = {}
+    for fname in args.files:
+        try:
+            with open(fname, 'rb') as fp:
+                pyc = session.load(fp)
+            top = Code(pyc.code, pyc.version, session.tables(pyc.version))
+        except PythonError as e:
+            print("{}: {}".format(fname, e), file=sys.stderr)
+            continue
+        for code, kind, cfg_res, stack_res in compare_tree(top):
+            counts[kind] += 1
+            if kind == 'unsupported':
+                reasons[str(cfg_res)] = reasons.get(str(cfg_res), 0) + 1
+            elif not args.verbose:
+                pass
+            elif kind == 'differ':
+                print("{}: {}: differ".format(fname, code.name))
+                for line in difflib.unified_diff(stack_res, cfg_res, 'stack', 'cfg', lineterm=''):
+                    print(line)
+            elif kind in ('stack only', 'cfg only'):
+                print("{}: {}: {}: {}".format(fname, code.name, kind, cfg_res if kind == 'stack only' else stack_res))
+    for name in RESULTS:
+        print("{}: {}".format(name, counts[name]))
+    if args.verbose:
+        for reason, count in sorted(reasons.items(), key=lambda item: (-item[1], item[0])):
+            print("  {}: {}".format(reason, count))
+    return 1 if counts['differ'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,3 @@
-TRACE = False
-
 # TODO:
 #
 # - make a nice ast metaclass
@@ -111,6 +109,32 @@ TRACE = False
 # - verify function docstrings
 
 def deco_code(code):
-    return DecoCtx(code).res
+    # a trace is supposed to show every run of the automaton
+    active = memo.ACTIVE.memo if trace.ACTIVE.tracer is None else None
+    tracker = budget.ACTIVE.tracker
+    if active is not None:
+        ready = active.pop_ready(code)
+        if ready is not None:
+            res, fallbacks = ready
+            if fallbacks and tracker is not None:
+                # so that the code objects around it aren't kept either
+                tracker.count_fallbacks(fallbacks)
+            return res
+        res = active.get(code)
+        if res is not None:
+            return res
+    with hooks.stage('deco', code.name, len(code.rawcode), code):
+        if tracker is None:
+            res = cfg.decompile(code)
+        else:
+            fallbacks = tracker.fallbacks
+            res = tracker.run(code, lambda: cfg.decompile(code))
+            # fallbacks, and code objects with fallbacks inside, aren't kept
+            if tracker.fallbacks != fallbacks:
+                active = None
+    if active is not None:
+        active.put(code, res)
+    return res
 
-from .ctx import DecoCtx
+from envy import hooks, trace
+from . import budget, cfg, memo
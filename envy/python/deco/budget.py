@@ -0,0 +1,171 @@
+"""Budgets and fallbacks for decompiling code objects.
+
+Some code objects take forever to decompile, or can't be decompiled at all,
+and normally that's the end of the whole file.  While a Tracker is
+installed as the active tracker (see collect), deco_code runs every code
+object under it instead:
+
+- the limits (see Limits) are checked as the automaton goes, and running
+  over one raises BudgetExceeded
+- if fallback is set, a code object that fails (by running over a budget, or
+  with any other PythonError) is replaced with a StmtFallback body - a
+  comment with the reason, and with its disassembly if fallback is
+  'listing'.  Postprocessing makes a stub def or class out of it, with the
+  signature from Code.args, and the rest of the module is decompiled as
+  usual.
+
+Code objects that are expressions (lambdas, comprehensions, generator
+expressions - the ones named <...>) can't be replaced by statements, their
+failures go to the code object around them.  The top-level code object of
+a streamed module isn't budgeted.
+
+The per-code limits don't count the nested code objects, those have their
+own.  Fallbacks, and code objects with fallbacks inside, aren't kept by the
+memo - another run, with other limits, may do better.
+
+The active tracker is per thread.
+"""
+
+from contextlib import contextmanager
+import threading
+import time
+
+from envy import stats
+
+from ..ast import Block
+from ..expr import DecoCode
+from ..helpers import PythonError
+from ..stmt import StmtFallback
+
+class _Active(threading.local):
+    # the active tracker, or None if code objects aren't budgeted
+    tracker = None
+
+ACTIVE = _Active()
+
+# what a failed code object is replaced with
+FALLBACKS = ['stub', 'listing']
+
+
+class BudgetExceeded(PythonError):
+    pass
+
+
+class Limits:
+    """Budgets for decompiling a file, None is unlimited:
+
+    - time: seconds of wall time per code object
+    - steps: visitor steps (automaton inputs, regurgitations included) per
+      code object
+    - nodes: nodes allocated per code object
+    - file_time: seconds of wall time per file - once they're used up, the
+      code objects that come after fail right away
+    """
+    __slots__ = 'time', 'steps', 'nodes', 'file_time'
+
+    def __init__(self, time=None, steps=None, nodes=None, file_time=None):
+        self.time = time
+        self.steps = steps
+        self.nodes = nodes
+        self.file_time = file_time
+
+
+class _Frame:
+    # a code object being decompiled
+    __slots__ = 'start', 'nodes', 'inner_time', 'inner_nodes'
+
+    def __init__(self, start, nodes):
+        self.start = start
+        self.nodes = nodes
+        self.inner_time = 0
+        self.inner_nodes = 0
+
+
+class Tracker:
+    """Budgets a single file.  limits is a Limits, fallback a FALLBACKS
+    item or None (failures are raised)."""
+    __slots__ = 'limits', 'fallback', 'start', 'frames', 'scratch', 'fallbacks'
+
+    def __init__(self, limits=None, fallback=None):
+        self.limits = limits or Limits()
+        self.fallback = fallback
+        self.start = time.perf_counter()
+        self.frames = []
+        self.fallbacks = 0
+        # counts the nodes if nobody else does
+        self.scratch = stats.Stats() if self.limits.nodes is not None else None
+
+    def _nodes(self):
+        st = stats.ACTIVE.stats
+        return st.nodes if st is not None else 0
+
+    def run(self, code, fun):
+        """Decompiles a code object by calling fun, returns the DecoCode."""
+        limits = self.limits
+        now = time.perf_counter()
+        frame = _Frame(now, self._nodes())
+        self.frames.append(frame)
+        try:
+            if limits.file_time is not None and now - self.start > limits.file_time:
+                raise BudgetExceeded("file over {} s".format(limits.file_time))
+            return fun()
+        except PythonError as e:
+            if self.fallback is None or (code.name.startswith('<') and code.name != '<module>'):
+                raise
+            self.count_fallbacks(1)
+            listing = list(code.show_ops()) if self.fallback == 'listing' else []
+            varnames = code.varnames if code.version.has_kwargs else []
+            return DecoCode(Block([StmtFallback(str(e), listing)]), code, varnames)
+        finally:
+            self.frames.pop()
+            if self.frames:
+                outer = self.frames[-1]
+                outer.inner_time += time.perf_counter() - frame.start
+                outer.inner_nodes += self._nodes() - frame.nodes
+
+    def count_fallbacks(self, count):
+        """Counts code objects that fell back, here or in a worker (see
+        deco.parallel)."""
+        self.fallbacks += count
+        st = stats.ACTIVE.stats
+        if st is not None:
+            st.fallbacks += count
+
+    def remaining(self):
+        """Returns the Limits for code objects decompiled from now on
+        elsewhere - the file budget minus the time spent so far."""
+        limits = self.limits
+        file_time = limits.file_time
+        if file_time is not None:
+            file_time = max(file_time - (time.perf_counter() - self.start), 0)
+        return Limits(limits.time, limits.steps, limits.nodes, file_time)
+
+    def check(self, ctx):
+        """Called by the automaton as it goes, raises BudgetExceeded if the
+        code object being decompiled is over budget."""
+        if not self.frames:
+            return
+        frame = self.frames[-1]
+        limits = self.limits
+        if limits.steps is not None and ctx.steps > limits.steps:
+            raise BudgetExceeded("over {} visitor steps".format(limits.steps))
+        if limits.time is not None and time.perf_counter() - frame.start - frame.inner_time > limits.time:
+            raise BudgetExceeded("over {} s".format(limits.time))
+        if limits.nodes is not None and self._nodes() - frame.nodes - frame.inner_nodes > limits.nodes:
+            raise BudgetExceeded("over {} nodes".format(limits.nodes))
+
+
+@contextmanager
+def collect(tracker):
+    """Installs tracker as the active tracker for the duration of the with
+    block.  None is allowed and disables budgeting."""
+    prev = ACTIVE.tracker
+    ACTIVE.tracker = tracker
+    try:
+        if tracker is not None and tracker.scratch is not None and stats.ACTIVE.stats is None:
+            with stats.collect(tracker.scratch):
+                yield tracker
+        else:
+            yield tracker
+    finally:
+        ACTIVE.tracker = prev
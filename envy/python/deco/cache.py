@@ -0,0 +1,169 @@
+"""Persistent cache of decompiled code objects.
+
+Vendored libraries mean the same function turns up in many pyc files that
+otherwise have nothing in common.  A CodeCache keeps the deco stage result
+of every code object in an SQLite database, keyed by the contents digest
+computed by DecoMemo, so only code objects never seen before are actually
+decompiled.  The results are stored pickled, with references to code objects
+replaced by their position in the code object tree.
+
+Keys are salted with the decompiler's own source, so a changed decompiler
+starts over with fresh entries; the stale ones are evicted eventually.  The
+database is capped in size: when it grows past max_size bytes, the least
+recently used entries are dropped.
+
+Several processes can share a database - writes are committed at the end of
+every file (see flush).
+"""
+
+from pathlib import Path
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import envy
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS codes (
+    key BLOB PRIMARY KEY,
+    data BLOB NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS codes_used ON codes (used);
+'''
+
+# bump when the stored format changes
+FORMAT = 1
+
+DEFAULT_SIZE = 256 * 1024 * 1024
+
+
+def default_path():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'envy', 'codes.sqlite')
+
+
+_salt = None
+
+def _source_salt():
+    global _salt
+    if _salt is None:
+        h = hashlib.sha256('{} {}'.format(FORMAT, sys.version_info[:2]).encode())
+        root = Path(envy.__file__).parent
+        for path in sorted(root.rglob('*.py')):
+            h.update(str(path.relative_to(root)).encode())
+            h.update(path.read_bytes())
+        _salt = h.digest()
+    return _salt
+
+
+class CodeCache:
+    """An SQLite-backed store of decompiled code objects.  Can be shared
+    between threads."""
+
+    def __init__(self, path=None, max_size=DEFAULT_SIZE):
+        if path is None:
+            path = default_path()
+        path = str(path)
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_size = max_size
+        self.salt = _source_salt()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.size = self.db.execute('SELECT COALESCE(SUM(LENGTH(data)), 0) FROM codes').fetchone()[0]
+        # keys of hits, for the used time update at flush
+        self.touched = set()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def _key(self, key):
+        return hashlib.sha256(self.salt + key).digest()
+
+    def get(self, key):
+        """Returns the stored data for a contents digest, or None."""
+        key = self._key(key)
+        with self.lock:
+            row = self.db.execute('SELECT data FROM codes WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.touched.add(key)
+            return row[0]
+
+    def put(self, key, data):
+        """Stores data for a contents digest."""
+        key = self._key(key)
+        with self.lock:
+            cur = self.db.execute(
+                'INSERT OR IGNORE INTO codes (key, data, used) VALUES (?, ?, ?)',
+                (key, data, time.time())
+            )
+            if cur.rowcount:
+                self.stores += 1
+                self.size += len(data)
+
+    def _evict(self):
+        # down to 90% of the cap, so that eviction doesn't run for every
+        # stored entry
+        target = self.max_size * 9 // 10
+        rows = self.db.execute('SELECT key, LENGTH(data) FROM codes ORDER BY used')
+        dead = []
+        for key, size in rows:
+            if self.size <= target:
+                break
+            dead.append((key,))
+            self.size -= size
+        self.db.executemany('DELETE FROM codes WHERE key = ?', dead)
+        self.evictions += len(dead)
+
+    def flush(self):
+        """Commits the stored entries and the used times of hits, and
+        enforces the size cap."""
+        with self.lock:
+            if self.touched:
+                now = time.time()
+                self.db.executemany('UPDATE codes SET used = ? WHERE key = ?', [(now, key) for key in self.touched])
+                self.touched.clear()
+            if self.size > self.max_size:
+                self._evict()
+            self.db.commit()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.db.close()
+
+    def info(self):
+        """Returns the cache statistics, as a dict."""
+        with self.lock:
+            entries = self.db.execute('SELECT COUNT(*) FROM codes').fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'path': self.path,
+            'entries': entries,
+            'size': self.size,
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'stores': self.stores,
+            'evictions': self.evictions,
+        }
+
+    def show(self):
+        info = self.info()
+        yield "code cache {}:".format(info['path'])
+        yield "\t{:<24} {}".format('entries', info['entries'])
+        yield "\t{:<24} {:.1f} of {:.1f} MB".format('size', info['size'] / 2**20, info['max_size'] / 2**20)
+        yield "\t{:<24} {} hits, {} misses ({:.1%})".format('lookups', info['hits'], info['misses'], info['hit_rate'])
+        yield "\t{:<24} {}".format('stored', info['stores'])
+        yield "\t{:<24} {}".format('evicted', info['evictions'])
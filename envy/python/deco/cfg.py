@@ -0,0 +1,619 @@
+"""Decompiling code objects by structuring their control flow graph.
+
+The automaton (see DecoCtx) treats control flow like everything else: jumps
+and flows come in as ops, and visitors match them against whatever is on
+the stack.  That covers every version, but it's greedy - the bigger and
+more nested a function, the more failed matches it goes through, and a
+single bad guess is the end of it.
+
+CfgCtx goes the other way around.  It splits the ops into basic blocks,
+computes dominators, post-dominators and the loop nest, and structures the
+regions into ifs and loops first.  Only the straight-line code inside the
+blocks goes through the visitors, with a fresh stack per block, so the cost
+stays linear in the size of the function.  The result is made of the same
+raw statements the automaton makes (StmtIfRaw, StmtIfDead, StmtLoop, ...),
+for ast_process to finish.
+
+Only the flow of POP_JUMP_IF_* bytecode (2.7, 3.1 and up) is structured,
+and only if/elif/else, while, for, break and continue.  Anything else -
+try, with, inline comprehensions, and/or and conditional expressions as
+values, unusual jumps - raises Unsupported, and deco_code falls back to the
+automaton for that code object.
+
+Which engine runs is per thread, see install:
+
+- stack: the automaton only (the default)
+- cfg: the CFG engine, the automaton for what it doesn't support
+- auto: like cfg, for code objects of at least AUTO_OPS ops
+
+A streamed module (see envy.python.session) has its top level run through
+the automaton piece by piece, so sessions don't stream with cfg or auto.
+
+envy.python.crosscheck compares the results of the engines.
+"""
+
+from contextlib import contextmanager
+import threading
+
+from envy import stats, trace
+
+from ..ast import Block
+from ..bytecode import *
+from ..expr import *
+from ..helpers import PythonError
+from ..stmt import *
+
+from .ctx import DecoCtx
+from .peephole import rewrite
+from .stack import ForLoop, ForStart, Iter, TopForLoop, TopForStart
+from . import budget
+
+class _Active(threading.local):
+    # the engine deco_code uses, an ENGINES item
+    engine = 'stack'
+
+ACTIVE = _Active()
+
+ENGINES = ['stack', 'cfg', 'auto']
+
+# the auto engine structures code objects of at least this many ops
+AUTO_OPS = 1000
+
+
+class Unsupported(PythonError):
+    pass
+
+
+@contextmanager
+def install(engine):
+    """Selects the engine for the duration of the with block."""
+    if engine not in ENGINES:
+        raise ValueError("unknown engine {}".format(engine))
+    prev = ACTIVE.engine
+    ACTIVE.engine = engine
+    try:
+        yield
+    finally:
+        ACTIVE.engine = prev
+
+
+def decompile(code):
+    """Runs the engine selected for a code object, returns the
+    DecoCode."""
+    if wanted(code):
+        try:
+            res = CfgCtx(code).res
+        except Unsupported:
+            pass
+        else:
+            st = stats.ACTIVE.stats
+            if st is not None:
+                st.structured += 1
+            return res
+    return DecoCtx(code).res
+
+
+def wanted(code):
+    """Returns True if deco_code should try CfgCtx on a code object."""
+    engine = ACTIVE.engine
+    if engine == 'stack' or not code.version.has_new_jump:
+        return False
+    # a trace is supposed to show every run of the automaton
+    if trace.ACTIVE.tracer is not None:
+        return False
+    return engine == 'cfg' or len(code.ops) >= AUTO_OPS
+
+
+# ops that end a block, and how they go on
+_COND = (OpcodePopJumpIfFalse, OpcodePopJumpIfTrue)
+_JUMP = (OpcodeJumpAbsolute, OpcodeJumpForward)
+_DEAD = (OpcodeReturnValue, OpcodeRaiseVarargs, OpcodeBreakLoop)
+_FLOW = _COND + _JUMP + (OpcodeForIter, OpcodeSetupLoop)
+
+# ops that only come with flow the engine doesn't structure
+_UNSUPPORTED = (OpcodeEndFinally, OpcodeWithCleanup, OpcodePopExcept)
+
+
+class _Block:
+    __slots__ = 'idx', 'ops', 'term', 'succs', 'preds', 'stmts', 'rest', 'dst'
+
+    def __init__(self, idx, ops, term):
+        self.idx = idx
+        # the ops for the visitors
+        self.ops = ops
+        # the flow op at the end, if any
+        self.term = term
+        self.succs = []
+        self.preds = []
+        # what the visitors made of ops: the statements, the items left
+        # on the stack, and the target of a for loop whose body starts here
+        self.stmts = None
+        self.rest = None
+        self.dst = None
+
+
+class _Cond:
+    # a condition, possibly merged from several blocks: goes to ifso if
+    # expr is true, to ifnot otherwise.  last is the last block it spans.
+    __slots__ = 'expr', 'ifso', 'ifnot', 'last'
+
+    def __init__(self, expr, ifso, ifnot, last):
+        self.expr = expr
+        self.ifso = ifso
+        self.ifnot = ifnot
+        self.last = last
+
+
+def _dominators(succs, entry):
+    """The Cooper-Harvey-Kennedy algorithm: returns the immediate dominator
+    of every node of a graph given as successor lists, None for the
+    unreachable ones (and the entry itself)."""
+    count = len(succs)
+    # iterative DFS for the postorder
+    post = [None] * count
+    order = []
+    seen = [False] * count
+    seen[entry] = True
+    todo = [(entry, iter(succs[entry]))]
+    while todo:
+        node, it = todo[-1]
+        for nxt in it:
+            if not seen[nxt]:
+                seen[nxt] = True
+                todo.append((nxt, iter(succs[nxt])))
+                break
+        else:
+            todo.pop()
+            post[node] = len(order)
+            order.append(node)
+    preds = [[] for _ in range(count)]
+    for node in order:
+        for nxt in succs[node]:
+            preds[nxt].append(node)
+    idom = [None] * count
+    idom[entry] = entry
+    rpo = order[::-1]
+    changed = True
+    while changed:
+        changed = False
+        for node in rpo[1:]:
+            new = None
+            for pred in preds[node]:
+                if idom[pred] is None:
+                    continue
+                if new is None:
+                    new = pred
+                    continue
+                a, b = pred, new
+                while a != b:
+                    while post[a] < post[b]:
+                        a = idom[a]
+                    while post[b] < post[a]:
+                        b = idom[b]
+                new = a
+            if idom[node] != new:
+                idom[node] = new
+                changed = True
+    idom[entry] = None
+    return idom
+
+
+def _assert(cond, other, body):
+    """Returns the StmtAssert an if raising AssertionError is, or None."""
+    if cond.ifso != other or len(body) != 1 or not isinstance(body[0], StmtRaise):
+        return None
+    raise_ = body[0]
+    if raise_.val is not None or raise_.tb is not None:
+        return None
+    cls = raise_.cls
+    if isinstance(cls, ExprGlobal) and cls.name == 'AssertionError':
+        return StmtAssert(cond.expr)
+    if (isinstance(cls, ExprCall)
+        and isinstance(cls.expr, ExprGlobal)
+        and cls.expr.name == 'AssertionError'
+        and len(cls.args.args) == 1
+        and isinstance(cls.args.args[0], CallArgPos)
+    ):
+        return StmtAssert(cond.expr, cls.args.args[0].expr)
+    return None
+
+
+class _DomTree:
+    """Answers dominance queries in constant time, from the DFS intervals
+    of the dominator tree."""
+    __slots__ = 'idom', 'pre', 'post'
+
+    def __init__(self, idom, entry):
+        count = len(idom)
+        children = [[] for _ in range(count)]
+        for node, parent in enumerate(idom):
+            if parent is not None:
+                children[parent].append(node)
+        self.idom = idom
+        self.pre = [None] * count
+        self.post = [None] * count
+        clock = 0
+        todo = [(entry, iter(children[entry]))]
+        self.pre[entry] = clock
+        while todo:
+            node, it = todo[-1]
+            for child in it:
+                clock += 1
+                self.pre[child] = clock
+                todo.append((child, iter(children[child])))
+                break
+            else:
+                todo.pop()
+                clock += 1
+                self.post[node] = clock
+
+    def dominates(self, a, b):
+        if self.pre[a] is None or self.pre[b] is None:
+            return False
+        return self.pre[a] <= self.pre[b] and self.post[b] <= self.post[a]
+
+
+class CfgCtx:
+    def __init__(self, code):
+        if not code.version.has_new_jump:
+            raise Unsupported("no POP_JUMP_IF")
+        self.code = code
+        # runs the visitors on the straight-line code
+        self.deco = DecoCtx(code, idle=True)
+        self.tracker = budget.ACTIVE.tracker
+        self._split(list(rewrite(code.ops, code.tables.peepholes)))
+        self._analyze()
+        self._run()
+        self._merge_conds()
+        stmts = self._seq(0, len(self.blocks), None, None)
+        self.res = DecoCode(Block(stmts), code, self.deco.varnames or [])
+
+    # the graph
+
+    def _split(self, ops):
+        at = {op.pos: idx for idx, op in enumerate(ops)}
+        leaders = {0}
+        for idx, op in enumerate(ops):
+            if isinstance(op, _UNSUPPORTED):
+                raise Unsupported("{} op".format(op.name))
+            if isinstance(op, OpcodeFlow):
+                if not isinstance(op, _FLOW):
+                    raise Unsupported("{} op".format(op.name))
+                if op.flow.dst not in at:
+                    raise Unsupported("jump out of the code")
+                leaders.add(at[op.flow.dst])
+                leaders.add(idx + 1)
+            elif isinstance(op, _DEAD):
+                leaders.add(idx + 1)
+            elif isinstance(op, OpcodePopBlock):
+                leaders.add(idx)
+                leaders.add(idx + 1)
+        leaders = sorted(x for x in leaders if x < len(ops))
+        self.blocks = blocks = []
+        # position -> block starting there
+        self.first = first = {}
+        for num, start in enumerate(leaders):
+            end = leaders[num + 1] if num + 1 < len(leaders) else len(ops)
+            last = ops[end - 1]
+            first[ops[start].pos] = num
+            if isinstance(last, (OpcodeFlow, OpcodePopBlock)):
+                blocks.append(_Block(num, ops[start:end-1], last))
+            else:
+                # dead ends make statements
+                blocks.append(_Block(num, ops[start:end], last if isinstance(last, _DEAD) else None))
+        # the edges, with the loops on a stack for BREAK_LOOP: (SETUP_LOOP
+        # block, target) pairs
+        loops = []
+        # SETUP_LOOP block -> its POP_BLOCK block
+        self.pops = {}
+        for block in blocks:
+            term = block.term
+            nxt = block.idx + 1
+            if isinstance(term, OpcodeFlow):
+                dst = first[term.flow.dst]
+            if term is None or isinstance(term, OpcodePopBlock):
+                succs = [nxt]
+                if isinstance(term, OpcodePopBlock):
+                    if not loops:
+                        raise Unsupported("POP_BLOCK outside of loop")
+                    self.pops[loops.pop()[0]] = block.idx
+            elif isinstance(term, _JUMP):
+                succs = [dst]
+            elif isinstance(term, (OpcodeForIter,) + _COND):
+                succs = [nxt, dst]
+            elif isinstance(term, OpcodeSetupLoop):
+                loops.append((block.idx, dst))
+                succs = [nxt]
+            elif isinstance(term, OpcodeBreakLoop):
+                if not loops:
+                    raise Unsupported("BREAK_LOOP outside of loop")
+                succs = [loops[-1][1]]
+            else:
+                succs = []
+            if nxt in succs and nxt == len(blocks):
+                raise Unsupported("flow off the end")
+            block.succs = succs
+            for succ in succs:
+                blocks[succ].preds.append(block.idx)
+        if loops:
+            raise Unsupported("unclosed loop")
+
+    def _analyze(self):
+        blocks = self.blocks
+        count = len(blocks)
+        succs = [block.succs for block in blocks]
+        self.dom = _DomTree(_dominators(succs, 0), 0)
+        # post-dominators: the same, on the reversed graph, with a virtual
+        # exit after every block that doesn't go anywhere
+        rsuccs = [block.preds for block in blocks]
+        rsuccs.append([block.idx for block in blocks if not block.succs])
+        self.pdom = _DomTree(_dominators(rsuccs, count), count)
+        # the loop nest: header -> blocks of the natural loop, from the back
+        # edges.  A retreating edge that's not a back edge makes the graph
+        # irreducible - no structured code compiles to that.
+        self.loops = {}
+        for block in blocks:
+            for succ in block.succs:
+                if succ > block.idx:
+                    continue
+                if not self.dom.dominates(succ, block.idx):
+                    if self.dom.pre[block.idx] is None:
+                        # dead code jumping back
+                        continue
+                    raise Unsupported("irreducible flow")
+                body = self.loops.setdefault(succ, {succ})
+                todo = [block.idx]
+                while todo:
+                    cur = todo.pop()
+                    if cur in body:
+                        continue
+                    body.add(cur)
+                    todo.extend(blocks[cur].preds)
+
+    # the straight-line code
+
+    def _run(self):
+        deco = self.deco
+        tracker = self.tracker
+        blocks = self.blocks
+        for block in blocks:
+            # the body of a for loop starts with storing the target - of a
+            # generator expression, too, if the iterable didn't go through
+            # GET_ITER
+            head = None
+            if block.idx >= 2 and isinstance(blocks[block.idx - 1].term, OpcodeForIter):
+                it = blocks[block.idx - 2].rest
+                head = ForStart(None, None) if it and isinstance(it[0], Iter) else TopForStart(None, None)
+            deco.stack = [Block([])] if head is None else [Block([]), head]
+            try:
+                for op in block.ops:
+                    deco.process(op)
+                    if tracker is not None:
+                        tracker.check(deco)
+            except budget.BudgetExceeded:
+                raise
+            except PythonError as e:
+                # likely flow the automaton would have seen whole
+                raise Unsupported(str(e))
+            stack = deco.stack
+            if head is not None:
+                if len(stack) < 3 or not isinstance(stack[1], (ForLoop, TopForLoop)) or not isinstance(stack[2], Block):
+                    raise Unsupported("weird for loop target")
+                block.dst = stack[1].dst
+                block.stmts = stack[2].stmts
+                block.rest = stack[3:]
+            else:
+                block.stmts = stack[0].stmts
+                block.rest = stack[1:]
+            want = 1 if isinstance(block.term, _COND) else 0
+            if len(block.rest) != want and not self._iter_block(block):
+                raise Unsupported("values left on the stack")
+            if want and not isinstance(block.rest[0], Expr):
+                raise Unsupported("weird condition")
+        deco.stack = [Block([])]
+
+    def _iter_block(self, block):
+        # the iterable of a for loop is left on the stack for the FOR_ITER
+        if block.idx + 1 >= len(self.blocks):
+            return False
+        nxt = self.blocks[block.idx + 1]
+        return (
+            block.term is None
+            and len(block.rest) == 1
+            and isinstance(block.rest[0], (Iter, Expr))
+            and isinstance(nxt.term, OpcodeForIter)
+            and not nxt.ops
+        )
+
+    def _merge_conds(self):
+        # the conditions, with short-circuit chains (pure condition blocks
+        # only reachable from the previous condition) merged into and/or
+        blocks = self.blocks
+        self.conds = conds = {}
+        for block in blocks:
+            if not isinstance(block.term, _COND):
+                continue
+            fall = block.idx + 1
+            dst = block.succs[1]
+            expr = block.rest[0]
+            if isinstance(block.term, OpcodePopJumpIfFalse):
+                conds[block.idx] = _Cond(expr, fall, dst, block.idx)
+            else:
+                conds[block.idx] = _Cond(expr, dst, fall, block.idx)
+        for idx in reversed(range(len(blocks))):
+            cond = conds.get(idx)
+            if cond is None:
+                continue
+            while True:
+                nxt = cond.last + 1
+                other = conds.get(nxt)
+                if other is None or blocks[nxt].stmts or blocks[nxt].preds != [cond.last]:
+                    break
+                if cond.ifso == nxt and cond.ifnot == other.ifnot:
+                    expr = ExprBoolAnd(cond.expr, other.expr)
+                elif cond.ifnot == nxt and cond.ifso == other.ifso:
+                    expr = ExprBoolOr(cond.expr, other.expr)
+                elif cond.ifso == nxt and cond.ifnot == other.ifso:
+                    expr = ExprBoolOr(ExprNot(cond.expr), other.expr)
+                elif cond.ifnot == nxt and cond.ifso == other.ifnot:
+                    expr = ExprBoolAnd(ExprNot(cond.expr), other.expr)
+                else:
+                    break
+                cond.expr = expr
+                cond.ifso = other.ifso
+                cond.ifnot = other.ifnot
+                cond.last = other.last
+                del conds[nxt]
+
+    # structuring
+
+    def _seq(self, idx, stop, exit, loop):
+        """Returns the statements of the blocks from idx up to stop.  exit
+        is the block the region goes on to (a jump there ends it), loop the
+        innermost (header, SETUP_LOOP target) pair, if any."""
+        blocks = self.blocks
+        stmts = []
+        while idx < stop:
+            block = blocks[idx]
+            stmts += block.stmts
+            term = block.term
+            if isinstance(term, OpcodeSetupLoop):
+                stmt, idx = self._loop(block, loop)
+                stmts.append(stmt)
+            elif idx in self.conds:
+                idx = self._if(idx, stop, exit, loop, stmts)
+            elif isinstance(term, _JUMP):
+                dst = block.succs[0]
+                if loop is not None and dst == loop[0]:
+                    stmts.append(StmtContinue())
+                elif dst != exit:
+                    raise Unsupported("unstructured jump")
+                elif idx + 1 != stop and not self._dead(idx + 1, stop):
+                    raise Unsupported("jump out of the middle of a region")
+                idx += 1
+            elif isinstance(term, (OpcodePopBlock, OpcodeForIter)) or isinstance(term, _COND):
+                raise Unsupported("stray {}".format(term.name))
+            else:
+                idx += 1
+        return stmts
+
+    def _dead(self, idx, stop):
+        # True if the blocks from idx to stop are unreachable jumps
+        return all(
+            self.dom.pre[block.idx] is None and not block.ops and isinstance(block.term, _JUMP)
+            for block in self.blocks[idx:stop]
+        )
+
+    def _branches(self, start):
+        # returns (condition of the then branch, then block, other block)
+        cond = self.conds[start]
+        then = cond.last + 1
+        if not self.dom.dominates(start, then):
+            raise Unsupported("then branch entered from elsewhere")
+        if cond.ifso == then:
+            return cond.expr, then, cond.ifnot
+        elif cond.ifnot == then:
+            return ExprNot(cond.expr), then, cond.ifso
+        raise Unsupported("condition jumps both ways")
+
+    def _if(self, start, stop, exit, loop, stmts):
+        """Structures an if, adds it to stmts, returns the block after it."""
+        expr, then, other = self._branches(start)
+        if loop is not None and other == loop[0]:
+            raise Unsupported("conditional continue")
+        if other == exit and other > stop:
+            # straight to where the region goes on
+            other = stop
+        if not then < other <= stop:
+            raise Unsupported("unstructured condition")
+        last = self.blocks[other - 1]
+        if isinstance(last.term, _DEAD):
+            body = self._seq(then, other, None, loop)
+            assert_ = _assert(self.conds[start], other, body)
+            if assert_ is not None:
+                stmts.append(assert_)
+            else:
+                stmts.append(self._if_dead(expr, body))
+            return other
+        if not isinstance(last.term, _JUMP):
+            raise Unsupported("then branch falls through")
+        join = last.succs[0]
+        if loop is not None and join == loop[0]:
+            # the then branch ends with a continue
+            stmts.append(self._if_dead(expr, self._seq(then, other, None, loop)))
+            return other
+        if join == other:
+            stmts.append(StmtIfRaw(expr, Block(self._seq(then, other, join, loop)), Block([])))
+            return other
+        if other < join <= stop:
+            end = join
+        elif join == exit:
+            end = stop
+        else:
+            raise Unsupported("unstructured if")
+        ipdom = self.pdom.idom[start]
+        if ipdom is not None and other < ipdom < end:
+            raise Unsupported("if joins before its end")
+        if not self.dom.dominates(start, other):
+            raise Unsupported("else branch entered from elsewhere")
+        body = self._seq(then, other, join, loop)
+        else_ = self._seq(other, end, join, loop)
+        stmts.append(StmtIfRaw(expr, Block(body), Block(else_)))
+        return end
+
+    def _if_dead(self, expr, body):
+        # with a dead then branch, "if a and b" is the same code as "if a:
+        # if b", and the automaton makes the latter
+        conds = []
+        while isinstance(expr, ExprBoolAnd):
+            conds.append(expr.e1)
+            expr = expr.e2
+        res = StmtIfDead(expr, self.deco.process_dead_end(Block(body)))
+        for cond in reversed(conds):
+            res = StmtIfDead(cond, Block([res]))
+        return res
+
+    def _loop(self, setup, outer):
+        """Structures a loop, returns the StmtLoop and the block after
+        it."""
+        blocks = self.blocks
+        end = self.first[setup.term.flow.dst]
+        pop = self.pops.get(setup.idx)
+        if pop is None or pop >= end:
+            raise Unsupported("weird loop block")
+        first = setup.idx + 1
+        if self._iter_block(blocks[first]):
+            if blocks[first].stmts:
+                raise Unsupported("junk before for")
+            header = first + 1
+            if blocks[header].succs[1] != pop:
+                raise Unsupported("for loop doesn't end at POP_BLOCK")
+            self._check_loop(header, pop)
+            body = self.deco.process_dead_end(Block(self._seq(header + 1, pop, None, (header, end))))
+            it = blocks[first].rest[0]
+            dst = blocks[header + 1].dst
+            if isinstance(it, Iter):
+                stmt = StmtForRaw(it.expr, dst, body)
+            else:
+                stmt = StmtForTop(it, dst, body)
+        elif first in self.conds and not blocks[first].stmts and self._branches(first)[2] == pop:
+            expr, then, _ = self._branches(first)
+            self._check_loop(first, pop)
+            body = self._seq(then, pop, None, (first, end))
+            stmt = StmtWhileRaw(expr, self.deco.process_dead_end(Block(body)))
+        else:
+            # while 1: with the POP_BLOCK left behind, unreachable
+            if self.dom.pre[pop] is not None:
+                raise Unsupported("weird infinite loop")
+            self._check_loop(first, pop)
+            body = self._seq(first, pop, None, (first, end))
+            stmt = StmtWhileRaw(ExprAnyTrue(), self.deco.process_dead_end(Block(body)))
+        else_ = self._seq(pop + 1, end, end, outer)
+        return StmtLoop(Block([stmt]), Block(else_)), end
+
+    def _check_loop(self, header, pop):
+        # nothing jumps into the loop, or back into it from outside
+        body = self.loops.get(header, ())
+        if any(not header <= idx < pop for idx in body):
+            raise Unsupported("loop spills out of its block")
+
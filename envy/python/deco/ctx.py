@@ -1,26 +1,55 @@
-from ..helpers import PythonError
+from envy import stats, trace
 
-from .. import deco as top
+from ..helpers import PythonError
 
 from ..stmt import *
 from ..expr import *
 from ..bytecode import *
 
-from .visitor import VISITORS
 from .stack import *
+from .peephole import rewrite
+from . import budget, order
+
+# ops whose flow is conditional
+_CONDFLOW = (
+    OpcodePopJumpIfTrue, OpcodePopJumpIfFalse,
+    OpcodeJumpIfTrueOrPop, OpcodeJumpIfFalseOrPop,
+    OpcodeJumpIfTrue, OpcodeJumpIfFalse,
+    OpcodeForLoop, OpcodeForIter, OpcodeSetupExcept,
+)
 
 class DecoCtx:
-    def __init__(self, code):
+    """The stack automaton for a code object.  Unless streaming (see run)
+    or idle, it's run right away, and the result is in res.  An idle one
+    is never run on its own - it's only there for process calls."""
+
+    def __init__(self, code, stream=False, idle=False):
         self.version = code.version
         self.stack = [Block([])]
         self.code = code
+        self.visitors = code.tables.visitors
         self.lineno = None
+        # process calls, for the budget
+        self.steps = 0
         if self.version.has_kwargs:
             self.varnames = code.varnames
         else:
             self.varnames = None
-        if top.TRACE:
-            print("START {} {}".format(code.name, code.firstlineno))
+        self.stream = stream
+        if not stream and not idle:
+            for _ in self.run():
+                pass
+
+    def run(self):
+        """Runs the automaton, sets res at the end.  A generator: when
+        streaming, whenever the stack is down to the top block, the
+        finished statements in it are taken out and yielded as a list (so
+        res ends up with an empty block).  Otherwise, it yields nothing."""
+        code = self.code
+        tr = trace.ACTIVE.tracer
+        if tr is not None:
+            tr.start(code)
+        tracker = budget.ACTIVE.tracker
         ops, inflow = self.preproc(code.ops)
         for op in ops:
             if hasattr(op, 'pos'):
@@ -34,6 +63,13 @@ class DecoCtx:
                 if rev:
                     self.process(RevFlow(rev))
             self.process(op)
+            if tracker is not None:
+                tracker.check(self)
+            if self.stream and len(self.stack) == 1 and self.stack[0].stmts:
+                top = self.stack[0]
+                stmts = top.stmts[:]
+                top.stmts.clear()
+                yield stmts
         if len(self.stack) != 1:
             raise PythonError("stack non-empty at the end: {}".format(
                 ', '.join(type(x).__name__ for x in self.stack)
@@ -41,63 +77,29 @@ class DecoCtx:
         if not isinstance(self.stack[0], Block):
             raise PythonError("weirdness on stack at the end")
         self.res = DecoCode(self.stack[0], code, self.varnames or [])
+        if tr is not None:
+            tr.end(code)
 
     def preproc(self, ops):
-        # first pass: undo jump over true const
-        if self.version.has_jump_true_const:
-            newops = []
-            fakejumps = {}
-            for idx, op in enumerate(ops):
-                op = ops[idx]
-                more = len(ops) - idx - 1
-                if (more >= 2
-                    and isinstance(op, OpcodeJumpForward)
-                    and isinstance(ops[idx+1], OpcodeJumpIfFalse)
-                    and isinstance(ops[idx+2], OpcodePopTop)
-                    and op.flow.dst == ops[idx+2].nextpos
-                ):
-                    fakejumps[op.flow.dst] = op.pos
-                    newops.append(OpcodeLoadConst(op.pos, op.nextpos, ExprAnyTrue(), None))
-                elif isinstance(op, (OpcodeJumpAbsolute, OpcodeContinueLoop)) and op.flow.dst in fakejumps:
-                    newops.append(type(op)(op.pos, op.nextpos, Flow(op.flow.src, fakejumps[op.flow.dst])))
-                else:
-                    newops.append(op)
-            ops = newops
-        # alt first pass: undo conditional jump folding for jumps with opposite polarisation
-        if self.version.has_jump_cond_fold:
-            after_jif = {}
-            after_jit = {}
-            for op in ops:
-                if isinstance(op, (OpcodeJumpIfFalse, OpcodeJumpIfFalseOrPop, OpcodePopJumpIfFalse)):
-                    after_jif[op.nextpos] = op.pos
-                elif isinstance(op, (OpcodeJumpIfTrue, OpcodeJumpIfTrueOrPop, OpcodePopJumpIfTrue)):
-                    after_jit[op.nextpos] = op.pos
-            newops = []
-            for op in ops:
-                if isinstance(op, OpcodeJumpIfFalse) and op.flow.dst in after_jit:
-                    newops.append(OpcodeJumpIfFalse(op.pos, op.nextpos, Flow(op.pos, after_jit[op.flow.dst])))
-                elif isinstance(op, OpcodePopJumpIfFalse) and op.flow.dst in after_jit:
-                    newops.append(OpcodeJumpIfFalseOrPop(op.pos, op.nextpos, Flow(op.pos, after_jit[op.flow.dst])))
-                elif isinstance(op, OpcodeJumpIfTrue) and op.flow.dst in after_jif:
-                    newops.append(OpcodeJumpIfTrue(op.pos, op.nextpos, Flow(op.pos, after_jif[op.flow.dst])))
-                elif isinstance(op, OpcodePopJumpIfTrue) and op.flow.dst in after_jif:
-                    newops.append(OpcodeJumpIfTrueOrPop(op.pos, op.nextpos, Flow(op.pos, after_jif[op.flow.dst])))
-                else:
-                    newops.append(op)
-            ops = newops
-        # second pass: figure out the kinds of absolute jumps
-        condflow = {op.nextpos: [] for op in ops}
-        for op in ops:
-            if isinstance(op, (OpcodePopJumpIfTrue, OpcodePopJumpIfFalse, OpcodeJumpIfTrueOrPop, OpcodeJumpIfFalseOrPop, OpcodeJumpIfTrue, OpcodeJumpIfFalse, OpcodeForLoop, OpcodeForIter, OpcodeSetupExcept)):
-                condflow[op.flow.dst].append(op.flow)
-        inflow = process_flow(ops)
+        # first pass: undo the peephole optimizations, collecting the
+        # conditional flows on the way
         newops = []
+        condflow = {}
+        for op in rewrite(ops, self.code.tables.peepholes):
+            newops.append(op)
+            if isinstance(op, _CONDFLOW):
+                condflow.setdefault(op.flow.dst, []).append(op.flow)
+        ops = newops
+        # second pass: figure out the kinds of absolute jumps - this one
+        # needs the whole flow graph
+        inflow = process_flow(ops)
         for idx, op in enumerate(ops):
-            next_unreachable = not condflow[op.nextpos]
+            if not isinstance(op, (OpcodeJumpAbsolute, OpcodeJumpForward)):
+                continue
+            next_unreachable = op.nextpos not in condflow
             next_end_finally = idx+1 < len(ops) and isinstance(ops[idx+1], OpcodeEndFinally)
             next_pop_top = idx+1 < len(ops) and isinstance(ops[idx+1], OpcodePopTop)
             if isinstance(op, OpcodeJumpAbsolute):
-                insert_end = False
                 is_final = op.flow == max(inflow[op.flow.dst])
                 is_backwards = op.flow.dst <= op.pos
                 if not is_backwards:
@@ -107,7 +109,6 @@ class DecoCtx:
                         op = JumpUnconditional(op.pos, op.nextpos, [op.flow])
                 elif is_final:
                     op = JumpContinue(op.pos, op.nextpos, [op.flow])
-                    insert_end = True
                 elif next_unreachable and not next_end_finally:
                     if next_pop_top:
                         op = JumpSkipJunk(op.pos, op.nextpos, [op.flow])
@@ -115,38 +116,50 @@ class DecoCtx:
                         op = JumpContinue(op.pos, op.nextpos, [op.flow])
                 else:
                     op = JumpContinue(op.pos, op.nextpos, [op.flow])
-                newops.append(op)
-            elif isinstance(op, OpcodeJumpForward):
+            else:
                 if next_unreachable and not next_end_finally:
                     op = JumpSkipJunk(op.pos, op.nextpos, [op.flow])
                 else:
                     op = JumpUnconditional(op.pos, op.nextpos, [op.flow])
-                newops.append(op)
-            else:
-                newops.append(op)
-        ops = newops
+            ops[idx] = op
         return ops, inflow
 
-    def process(self, op):
-        for t in type(op).mro():
-            for visitor in VISITORS.get(t, []):
-                try:
-                    res = visitor.visit(op, self)
-                except NoMatch:
-                    pass
-                else:
-                    for item in res:
-                        if item is None:
-                            pass
-                        elif isinstance(item, Regurgitable):
-                            self.process(item)
-                        else:
-                            self.stack.append(item)
-                    return
-        if top.TRACE:
-            for x in self.stack:
-                print(x)
-            print(op)
+    def process(self, op, depth=0):
+        self.steps += 1
+        st = stats.ACTIVE.stats
+        tr = trace.ACTIVE.tracer
+        pr = order.ACTIVE.profile
+        if pr is not None and not depth:
+            pr.input(self.version, op)
+        for visitor in self.visitors[type(op)]:
+            if tr is not None:
+                before = len(self.stack)
+            try:
+                res = visitor.apply(op, self)
+            except NoMatch:
+                if st is not None:
+                    st.attempts += 1
+                    st.nomatch += 1
+            else:
+                if st is not None:
+                    st.attempts += 1
+                    st.matches += 1
+                    if depth > st.regurgitate_depth:
+                        st.regurgitate_depth = depth
+                if pr is not None:
+                    pr.match(self.version, op, visitor)
+                if tr is not None:
+                    tr.visit(op, visitor, len(self.stack) + len(res) - before, before)
+                for item in res:
+                    if item is None:
+                        pass
+                    elif isinstance(item, Regurgitable):
+                        self.process(item, depth + 1)
+                    else:
+                        self.stack.append(item)
+                return
+        if tr is not None:
+            tr.fail(op, len(self.stack))
         raise PythonError("no visitors matched: {}, [{}]".format(
             type(op).__name__,
             ', '.join(type(x).__name__ for x in self.stack)
@@ -86,8 +86,17 @@ def _loopit(block):
     if (len(block.stmts) == 1
         and isinstance(block.stmts[0], StmtIfDead)
     ):
-        if_ = block.stmts[0]
-        return Block([StmtWhileRaw(if_.cond, if_.body)])
+        # a dead if that is all of the loop body can only jump to the loop
+        # exit, same as the loop condition - it's the rest of an and
+        conds = []
+        body = block
+        while len(body.stmts) == 1 and isinstance(body.stmts[0], StmtIfDead):
+            conds.append(body.stmts[0].cond)
+            body = body.stmts[0].body
+        cond = conds.pop()
+        while conds:
+            cond = ExprBoolAnd(conds.pop(), cond)
+        return Block([StmtWhileRaw(cond, body)])
     else:
         raise PythonError("weird while loop")
 
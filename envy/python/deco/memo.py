@@ -0,0 +1,259 @@
+"""Reuse of decompiled code objects.
+
+Modules are often full of identical code objects - repeated lambdas,
+generated methods, the same property getter over and over.  They differ only
+in line numbers, which the deco stage doesn't look at, so decompiling every
+copy is wasted work.  While a DecoMemo is installed as the active memo (see
+collect), deco_code looks every code object up by its contents first, and
+reuses the block decompiled for an earlier copy.
+
+The returned DecoCode always refers to the code object it was asked for.
+Nested code objects of the copies may differ in line numbers, in which case
+the reused block is rewritten to refer to the right ones.
+
+A memo can be backed by a persistent CodeCache (see deco.cache), shared by
+all files: code objects not seen in the current file are looked up there,
+and newly decompiled ones are stored.  The contents key is a stable digest
+for that reason.
+
+The active memo is per thread.
+"""
+
+from contextlib import contextmanager
+import hashlib
+import io
+import pickle
+import threading
+
+from envy import stats
+from envy.meta import Node
+
+from ..code import Code, CodeDict
+from ..expr import DecoCode
+from ..version import PycVersion
+
+class _Active(threading.local):
+    # the active memo, or None if decompiled code isn't reused
+    memo = None
+
+ACTIVE = _Active()
+
+# code attributes that don't affect decompilation (ops are derived from the
+# rest)
+_SKIP = {'filename', 'firstlineno', 'lnotab', 'ops', 'tables'}
+
+_KEY_SLOTS = [slot for slot in Code.__slots__ if slot not in _SKIP]
+
+
+def _line_info(code):
+    return code.filename, code.firstlineno, code.lnotab
+
+
+def _same(old, new):
+    if isinstance(old, dict):
+        return all(new[k] is v for k, v in old.items())
+    if isinstance(old, (list, tuple)):
+        return all(a is b for a, b in zip(old, new))
+    return old is new
+
+
+def _relink(node, remap):
+    """Returns node with the nested DecoCodes of remap (id of code -> code)
+    pointing to their new code objects.  Only the paths leading to them are
+    rebuilt, everything else stays shared."""
+    vals = []
+    changed = False
+    for field in node._fields:
+        val = getattr(node, field.name)
+        new = field.subprocess(val, lambda sub: _relink(sub, remap))
+        if not _same(val, new):
+            changed = True
+        vals.append(new)
+    if isinstance(node, DecoCode) and id(node.code) in remap:
+        return DecoCode(vals[0], remap[id(node.code)], node.varnames)
+    if not changed:
+        return node
+    return type(node)(*vals)
+
+
+def _nested(code):
+    """Yields all nested code objects, in preorder."""
+    for const in code.consts:
+        if isinstance(const, Code):
+            yield const
+            yield from _nested(const)
+
+
+def _nested_pairs(old, new):
+    """Yields pairs of corresponding nested code objects of two copies."""
+    return zip(_nested(old), _nested(new))
+
+
+def code_tree(code):
+    """Returns a code object and all its nested code objects, in preorder.
+    The positions are used to refer to code objects in pickled results."""
+    return [code] + list(_nested(code))
+
+
+def dumps(res, codes, start=0):
+    """Pickles a DecoCode, replacing references to codes (a code_tree list)
+    with their positions, counted from start."""
+    index = {id(code): start + idx for idx, code in enumerate(codes)}
+    buf = io.BytesIO()
+    pickler = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = lambda obj: index[id(obj)] if isinstance(obj, Code) else None
+    pickler.dump(res)
+    return buf.getvalue()
+
+
+def loads(data, codes):
+    """Reverses dumps."""
+    unpickler = pickle.Unpickler(io.BytesIO(data))
+    unpickler.persistent_load = lambda pid: codes[pid]
+    return unpickler.load()
+
+
+class DecoMemo:
+    """Decompiled code objects by contents, normally kept for the duration
+    of a single file.  store is an optional CodeCache, engine the deco
+    engine (see cfg) that makes the results - the keys of engines other than
+    the automaton are kept apart."""
+    __slots__ = 'results', 'keys', 'store', 'ready', 'engine'
+
+    def __init__(self, store=None, engine='stack'):
+        self.store = store
+        self.engine = engine
+        self.results = {}
+        # id of code -> (code, result, fallbacks) of add
+        self.ready = {}
+        # id of code -> (code, key)
+        self.keys = {}
+
+    def _value_key(self, val):
+        # the repr of the result is hashed, so it has to be the same in
+        # every run
+        if val is None or isinstance(val, (str, bytes, int, bool)):
+            return type(val), val
+        if isinstance(val, float):
+            return float, repr(val)
+        if isinstance(val, (list, tuple)):
+            return tuple([self._value_key(x) for x in val])
+        if isinstance(val, (set, frozenset)):
+            return tuple(sorted([self._value_key(x) for x in val], key=repr))
+        if isinstance(val, dict):
+            return tuple([(k, self._value_key(v)) for k, v in val.items()])
+        if isinstance(val, Code):
+            return Code, self.key(val)
+        if isinstance(val, CodeDict):
+            return CodeDict, tuple(val.names)
+        if isinstance(val, Node):
+            return (type(val),) + tuple([
+                self._value_key(getattr(val, field.name))
+                for field in val._fields
+            ])
+        if isinstance(val, PycVersion):
+            return PycVersion, val.name
+        return type(val), val
+
+    def key(self, code):
+        """Returns the contents key of a code object, a digest that only
+        depends on what's in the code object."""
+        try:
+            return self.keys[id(code)][1]
+        except KeyError:
+            pass
+        res = tuple([self._value_key(getattr(code, slot, None)) for slot in _KEY_SLOTS])
+        if self.engine != 'stack':
+            res = self.engine, res
+        res = hashlib.sha256(repr(res).encode('utf-8')).digest()
+        # keeps code alive, so that the id stays valid
+        self.keys[id(code)] = code, res
+        return res
+
+    def _load(self, code, key):
+        data = self.store.get(key)
+        if data is None:
+            return None
+        try:
+            res = loads(data, code_tree(code))
+        except Exception:
+            # stale or damaged, will be replaced
+            return None
+        if not isinstance(res, DecoCode) or res.code is not code:
+            return None
+        return res
+
+    def get(self, code):
+        """Returns the DecoCode for code if an identical code object has
+        been decompiled before, or None.  See pop_ready for the results of
+        add."""
+        key = self.key(code)
+        st = stats.ACTIVE.stats
+        try:
+            prev = self.results[key]
+        except KeyError:
+            if self.store is None:
+                return None
+            res = self._load(code, key)
+            if st is not None:
+                if res is None:
+                    st.cache_misses += 1
+                else:
+                    st.cache_hits += 1
+            if res is not None:
+                self.results[key] = res
+            return res
+        if st is not None:
+            st.reused += 1
+        if prev.code is code:
+            return prev
+        remap = {
+            id(a): b
+            for a, b in _nested_pairs(prev.code, code)
+            if _line_info(a) != _line_info(b)
+        }
+        block = prev.block
+        if remap:
+            block = _relink(block, remap)
+        return DecoCode(block, code, prev.varnames)
+
+    def put(self, code, res):
+        key = self.key(code)
+        if key not in self.results:
+            self.results[key] = res
+            if self.store is not None:
+                try:
+                    data = dumps(res, code_tree(code))
+                except RecursionError:
+                    # nested deeper than pickle goes, only kept for this
+                    # file
+                    return
+                self.store.put(key, data)
+
+    def add(self, code, res, fallbacks=0):
+        """Adds a result computed elsewhere (see deco.parallel), to be
+        returned by pop_ready.  fallbacks is how many code objects in it
+        fell back (see budget) - such results aren't kept for reuse."""
+        self.ready[id(code)] = code, res, fallbacks
+        if not fallbacks:
+            self.put(code, res)
+
+    def pop_ready(self, code):
+        """Returns (result, fallbacks) of add for code, or None."""
+        try:
+            _, res, fallbacks = self.ready.pop(id(code))
+        except KeyError:
+            return None
+        return res, fallbacks
+
+
+@contextmanager
+def collect(memo):
+    """Installs memo as the active memo for the duration of the with block.
+    None is allowed and disables reuse."""
+    prev = ACTIVE.memo
+    ACTIVE.memo = memo
+    try:
+        yield memo
+    finally:
+        ACTIVE.memo = prev
@@ -0,0 +1,193 @@
+"""Ordering the visitors by a corpus profile.
+
+The visitors of an opcode class are tried in registration order, and the
+first one that matches wins - so the common cases can sit behind a long list
+of rare ones, each raising NoMatch first.  While a VisitorProfile is
+installed as the active profile (see collect), DecoCtx.process counts, per
+version:
+
+- the automaton inputs, by opcode class (regurgitated items aren't inputs)
+- the matches, by opcode class and visitor
+
+A saved profile can be given to a session (see VersionTables), and the
+visitors are then tried most matched first - as far as that can't change
+which one matches.  Two visitors can only swap places if their stack
+patterns (the classes their SimpleWants want, from the top of the stack
+down) are exclusive somewhere: then, whenever one of them matches, the
+other one fails in its wants, before its function gets to run.  Everything
+else keeps its registration order, so the result is the same with any
+profile.  Ties are broken by registration order, so the order is
+deterministic.
+
+Profiles are JSON, keyed by version, opcode class and visitor names -
+visitors renamed or moved since the profile was made count as never
+matched.  python -m envy.python.census makes and reports them.
+
+The active profile is per thread.
+"""
+
+from contextlib import contextmanager
+import functools
+import json
+import threading
+
+from .want import SimpleWant, WantIfOp
+
+class _Active(threading.local):
+    # the active profile, or None if nothing is counted
+    profile = None
+
+ACTIVE = _Active()
+
+
+class VisitorProfile:
+    """Automaton inputs and visitor matches, per version name: inputs maps
+    opcode class names to counts, matches opcode class names to visitor
+    names to counts."""
+    __slots__ = 'inputs', 'matches'
+
+    def __init__(self, inputs=None, matches=None):
+        self.inputs = inputs or {}
+        self.matches = matches or {}
+
+    def input(self, version, op):
+        counts = self.inputs.setdefault(version.name, {})
+        name = type(op).__name__
+        counts[name] = counts.get(name, 0) + 1
+
+    def match(self, version, op, visitor):
+        counts = self.matches.setdefault(version.name, {}).setdefault(type(op).__name__, {})
+        counts[visitor.name] = counts.get(visitor.name, 0) + 1
+
+    def merge(self, other):
+        """Adds the counts of other to this profile."""
+        for version, counts in other.inputs.items():
+            mine = self.inputs.setdefault(version, {})
+            for name, count in counts.items():
+                mine[name] = mine.get(name, 0) + count
+        for version, classes in other.matches.items():
+            for cls, counts in classes.items():
+                mine = self.matches.setdefault(version, {}).setdefault(cls, {})
+                for name, count in counts.items():
+                    mine[name] = mine.get(name, 0) + count
+
+    def as_dict(self):
+        return {'inputs': self.inputs, 'matches': self.matches}
+
+    def save(self, fname):
+        with open(fname, 'w') as fp:
+            json.dump(self.as_dict(), fp, indent=1, sort_keys=True)
+
+    @classmethod
+    def load(cls, fname):
+        with open(fname) as fp:
+            data = json.load(fp)
+        return cls(data.get('inputs'), data.get('matches'))
+
+    def order(self, version, cls, visitors):
+        """Returns the visitors of an opcode class (in registration order,
+        as resolved for version) in the order to try them."""
+        counts = self.matches.get(version.name, {}).get(cls.__name__)
+        if not counts or len(visitors) < 2:
+            return visitors
+        patterns = [_pattern(visitor, cls) for visitor in visitors]
+        # the earlier visitors that have to stay in front of each one
+        after = [
+            {prev for prev in range(idx) if not _exclusive(patterns[prev], patterns[idx])}
+            for idx in range(len(visitors))
+        ]
+        placed = set()
+        res = []
+        while len(res) < len(visitors):
+            best = min(
+                (idx for idx in range(len(visitors)) if idx not in placed and after[idx] <= placed),
+                key=lambda idx: (-counts.get(visitors[idx].name, 0), idx),
+            )
+            placed.add(best)
+            res.append(visitors[best])
+        return res
+
+    def show(self, top=10):
+        """Yields a report of the most common inputs, visitors and visitor
+        modules (the constructs) of every version."""
+        for version in sorted(set(self.inputs) | set(self.matches)):
+            inputs = self.inputs.get(version, {})
+            total = sum(inputs.values()) or 1
+            yield "{}: {} inputs".format(version, total)
+            yield "\tinputs:"
+            for name, count in _top(inputs, top):
+                yield "\t\t{:<28} {:10} {:6.1%}".format(name, count, count / total)
+            visitors = {}
+            modules = {}
+            for counts in self.matches.get(version, {}).values():
+                for name, count in counts.items():
+                    visitors[name] = visitors.get(name, 0) + count
+                    module = name.partition('.')[0]
+                    modules[module] = modules.get(module, 0) + count
+            matched = sum(visitors.values()) or 1
+            yield "\tconstructs:"
+            for name, count in _top(modules, top):
+                yield "\t\t{:<28} {:10} {:6.1%}".format(name, count, count / matched)
+            yield "\tvisitors:"
+            for name, count in _top(visitors, top):
+                yield "\t\t{:<40} {:10} {:6.1%}".format(name, count, count / matched)
+
+
+def _top(counts, top):
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:top]
+
+
+def _pattern(visitor, cls):
+    """Returns the classes a visitor wants from the top of the stack down, as
+    tuples, as far as it wants single items of known classes."""
+    res = []
+    for want in visitor.wanted:
+        if isinstance(want, WantIfOp):
+            if not issubclass(cls, want.op):
+                # wants nothing for this opcode
+                continue
+            want = want.want
+        if not isinstance(want, SimpleWant):
+            break
+        res.append(_classes(want.cls))
+    return res
+
+
+def _classes(spec):
+    if isinstance(spec, tuple):
+        return tuple(cls for item in spec for cls in _classes(item))
+    return spec,
+
+
+def _exclusive(first, second):
+    """Returns True if no stack can match both patterns."""
+    return any(
+        not any(_overlap(a, b) for a in x for b in y)
+        for x, y in zip(first, second)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _overlap(a, b):
+    # could some object be an instance of both classes
+    if issubclass(a, b) or issubclass(b, a):
+        return True
+    todo = type.__subclasses__(a)
+    while todo:
+        sub = todo.pop()
+        if issubclass(sub, b):
+            return True
+        todo.extend(type.__subclasses__(sub))
+    return False
+
+
+@contextmanager
+def collect(profile):
+    """Installs profile as the active profile for the duration of the with
+    block.  None is allowed and disables counting."""
+    prev = ACTIVE.profile
+    ACTIVE.profile = profile
+    try:
+        yield profile
+    finally:
+        ACTIVE.profile = prev
@@ -0,0 +1,162 @@
+"""Decompiling the nested code objects of a module in parallel.
+
+The deco stage runs nested code objects inline, when the parent's automaton
+gets to the MAKE_FUNCTION, so a huge module is decompiled on a single core.
+precompute splits the code object tree into independent subtrees instead,
+and decompiles them in a process pool ahead of time.  The results are added
+to the active DecoMemo, where the parent's deco_code calls pick them up.
+
+Code objects can't be sent to other processes (they refer to the version
+tables), so every worker loads the pyc file from its contents, builds the
+code objects it was given, and refers to code objects by their position in
+the preorder code_tree list - the same way the code cache stores them.
+
+If a budget tracker is active, the workers run under one with the same
+limits and fallback (and what's left of the file budget), so a pathological
+code object doesn't stall its worker either.  Results with fallbacks are
+used, but not kept for reuse.  A code object that fails to decompile in a
+worker is simply left out, to be decompiled (and fail, with the proper
+traceback) in the parent.
+"""
+
+import io
+
+from envy import stats
+from envy.format.marshal import MarshalCode
+
+from ..code import Code
+from . import budget, cfg, memo
+
+# pycs with less bytecode in nested code objects than this aren't worth it
+MIN_SIZE = 32768
+
+# how many units to aim for, per job
+UNITS_PER_JOB = 4
+
+_session = None
+_last = None
+
+
+def _subtree_sizes(codes):
+    """Returns id of code -> bytecode size of the code and its nested code
+    objects."""
+    res = {}
+    for code in reversed(codes):
+        res[id(code)] = len(code.rawcode) + sum(
+            res[id(const)]
+            for const in code.consts
+            if isinstance(const, Code)
+        )
+    return res
+
+
+def split(top, jobs):
+    """Picks the code objects to decompile in parallel: none of them nested
+    in another, with the big ones split into their nested code objects, so
+    there are enough units to go around.  Returns a list of (size, code),
+    or an empty list if it's not worth it."""
+    codes = memo.code_tree(top)
+    sizes = _subtree_sizes(codes)
+    total = sizes[id(top)] - len(top.rawcode)
+    if total < MIN_SIZE:
+        return []
+    target = total // (jobs * UNITS_PER_JOB)
+    units = []
+    todo = [top]
+    while todo:
+        code = todo.pop()
+        nested = [const for const in code.consts if isinstance(const, Code)]
+        if code is top or (sizes[id(code)] > target and nested):
+            # decompiled by the parent, with the nested ones from the pool
+            todo.extend(nested)
+        else:
+            units.append((sizes[id(code)], code))
+    return units
+
+
+def _batches(units, num):
+    """Spreads units over num batches of similar total size, biggest
+    first."""
+    batches = [[0, []] for _ in range(num)]
+    for size, code in sorted(units, key=lambda unit: -unit[0]):
+        batch = min(batches, key=lambda batch: batch[0])
+        batch[0] += size
+        batch[1].append(code)
+    return [codes for size, codes in batches if codes]
+
+
+def _marshal_tree(obj):
+    """Like code_tree, for marshal code objects."""
+    res = [obj]
+    for const in obj.consts:
+        if isinstance(const, MarshalCode):
+            res += _marshal_tree(const)
+    return res
+
+
+def _load(data):
+    """Returns the marshal code_tree and version of a pyc file.  Workers
+    get several batches of the same file in a row, so the last one is
+    kept."""
+    global _session, _last
+    if _session is None:
+        from ..session import Decompiler
+        # the parent has checked the version and the trailing junk already
+        _session = Decompiler(strict=False)
+    if _last is None or _last[0] != data:
+        pyc = _session.load(io.BytesIO(data))
+        _last = data, _marshal_tree(pyc.code), pyc.version
+    return _last[1], _last[2]
+
+
+def _work(data, idxs, engine, budgets):
+    """Runs in a worker: decompiles the code objects at the given code_tree
+    positions of a pyc file, with the given engine, and the given
+    (Limits, fallback) budgets if not None.  Returns a list of (position,
+    pickled DecoCode, fallbacks)."""
+    from . import deco_code
+    objs, version = _load(data)
+    tables = _session.tables(version)
+    tracker = budget.Tracker(*budgets) if budgets is not None else None
+    res = []
+    with memo.collect(memo.DecoMemo(engine=engine)), cfg.install(engine), budget.collect(tracker):
+        for idx in idxs:
+            fallbacks = tracker.fallbacks if tracker is not None else 0
+            try:
+                code = Code(objs[idx], version, tables)
+                deco = deco_code(code)
+                # fails on trees nested deeper than the recursion limit
+                pickled = memo.dumps(deco, memo.code_tree(code), idx)
+            except Exception:
+                # redone in the parent
+                continue
+            if tracker is not None:
+                fallbacks = tracker.fallbacks - fallbacks
+            res.append((idx, pickled, fallbacks))
+    return res
+
+
+def precompute(top, data, pool, jobs, engine='stack'):
+    """Decompiles the nested code objects of top (loaded from pyc contents
+    data) on pool, with the given engine (see cfg) and the budgets of the
+    active tracker, and adds the results to the active memo."""
+    active = memo.ACTIVE.memo
+    units = split(top, jobs)
+    if active is None or not units:
+        return
+    tracker = budget.ACTIVE.tracker
+    budgets = (tracker.remaining(), tracker.fallback) if tracker is not None else None
+    codes = memo.code_tree(top)
+    index = {id(code): idx for idx, code in enumerate(codes)}
+    futures = [
+        pool.submit(_work, data, [index[id(code)] for code in batch], engine, budgets)
+        for batch in _batches(units, jobs * 2)
+    ]
+    done = 0
+    for future in futures:
+        for idx, res, fallbacks in future.result():
+            active.add(codes[idx], memo.loads(res, codes), fallbacks)
+            done += 1
+    st = stats.ACTIVE.stats
+    if st is not None:
+        st.parallel += done
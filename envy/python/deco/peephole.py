@@ -0,0 +1,133 @@
+"""Undoing CPython's peephole optimizations, before the automaton runs.
+
+The optimizer rewrites some jump sequences into ones the visitors don't
+expect.  Each reversal is a pattern: a window of opcode classes starting at
+the op to rewrite, a version flag, and a function that gets a Peephole and
+the ops of the window, and returns the replacement op - or None, if the
+window doesn't apply after all.
+
+rewrite runs all the patterns of a version over the ops in a single forward
+pass.  A pattern only replaces the first op of its window (the rest gets its
+own turn), and the first pattern that returns something wins.  Patterns are
+looked up by the class of the first op (see VersionTables), so ops no
+pattern starts with cost a dict lookup.
+"""
+
+from ..bytecode import *
+from ..expr import ExprAnyTrue
+from ..version import compile_flags
+
+# opcode class -> list of _Pattern, in registration order
+PEEPHOLES = {}
+
+
+class _Pattern:
+    __slots__ = 'func', 'window', 'flag'
+
+    def __init__(self, func, window, flag):
+        self.func = func
+        self.window = window
+        self.flag = flag
+
+
+def peephole(*window, flag=None):
+    """Registers a pattern.  The items of window are opcode classes, or
+    tuples of them."""
+    def inner(func):
+        pat = _Pattern(func, window[1:], compile_flags(flag))
+        first = window[0] if isinstance(window[0], tuple) else (window[0],)
+        for cls in first:
+            PEEPHOLES.setdefault(cls, []).append(pat)
+        return func
+    return inner
+
+
+class Peephole:
+    """The state of a rewrite pass."""
+    __slots__ = 'ops', '_ending', 'fakejumps'
+
+    def __init__(self, ops):
+        self.ops = ops
+        self._ending = None
+        # jump over true const targets -> the const position
+        self.fakejumps = {}
+
+    def ending(self, pos):
+        """Returns the input op that ends at pos (the one before the op at
+        pos), or None."""
+        if self._ending is None:
+            self._ending = {op.nextpos: op for op in self.ops}
+        return self._ending.get(pos)
+
+
+def rewrite(ops, patterns):
+    """Yields ops with the patterns (opcode class -> list of _Pattern, for
+    the right version) applied."""
+    peep = Peephole(ops)
+    count = len(ops)
+    for idx, op in enumerate(ops):
+        for pat in patterns[type(op)]:
+            end = idx + 1 + len(pat.window)
+            if end > count:
+                continue
+            window = ops[idx:end]
+            if not all(isinstance(wop, cls) for wop, cls in zip(window[1:], pat.window)):
+                continue
+            new = pat.func(peep, *window)
+            if new is not None:
+                op = new
+                break
+        yield op
+
+
+# if 1: and while 1: compile to a jump over the test of the const (2.3 and
+# the first 2.4 alpha)
+
+@peephole(OpcodeJumpForward, OpcodeJumpIfFalse, OpcodePopTop, flag='has_jump_true_const')
+def _true_const(peep, jump, cond, pop):
+    if jump.flow.dst != pop.nextpos:
+        return None
+    peep.fakejumps[jump.flow.dst] = jump.pos
+    return OpcodeLoadConst(jump.pos, jump.nextpos, ExprAnyTrue(), None)
+
+@peephole((OpcodeJumpAbsolute, OpcodeContinueLoop), flag='has_jump_true_const')
+def _true_const_loop(peep, op):
+    dst = peep.fakejumps.get(op.flow.dst)
+    if dst is None:
+        return None
+    return type(op)(op.pos, op.nextpos, Flow(op.flow.src, dst))
+
+
+# a conditional jump to a conditional jump of opposite polarity is folded to
+# jump right past it
+
+_JIF = (OpcodeJumpIfFalse, OpcodeJumpIfFalseOrPop, OpcodePopJumpIfFalse)
+_JIT = (OpcodeJumpIfTrue, OpcodeJumpIfTrueOrPop, OpcodePopJumpIfTrue)
+
+@peephole(OpcodeJumpIfFalse, flag='has_jump_cond_fold')
+def _cond_fold_jif(peep, op):
+    prev = peep.ending(op.flow.dst)
+    if not isinstance(prev, _JIT):
+        return None
+    return OpcodeJumpIfFalse(op.pos, op.nextpos, Flow(op.pos, prev.pos))
+
+@peephole(OpcodePopJumpIfFalse, flag='has_jump_cond_fold')
+def _cond_fold_pop_jif(peep, op):
+    prev = peep.ending(op.flow.dst)
+    if not isinstance(prev, _JIT):
+        return None
+    return OpcodeJumpIfFalseOrPop(op.pos, op.nextpos, Flow(op.pos, prev.pos))
+
+@peephole(OpcodeJumpIfTrue, flag='has_jump_cond_fold')
+def _cond_fold_jit(peep, op):
+    prev = peep.ending(op.flow.dst)
+    if not isinstance(prev, _JIF):
+        return None
+    return OpcodeJumpIfTrue(op.pos, op.nextpos, Flow(op.pos, prev.pos))
+
+@peephole(OpcodePopJumpIfTrue, flag='has_jump_cond_fold')
+def _cond_fold_pop_jit(peep, op):
+    prev = peep.ending(op.flow.dst)
+    if not isinstance(prev, _JIF):
+        return None
+    return OpcodeJumpIfTrueOrPop(op.pos, op.nextpos, Flow(op.pos, prev.pos))
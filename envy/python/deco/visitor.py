@@ -1,8 +1,10 @@
-import inspect
+import importlib
+import itertools
+import threading
 
 from ..stmt import *
+from ..version import join_flags
 
-from .. import deco as top
 from .want import *
 from .stack import *
 
@@ -10,58 +12,119 @@ from .stack import *
 
 VISITORS = {}
 
+# The visitor modules, in registration order.  The flag is what a version
+# needs for the module to be of any use - its visitors are only registered
+# for such versions (see load_visitors), and they're additionally guarded
+# by the flag.  A module can only have a flag if nothing else produces the
+# stack items its visitors consume.
+MODULES = [
+    ('inplace', None),
+    ('lsd', None),
+    ('token', None),
+    ('expr', None),
+    ('stmt', None),
+    ('cmp', None),
+    ('with_', 'has_with'), # CLEAN
+    ('import_', None), # CLEAN
+    ('comp', None),
+    ('finally_', None),
+    ('def_', None), # CLEAN
+    ('class_', None), # CLEAN
+    ('unpack', None),
+    ('flow', None), # XXX deps
+    ('raise_', None), # XXX deps
+    ('if_', None), # XXX deps
+    ('loop', None), # XXX deps
+    ('for_', None), # XXX deps
+    ('except_', None), # XXX deps
+]
+
+_MODULE_IDX = {name: idx for idx, (name, _) in enumerate(MODULES)}
+_MODULE_FLAG = dict(MODULES)
+_loaded = set()
+
+# registration counter - lists in VISITORS are kept ordered by (module
+# index, counter), so that the order doesn't depend on which modules got
+# loaded first
+_counter = itertools.count()
+
+# registration can happen in one thread while another resolves visitors
+# for an already loaded version, so the lists in VISITORS are never
+# changed in place - a new sorted list is swapped in under the lock, and
+# readers see either the old or the new one
+_lock = threading.Lock()
+
+def load_visitors(version=None):
+    """Imports the visitor modules needed for a version (or all of them, if
+    version is None)."""
+    for name, flag in MODULES:
+        if name not in _loaded and (version is None or version.match(flag)):
+            importlib.import_module('.' + name, __package__)
+            _loaded.add(name)
+
+
+def _visitor_name(func):
+    return '{}.{}:{}'.format(
+        func.__module__.rpartition('.')[2],
+        func.__name__,
+        func.__code__.co_firstlineno,
+    )
+
 class _Visitor:
-    __slots__ = 'func', 'wanted', 'flag'
+    __slots__ = 'func', 'wanted', 'flag', 'name', 'order'
 
-    def __init__(self, func, wanted, flag=None):
+    def __init__(self, func, wanted, flag=None, name=None, module=None):
         self.func = func
+        self.name = name or _visitor_name(func)
         self.wanted = [
             x if isinstance(x, Wantable) else SimpleWant(x)
             for x in reversed(wanted)
         ]
-        self.flag = flag
+        module = module or func.__module__.rpartition('.')[2]
+        self.flag = join_flags(_MODULE_FLAG.get(module), flag)
+        self.order = _MODULE_IDX.get(module, len(MODULES)), next(_counter)
 
     def visit(self, opcode, deco):
         if not deco.version.match(self.flag):
             raise NoMatch
+        return self.apply(opcode, deco)
+
+    def apply(self, opcode, deco):
+        """Like visit, for visitors already known to match the version."""
         pos = len(deco.stack)
         prev = []
         for idx, want in enumerate(self.wanted):
             cur, pos = want.get(deco.stack, pos, opcode, prev, self.wanted[idx+1:])
             prev.append(cur)
         newstack = self.func(deco, opcode, *reversed(prev))
-        if top.TRACE:
-            print("\tVISIT {} [{} -> {}] {}".format(
-                ', '.join(type(x).__name__ for x in deco.stack[:pos]),
-                ', '.join(type(x).__name__ for x in deco.stack[pos:]),
-                ', '.join(type(x).__name__ for x in newstack),
-                type(opcode).__name__
-            ))
         del deco.stack[pos:]
         return newstack
 
-def register_visitor(func, op, stack, flag):
+def register_visitor(func, op, stack, flag, name=None, module=None):
     if not isinstance(op, tuple):
         op = op,
-    vis = _Visitor(func, stack, flag)
-    for op in op:
-        VISITORS.setdefault(op, []).append(vis)
+    vis = _Visitor(func, stack, flag, name, module)
+    with _lock:
+        for op in op:
+            VISITORS[op] = sorted(VISITORS.get(op, []) + [vis], key=lambda x: x.order)
+
+def _signature(func):
+    """Returns (self flag, op annotation, stack annotations) of a visitor
+    function - straight from the code object, since inspect is too slow
+    for this."""
+    code = func.__code__
+    aself, aop, *astack = code.co_varnames[:code.co_argcount]
+    ann = func.__annotations__
+    return ann.get(aself), ann[aop], [ann[x] for x in astack]
 
 def visitor(func):
-    asp = inspect.getfullargspec(func)
-    aself, aop, *astack = asp.args
-    flag = asp.annotations.get(aself)
-    stack = [asp.annotations[x] for x in astack]
-    op = asp.annotations[aop]
+    flag, op, stack = _signature(func)
     register_visitor(func, op, stack, flag)
     return func
 
 def lsd_visitor(func):
-    asp = inspect.getfullargspec(func)
-    aself, aop, *astack = asp.args
-    flag = asp.annotations.get(aself)
-    stack = [asp.annotations[x] for x in astack]
-    lop, sop, dop = asp.annotations[aop]
+    flag, ops, stack = _signature(func)
+    lop, sop, dop = ops
 
     def visit_lsd_load(self, op, *args):
         dst = func(self, op, *args)
@@ -75,28 +138,9 @@ def lsd_visitor(func):
         dst = func(self, op, *args)
         return [StmtDel(dst)]
 
-    register_visitor(visit_lsd_load, lop, stack, flag)
-    register_visitor(visit_lsd_store, sop, stack, flag)
-    register_visitor(visit_lsd_delete, dop, stack, flag)
+    name = _visitor_name(func)
+    module = func.__module__.rpartition('.')[2]
+    register_visitor(visit_lsd_load, lop, stack, flag, name + '/load', module)
+    register_visitor(visit_lsd_store, sop, stack, flag, name + '/store', module)
+    register_visitor(visit_lsd_delete, dop, stack, flag, name + '/delete', module)
     return func
-
-
-from .inplace import *
-from .lsd import *
-from .token import *
-from .expr import *
-from .stmt import *
-from .cmp import *
-from .with_ import * # CLEAN
-from .import_ import * # CLEAN
-from .comp import *
-from .finally_ import *
-from .def_ import * # CLEAN
-from .class_ import * # CLEAN
-from .unpack import *
-from .flow import * # XXX deps
-from .raise_ import * # XXX deps
-from .if_ import * # XXX deps
-from .loop import * # XXX deps
-from .for_ import * # XXX deps
-from .except_ import * # XXX deps
@@ -0,0 +1,594 @@
+"""Machine-readable output of the final tree.
+
+The show generators print source, which downstream tools then have to parse
+again - slowly, and only if their parser still knows the syntax of the
+decompiled Python version.  This module skips the text:
+
+- write_json / json_lines stream the tree as JSON, one line per top-level
+  statement (or a single line for an eval root).  The chunks are written
+  out while walking the tree, no string is built for a subtree.
+- to_ast converts the tree to a module of the standard ast module, for
+  everything that has a modern Python syntax.
+
+The JSON form is lossless.  Every node is an object with its class name in
+"_type" and its fields under their own names.  Field values that JSON can't
+represent directly are wrapped:
+
+- bytes: {"_bytes": str}, with the bytes decoded as latin-1
+- non-finite floats: {"_float": "inf" | "-inf" | "nan"}
+- complex numbers: {"_complex": [real, imag]}
+- enums: their name
+- code objects (in unprocessed leftovers): {"_code": name, "line": firstlineno}
+
+Nodes don't keep line numbers, apart from the line fields of function and
+class definitions (the firstlineno of their code objects) and code objects
+themselves.
+
+to_ast raises Unrepresentable for anything without an ast counterpart - 2.x
+statements like print and exec, backquotes, the decompiler's own $ pseudo
+nodes - and for trees too deep to convert recursively (ast.parse doesn't
+take them either).  Names come out as plain ast.Name nodes, whether they're fast,
+global, or cell variables.  Definitions are placed at their line, where
+the version has line numbers, and everything else at the line of the
+definition it's in, or at line 1.
+"""
+
+import ast
+from enum import Enum
+from json.encoder import encode_basestring_ascii
+import math
+
+from .helpers import PythonError
+from .ast import *
+from .code import Code
+from .expr import *
+from .stmt import *
+from .postproc import RootExec, RootEval
+
+
+# JSON
+
+def _float_chunk(val):
+    if math.isfinite(val):
+        return repr(val)
+    return '{{"_float": "{}"}}'.format(val)
+
+
+class _Chunk(str):
+    # output that's already JSON, on the _emit stack
+    __slots__ = ()
+
+
+def _emit(val, out):
+    """Writes val as JSON, in chunks, by calling out."""
+    # iterative, so that long operator chains don't run out of stack: the
+    # parts of a container are pushed in reverse, chunks between the values
+    todo = [val]
+    while todo:
+        val = todo.pop()
+        if isinstance(val, _Chunk):
+            out(val)
+        elif isinstance(val, Node):
+            out('{"_type": ')
+            out(encode_basestring_ascii(type(val).__name__))
+            parts = []
+            for field in val._fields:
+                parts.append(_Chunk(', {}: '.format(encode_basestring_ascii(field.name))))
+                parts.append(getattr(val, field.name))
+            parts.append(_Chunk('}'))
+            todo += reversed(parts)
+        elif val is None:
+            out('null')
+        elif val is True:
+            out('true')
+        elif val is False:
+            out('false')
+        elif isinstance(val, str):
+            out(encode_basestring_ascii(val))
+        elif isinstance(val, Enum):
+            out(encode_basestring_ascii(val.name))
+        elif isinstance(val, int):
+            out(str(val))
+        elif isinstance(val, float):
+            out(_float_chunk(val))
+        elif isinstance(val, (list, tuple)):
+            out('[')
+            parts = []
+            for idx, item in enumerate(val):
+                if idx:
+                    parts.append(_Chunk(', '))
+                parts.append(item)
+            parts.append(_Chunk(']'))
+            todo += reversed(parts)
+        elif isinstance(val, dict):
+            out('{')
+            parts = []
+            for idx, (key, item) in enumerate(val.items()):
+                parts.append(_Chunk('{}{}: '.format(', ' if idx else '', encode_basestring_ascii(key))))
+                parts.append(item)
+            parts.append(_Chunk('}'))
+            todo += reversed(parts)
+        elif isinstance(val, bytes):
+            out('{"_bytes": ')
+            out(encode_basestring_ascii(val.decode('latin-1')))
+            out('}')
+        elif isinstance(val, complex):
+            out('{{"_complex": [{}, {}]}}'.format(_float_chunk(val.real), _float_chunk(val.imag)))
+        elif isinstance(val, Code):
+            out('{"_code": ')
+            out(encode_basestring_ascii(val.name))
+            out(', "line": ')
+            out('null' if val.firstlineno is None else str(val.firstlineno))
+            out('}')
+        else:
+            raise PythonError("can't export {} to JSON".format(type(val).__name__))
+
+
+def _top_nodes(root):
+    if isinstance(root, RootExec):
+        return root.block.stmts
+    if isinstance(root, RootEval):
+        return [root.expr]
+    raise PythonError("not a root: {}".format(type(root).__name__))
+
+
+def write_json(root, fp):
+    """Writes the JSON lines for a RootExec or RootEval to a text file
+    object, as they're produced."""
+    for node in _top_nodes(root):
+        _emit(node, fp.write)
+        fp.write('\n')
+
+
+def json_lines(root):
+    """Yields the JSON lines for a root, without the newlines, one
+    top-level statement at a time."""
+    for node in _top_nodes(root):
+        chunks = []
+        _emit(node, chunks.append)
+        yield ''.join(chunks)
+
+
+# ast
+
+class Unrepresentable(PythonError):
+    pass
+
+
+# node class -> function converting it to an ast node, taking the node and
+# the ast context (ast.Load, ast.Store, ast.Del instance) for expressions
+_CONVERTERS = {}
+
+def _converter(*classes):
+    def inner(fun):
+        for cls in classes:
+            _CONVERTERS[cls] = fun
+        return fun
+    return inner
+
+
+_LOAD = ast.Load()
+_STORE = ast.Store()
+_DEL = ast.Del()
+
+
+def _expr(node, ctx=_LOAD):
+    try:
+        fun = _CONVERTERS[type(node)]
+    except KeyError:
+        raise Unrepresentable("no ast for {}".format(type(node).__name__)) from None
+    return fun(node, ctx)
+
+
+def _opt(node, ctx=_LOAD):
+    return None if node is None else _expr(node, ctx)
+
+
+def _stmt(node):
+    try:
+        fun = _CONVERTERS[type(node)]
+    except KeyError:
+        raise Unrepresentable("no ast for {}".format(type(node).__name__)) from None
+    return fun(node, None)
+
+
+def _body(block):
+    res = [_stmt(stmt) for stmt in block.stmts]
+    if not res:
+        return [ast.Pass()]
+    return res
+
+
+def _orelse(block):
+    return [] if block is None else _body(block)
+
+
+def _name(node):
+    """Returns the name of a simple variable node."""
+    if not isinstance(node, (ExprName, ExprGlobal, ExprFast, ExprDeref)):
+        raise Unrepresentable("{} is not a simple name".format(type(node).__name__))
+    return node.name
+
+
+# expressions
+
+@_converter(ExprNone)
+def _none(node, ctx):
+    return ast.Constant(None)
+
+@_converter(ExprEllipsis)
+def _ellipsis(node, ctx):
+    return ast.Constant(...)
+
+@_converter(ExprBool, ExprInt, ExprLong, ExprFloat, ExprComplex, ExprString, ExprUnicode)
+def _const(node, ctx):
+    return ast.Constant(node.val)
+
+@_converter(ExprTuple)
+def _tuple(node, ctx):
+    return ast.Tuple([_expr(expr, ctx) for expr in node.exprs], ctx)
+
+@_converter(ExprList)
+def _list(node, ctx):
+    return ast.List([_expr(expr, ctx) for expr in node.exprs], ctx)
+
+@_converter(ExprSet, Frozenset)
+def _set(node, ctx):
+    return ast.Set([_expr(expr) for expr in node.exprs])
+
+@_converter(ExprDict)
+def _dict(node, ctx):
+    return ast.Dict([_expr(item.key) for item in node.items], [_expr(item.val) for item in node.items])
+
+@_converter(ExprUnpackEx)
+def _unpack_ex(node, ctx):
+    return ast.Tuple(
+        [_expr(expr, ctx) for expr in node.before] +
+        [ast.Starred(_expr(node.star, ctx), ctx)] +
+        [_expr(expr, ctx) for expr in node.after],
+        ctx
+    )
+
+
+def _comprehensions(items):
+    res = []
+    for item in items:
+        if isinstance(item, CompFor):
+            res.append(ast.comprehension(_expr(item.dst, _STORE), _expr(item.expr), [], 0))
+        elif res:
+            res[-1].ifs.append(_expr(item.expr))
+        else:
+            raise Unrepresentable("comprehension starts with if")
+    return res
+
+@_converter(ExprListComp)
+def _listcomp(node, ctx):
+    return ast.ListComp(_expr(node.comp.expr), _comprehensions(node.comp.items))
+
+@_converter(ExprSetComp)
+def _setcomp(node, ctx):
+    return ast.SetComp(_expr(node.comp.expr), _comprehensions(node.comp.items))
+
+@_converter(ExprGenExp)
+def _genexp(node, ctx):
+    return ast.GeneratorExp(_expr(node.comp.expr), _comprehensions(node.comp.items))
+
+@_converter(ExprDictComp)
+def _dictcomp(node, ctx):
+    return ast.DictComp(_expr(node.key), _expr(node.val), _comprehensions(node.items))
+
+
+_UNARY_OPS = {
+    ExprPos: ast.UAdd,
+    ExprNeg: ast.USub,
+    ExprNot: ast.Not,
+    ExprInvert: ast.Invert,
+}
+
+@_converter(*_UNARY_OPS)
+def _unary(node, ctx):
+    return ast.UnaryOp(_UNARY_OPS[type(node)](), _expr(node.e1))
+
+@_converter(ExprYield)
+def _yield(node, ctx):
+    return ast.Yield(_expr(node.e1))
+
+@_converter(ExprYieldFrom)
+def _yield_from(node, ctx):
+    return ast.YieldFrom(_expr(node.e1))
+
+
+_BINARY_OPS = {
+    ExprPow: ast.Pow,
+    ExprMul: ast.Mult,
+    ExprDiv: ast.Div,
+    ExprMod: ast.Mod,
+    ExprAdd: ast.Add,
+    ExprSub: ast.Sub,
+    ExprShl: ast.LShift,
+    ExprShr: ast.RShift,
+    ExprAnd: ast.BitAnd,
+    ExprOr: ast.BitOr,
+    ExprXor: ast.BitXor,
+    ExprTrueDiv: ast.Div,
+    ExprFloorDiv: ast.FloorDiv,
+    ExprMatMul: ast.MatMult,
+}
+
+@_converter(*_BINARY_OPS)
+def _binary(node, ctx):
+    return ast.BinOp(_expr(node.e1), _BINARY_OPS[type(node)](), _expr(node.e2))
+
+@_converter(ExprBoolAnd)
+def _bool_and(node, ctx):
+    return ast.BoolOp(ast.And(), [_expr(node.e1), _expr(node.e2)])
+
+@_converter(ExprBoolOr)
+def _bool_or(node, ctx):
+    return ast.BoolOp(ast.Or(), [_expr(node.e1), _expr(node.e2)])
+
+@_converter(ExprIf)
+def _if_expr(node, ctx):
+    return ast.IfExp(_expr(node.cond), _expr(node.true), _expr(node.false))
+
+
+_COMPARE_OPS = {
+    CmpOp.LT: ast.Lt,
+    CmpOp.LE: ast.LtE,
+    CmpOp.EQ: ast.Eq,
+    CmpOp.NE: ast.NotEq,
+    CmpOp.GT: ast.Gt,
+    CmpOp.GE: ast.GtE,
+    CmpOp.IN: ast.In,
+    CmpOp.NOT_IN: ast.NotIn,
+    CmpOp.IS: ast.Is,
+    CmpOp.IS_NOT: ast.IsNot,
+}
+
+@_converter(ExprCmp)
+def _compare(node, ctx):
+    ops = []
+    for item in node.rest:
+        try:
+            ops.append(_COMPARE_OPS[item.op]())
+        except KeyError:
+            raise Unrepresentable("no ast for compare op {}".format(item.op.name)) from None
+    return ast.Compare(_expr(node.first), ops, [_expr(item.expr) for item in node.rest])
+
+@_converter(ExprAttr)
+def _attr(node, ctx):
+    return ast.Attribute(_expr(node.expr), node.name, ctx)
+
+@_converter(ExprSubscr)
+def _subscr(node, ctx):
+    return ast.Subscript(_expr(node.e1), _expr(node.e2), ctx)
+
+@_converter(ExprSlice2)
+def _slice2(node, ctx):
+    return ast.Slice(_opt(node.start), _opt(node.end), None)
+
+@_converter(ExprSlice3)
+def _slice3(node, ctx):
+    return ast.Slice(_opt(node.start), _opt(node.end), _opt(node.step))
+
+
+def _call_args(args):
+    """Returns (args, keywords) for a CallArgs."""
+    pos = []
+    keywords = []
+    for arg in args.args:
+        if isinstance(arg, CallArgPos):
+            pos.append(_expr(arg.expr))
+        elif isinstance(arg, CallArgVar):
+            pos.append(ast.Starred(_expr(arg.expr), _LOAD))
+        elif isinstance(arg, CallArgKw):
+            keywords.append(ast.keyword(arg.name, _expr(arg.expr)))
+        elif isinstance(arg, CallArgVarKw):
+            keywords.append(ast.keyword(None, _expr(arg.expr)))
+    return pos, keywords
+
+@_converter(ExprCall)
+def _call(node, ctx):
+    return ast.Call(_expr(node.expr), *_call_args(node.args))
+
+# plain names before 3.x (None before 2.4)
+_CONSTANT_NAMES = {'None': None, 'True': True, 'False': False}
+
+@_converter(ExprName, ExprGlobal, ExprFast, ExprDeref)
+def _name_expr(node, ctx):
+    if node.name in _CONSTANT_NAMES:
+        if ctx is not _LOAD:
+            raise Unrepresentable("assignment to {}".format(node.name))
+        return ast.Constant(_CONSTANT_NAMES[node.name])
+    return ast.Name(node.name, ctx)
+
+
+def _arguments(args):
+    def _arg(node):
+        return ast.arg(_name(node), _opt(args.ann.get(node.name)))
+    defaults = [_expr(expr) for expr in args.defargs]
+    kwonly = [_arg(arg) for arg in args.kwargs]
+    kw_defaults = [_opt(args.defkwargs.get(arg.arg)) for arg in kwonly]
+    return ast.arguments(
+        [],
+        [_arg(arg) for arg in args.args],
+        None if args.vararg is None else _arg(args.vararg),
+        kwonly,
+        kw_defaults,
+        None if args.varkw is None else _arg(args.varkw),
+        defaults,
+    )
+
+@_converter(ExprLambda)
+def _lambda(node, ctx):
+    return ast.Lambda(_arguments(node.args), _expr(node.expr))
+
+
+# statements
+
+@_converter(StmtReturn)
+def _return(node, ctx):
+    return ast.Return(_expr(node.val))
+
+@_converter(StmtSingle)
+def _single(node, ctx):
+    return ast.Expr(_expr(node.val))
+
+@_converter(StmtAssign)
+def _assign(node, ctx):
+    return ast.Assign([_expr(dest, _STORE) for dest in node.dests], _expr(node.expr))
+
+
+_INPLACE_OPS = {
+    StmtInplaceAdd: ast.Add,
+    StmtInplaceSubtract: ast.Sub,
+    StmtInplaceMultiply: ast.Mult,
+    StmtInplaceDivide: ast.Div,
+    StmtInplaceModulo: ast.Mod,
+    StmtInplacePower: ast.Pow,
+    StmtInplaceLshift: ast.LShift,
+    StmtInplaceRshift: ast.RShift,
+    StmtInplaceAnd: ast.BitAnd,
+    StmtInplaceOr: ast.BitOr,
+    StmtInplaceXor: ast.BitXor,
+    StmtInplaceTrueDivide: ast.Div,
+    StmtInplaceFloorDivide: ast.FloorDiv,
+    StmtInplaceMatrixMultiply: ast.MatMult,
+}
+
+@_converter(*_INPLACE_OPS)
+def _inplace(node, ctx):
+    return ast.AugAssign(_expr(node.dest, _STORE), _INPLACE_OPS[type(node)](), _expr(node.src))
+
+@_converter(StmtDel)
+def _del(node, ctx):
+    return ast.Delete([_expr(node.val, _DEL)])
+
+@_converter(StmtRaise)
+def _raise(node, ctx):
+    if node.val is not None:
+        raise Unrepresentable("raise with a value")
+    return ast.Raise(_opt(node.cls), _opt(node.tb))
+
+@_converter(StmtAssert)
+def _assert(node, ctx):
+    return ast.Assert(_expr(node.expr), _opt(node.msg))
+
+@_converter(StmtImport)
+def _import(node, ctx):
+    dst = _name(node.as_)
+    parts = node.name.split('.')
+    if not node.attrs and dst == parts[0]:
+        alias = ast.alias(node.name, None)
+    elif list(node.attrs) == parts[1:]:
+        alias = ast.alias(node.name, dst)
+    else:
+        raise Unrepresentable("import of a different attribute")
+    return ast.Import([alias])
+
+@_converter(StmtFromImport)
+def _from_import(node, ctx):
+    aliases = []
+    for item in node.items:
+        dst = item.name if item.expr is None else _name(item.expr)
+        aliases.append(ast.alias(item.name, None if dst == item.name else dst))
+    return ast.ImportFrom(node.name, aliases, max(node.level, 0))
+
+@_converter(StmtImportStar)
+def _import_star(node, ctx):
+    return ast.ImportFrom(node.name, [ast.alias('*', None)], max(node.level, 0))
+
+@_converter(StmtIf)
+def _if(node, ctx):
+    orelse = _orelse(node.else_)
+    for item in reversed(node.items):
+        res = ast.If(_expr(item.cond), _body(item.body), orelse)
+        orelse = [res]
+    return res
+
+@_converter(StmtWhile)
+def _while(node, ctx):
+    return ast.While(_expr(node.expr), _body(node.body), _orelse(node.else_))
+
+@_converter(StmtFor)
+def _for(node, ctx):
+    return ast.For(_expr(node.dst, _STORE), _expr(node.expr), _body(node.body), _orelse(node.else_))
+
+@_converter(StmtFinally)
+def _finally(node, ctx):
+    return ast.Try(_body(node.try_), [], [], _body(node.finally_))
+
+@_converter(StmtExcept)
+def _except(node, ctx):
+    handlers = [
+        ast.ExceptHandler(
+            _expr(item.expr),
+            None if item.dst is None else _name(item.dst),
+            _body(item.body)
+        )
+        for item in node.items
+    ]
+    if node.any is not None:
+        handlers.append(ast.ExceptHandler(None, None, _body(node.any)))
+    return ast.Try(_body(node.try_), handlers, _orelse(node.else_), [])
+
+@_converter(StmtBreak)
+def _break(node, ctx):
+    return ast.Break()
+
+@_converter(StmtContinue)
+def _continue(node, ctx):
+    return ast.Continue()
+
+@_converter(StmtFallback)
+def _fallback(node, ctx):
+    # the comment has nowhere to go
+    return ast.Pass()
+
+def _located(res, line):
+    # fix_missing_locations passes the location on to the children
+    if line is not None:
+        res.lineno = res.end_lineno = line
+        res.col_offset = res.end_col_offset = 0
+    return res
+
+@_converter(StmtClass)
+def _class(node, ctx):
+    bases, keywords = _call_args(node.args)
+    return _located(ast.ClassDef(node.name, bases, keywords, _body(node.body), [_expr(deco) for deco in node.deco]), node.line)
+
+@_converter(StmtDef)
+def _def(node, ctx):
+    return _located(ast.FunctionDef(
+        node.name,
+        _arguments(node.args),
+        _body(node.body),
+        [_expr(deco) for deco in node.deco],
+        _opt(node.args.ann.get('return')),
+    ), node.line)
+
+@_converter(StmtWith)
+def _with(node, ctx):
+    return ast.With([ast.withitem(_expr(node.expr), _opt(node.dst, _STORE))], _body(node.body))
+
+
+def ast_stmts(root):
+    """Yields the converted top-level statements of a RootExec one by one,
+    with only the locations of the definitions filled in."""
+    for stmt in root.block.stmts:
+        yield _stmt(stmt)
+
+
+def to_ast(root):
+    """Converts a RootExec to an ast.Module, or a RootEval to an
+    ast.Expression."""
+    try:
+        if isinstance(root, RootEval):
+            res = ast.Expression(_expr(root.expr))
+        elif isinstance(root, RootExec):
+            res = ast.Module(list(ast_stmts(root)), [])
+        else:
+            raise PythonError("not a root: {}".format(type(root).__name__))
+        return ast.fix_missing_locations(res)
+    except RecursionError:
+        raise Unrepresentable("too deeply nested") from None
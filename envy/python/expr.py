@@ -1,5 +1,6 @@
 from enum import IntEnum
 
+from envy import intern
 from envy.format.marshal import (
     MarshalNone,
     MarshalBool,
@@ -15,6 +16,10 @@ from envy.format.marshal import (
 )
 
 from .helpers import PythonError
+from .printer import (
+    ALWAYS, OR, AND, NOT, CMP, BOR, BXOR, BAND, SHIFT, ARITH, TERM, UNARY,
+    POWER, NUMBER, PRIMARY, join, render,
+)
 
 from .ast import *
 
@@ -44,31 +49,40 @@ COMPARE_OPS = {
     CmpOp.IS_NOT: 'is not',
 }
 
-class CompItem(Node, abstract=True):
-    pass
+class CompItem(Node, abstract=True, intern=True):
+    prec = PRIMARY
+    paren = False
 
 class CompFor(CompItem):
     dst = Field(Expr)
     expr = Field(Expr)
 
+    def parts(self):
+        return ['for ', self.dst, ' in ', (self.expr, OR)]
+
     def show(self):
-        return 'for {} in {}'.format(self.dst.show(None), self.expr.show(None))
+        return render(self)
 
 class CompIf(CompItem):
     expr = Field(Expr)
 
+    def parts(self):
+        return ['if ', (self.expr, OR)]
+
     def show(self):
-        return 'if {}'.format(self.expr.show(None))
+        return render(self)
 
-class Comp(Node):
+class Comp(Node, intern=True):
     expr = Field(Expr)
     items = ListField(CompItem)
+    prec = PRIMARY
+    paren = False
+
+    def parts(self):
+        return [self.expr, ' '] + join(self.items, ' ')
 
     def show(self):
-        return '{} {}'.format(
-            self.expr.show(None),
-            ' '.join(item.show() for item in self.items)
-        )
+        return render(self)
 
 
 # TODO: print unicode/byte strings as appropriate for the python version
@@ -80,20 +94,20 @@ class Comp(Node):
 # singletons
 
 class ExprNone(Expr):
-    def show(self, ctx):
+    def parts(self):
         return 'None'
 
 
 class ExprEllipsis(Expr):
-    def show(self, ctx):
+    def parts(self):
         return "..."
 
 class ExprBuildClass(Expr):
-    def show(self, ctx):
+    def parts(self):
         return '$buildclass'
 
 class ExprAnyTrue(Expr):
-    def show(self, ctx):
+    def parts(self):
         return '$true'
 
 # literals
@@ -102,42 +116,62 @@ class ExprAnyTrue(Expr):
 class ExprBool(Expr):
     val = Field(bool)
 
-    def show(self, ctx):
+    def parts(self):
         return str(self.val)
 
 
 class ExprInt(Expr):
     val = Field(int)
 
-    def show(self, ctx):
+    @property
+    def prec(self):
+        return UNARY if self.val < 0 else NUMBER
+
+    def parts(self):
         return str(self.val)
 
 
 class ExprLong(Expr):
     val = Field(int)
 
-    def show(self, ctx):
+    @property
+    def prec(self):
+        return UNARY if self.val < 0 else PRIMARY
+
+    def parts(self):
         return str(self.val) + 'L'
 
 
 class ExprFloat(Expr):
     val = Field(float)
 
-    def show(self, ctx):
+    @property
+    def prec(self):
+        return UNARY if str(self.val).startswith('-') else NUMBER
+
+    def parts(self):
         return str(self.val)
 
 
 class ExprComplex(Expr):
     val = Field(complex)
 
-    def show(self, ctx):
+    @property
+    def prec(self):
+        # complex numbers with a real part print in parentheses
+        text = str(self.val)
+        if text.startswith('('):
+            return PRIMARY
+        return UNARY if text.startswith('-') else NUMBER
+
+    def parts(self):
         return str(self.val)
 
 
 class ExprString(Expr):
     val = Field(bytes)
 
-    def show(self, ctx):
+    def parts(self):
         # XXX
         return repr(self.val)
 
@@ -145,7 +179,7 @@ class ExprString(Expr):
 class ExprUnicode(Expr):
     val = Field(str)
 
-    def show(self, ctx):
+    def parts(self):
         # XXX
         return repr(self.val)
 
@@ -155,46 +189,43 @@ class ExprUnicode(Expr):
 class ExprTuple(Expr):
     exprs = ListField(Expr, volatile=True)
 
-    def show(self, ctx):
+    def parts(self):
         # XXX
-        return '({}{})'.format(
-            ', '.join(v.show(ctx) for v in self.exprs),
-            ',' if len(self.exprs) == 1 else ''
-        )
+        res = ['('] + join(self.exprs, ', ')
+        if len(self.exprs) == 1:
+            res.append(',')
+        res.append(')')
+        return res
 
 
 class ExprList(Expr):
     exprs = ListField(Expr, volatile=True)
 
-    def show(self, ctx):
+    def parts(self):
         # XXX
-        return '[{}]'.format(
-            ', '.join(v.show(ctx) for v in self.exprs),
-        )
+        return ['['] + join(self.exprs, ', ') + [']']
 
 
 class ExprSet(Expr):
     exprs = ListField(Expr, volatile=True)
 
-    def show(self, ctx):
+    def parts(self):
         # XXX
-        return '{{{}}}'.format(
-            ', '.join(v.show(ctx) for v in self.exprs),
-        )
+        return ['{'] + join(self.exprs, ', ') + ['}']
 
 
 class ExprListComp(Expr):
     comp = Field(Comp)
 
-    def show(self, ctx):
-        return '[{}]'.format(self.comp.show())
+    def parts(self):
+        return ['[', self.comp, ']']
 
 
 class ExprSetComp(Expr):
     comp = Field(Comp)
 
-    def show(self, ctx):
-        return '{{{}}}'.format(self.comp.show())
+    def parts(self):
+        return ['{', self.comp, '}']
 
 
 class ExprDictComp(Expr):
@@ -202,39 +233,43 @@ class ExprDictComp(Expr):
     val = Field(Expr)
     items = ListField(CompItem)
 
-    def show(self, ctx):
-        return '{{{}: {} {}}}'.format(
-            self.key.show(None),
-            self.val.show(None),
-            ' '.join(item.show() for item in self.items)
-        )
+    def parts(self):
+        return ['{', self.key, ': ', self.val, ' '] + join(self.items, ' ') + ['}']
 
 
 class ExprGenExp(Expr):
     comp = Field(Comp)
 
-    def show(self, ctx):
-        return '({})'.format(self.comp.show())
+    def parts(self):
+        return ['(', self.comp, ')']
 
 
-class DictItem(Node):
+class DictItem(Node, intern=True):
     key = Field(Expr)
     val = Field(Expr)
+    prec = PRIMARY
+    paren = False
+
+    def parts(self):
+        return [self.key, ': ', self.val]
 
     def show(self):
-        return '{}: {}'.format(self.key.show(None), self.val.show(None))
+        return render(self)
 
 
 class ExprDict(Expr):
     items = ListField(DictItem, volatile=True)
 
-    def show(self, ctx):
-        return '{{{}}}'.format(
-            ', '.join(
-                item.show()
-                for item in self.items
-            ),
-        )
+    def parts(self):
+        # items are spliced in rather than written as subnodes, it's
+        # cheaper
+        res = ['{']
+        for item in self.items:
+            res += [item.key, ': ', item.val, ', ']
+        if self.items:
+            res.pop()
+        res.append('}')
+        return res
 
 
 class ExprUnpackEx(Expr):
@@ -242,26 +277,29 @@ class ExprUnpackEx(Expr):
     star = Field(Expr, volatile=True, optional=True)
     after = ListField(Expr, volatile=True)
 
-    def show(self, ctx):
+    def parts(self):
         if not self.before and not self.after:
-            return '(*{},)'.format(self.star.show(None))
-        return '({})'.format(
-            ', '.join(
-                [expr.show(None) for expr in self.before] +
-                ['*' + self.star.show(None)] +
-                [expr.show(None) for expr in self.after]
-            )
-        )
+            return ['(*', self.star, ',)']
+        res = ['(']
+        for expr in self.before:
+            res += [expr, ', ']
+        res += ['*', self.star]
+        for expr in self.after:
+            res += [', ', expr]
+        res.append(')')
+        return res
 
 
 # unary
 
 class ExprUn(Expr, abstract=True):
     e1 = Field(Expr)
+    # XXX
+    paren = True
+    prec = UNARY
 
-    def show(self, ctx):
-        # XXX
-        return '({}{})'.format(self.sign, self.e1.show(ctx))
+    def parts(self):
+        return [self.sign, (self.e1, self.prec)]
 
 
 class ExprPos(ExprUn):
@@ -274,12 +312,15 @@ class ExprNeg(ExprUn):
 
 class ExprNot(ExprUn):
     sign = 'not '
+    prec = NOT
 
 
 class ExprRepr(ExprUn):
-    def show(self, ctx):
+    prec = PRIMARY
+
+    def parts(self):
         # XXX
-        return '(`{}`)'.format(self.e1.show(ctx))
+        return ['`', self.e1, '`']
 
 
 class ExprInvert(ExprUn):
@@ -288,10 +329,18 @@ class ExprInvert(ExprUn):
 
 class ExprYield(ExprUn):
     sign = 'yield '
+    prec = ALWAYS
+
+    def parts(self):
+        return [self.sign, self.e1]
 
 
 class ExprYieldFrom(ExprUn):
     sign = 'yield from '
+    prec = ALWAYS
+
+    def parts(self):
+        return [self.sign, self.e1]
 
 
 # binary
@@ -299,87 +348,117 @@ class ExprYieldFrom(ExprUn):
 class ExprBin(Expr, abstract=True):
     e1 = Field(Expr)
     e2 = Field(Expr)
+    # XXX
+    paren = True
 
-    def show(self, ctx):
-        # XXX
-        return '({} {} {})'.format(self.e1.show(ctx), self.sign, self.e2.show(ctx))
+    def parts(self):
+        # left-associative
+        return [(self.e1, self.prec), ' ' + self.sign + ' ', (self.e2, self.prec + 1)]
 
 
 class ExprPow(ExprBin):
     sign = '**'
+    prec = POWER
+
+    def parts(self):
+        # right-associative, and binds less tightly than a unary operator
+        # on its right
+        return [(self.e1, NUMBER), ' ' + self.sign + ' ', (self.e2, UNARY)]
 
 
 class ExprMul(ExprBin):
     sign = '*'
+    prec = TERM
 
 
 class ExprDiv(ExprBin):
     sign = '/'
+    prec = TERM
 
 
 class ExprMod(ExprBin):
     sign = '%'
+    prec = TERM
 
 
 class ExprAdd(ExprBin):
     sign = '+'
+    prec = ARITH
 
 
 class ExprSub(ExprBin):
     sign = '-'
+    prec = ARITH
 
 
 class ExprShl(ExprBin):
     sign = '<<'
+    prec = SHIFT
 
 
 class ExprShr(ExprBin):
     sign = '>>'
+    prec = SHIFT
 
 
 class ExprAnd(ExprBin):
     sign = '&'
+    prec = BAND
 
 
 class ExprOr(ExprBin):
     sign = '|'
+    prec = BOR
 
 
 class ExprXor(ExprBin):
     sign = '^'
+    prec = BXOR
 
 
 class ExprBoolAnd(ExprBin):
     sign = 'and'
+    prec = AND
+
+    def parts(self):
+        # associative, and the chains come out right-nested - b and d and e
+        # is b and (d and e)
+        return [(self.e1, self.prec), ' and ', (self.e2, self.prec)]
 
 
 class ExprBoolOr(ExprBin):
     sign = 'or'
+    prec = OR
+
+    def parts(self):
+        # like and
+        return [(self.e1, self.prec), ' or ', (self.e2, self.prec)]
 
 
 class ExprTrueDiv(ExprBin):
     sign = '$/'
+    prec = TERM
 
 
 class ExprFloorDiv(ExprBin):
     sign = '//'
+    prec = TERM
 
 
 class ExprMatMul(ExprBin):
     sign = '@'
+    prec = TERM
 
 
 class ExprIf(Expr):
     cond = Field(Expr)
     true = Field(Expr)
     false = Field(Expr)
+    paren = True
+    prec = ALWAYS
 
-    def show(self, ctx):
-        return '({} if {} else {})'.format(
-            self.true.show(None),
-            self.cond.show(None),
-            self.false.show(None),
-        )
+    def parts(self):
+        return [(self.true, OR), ' if ', (self.cond, OR), ' else ', self.false]
 
 
 # compares
@@ -391,12 +470,14 @@ class CmpItem(Node):
 class ExprCmp(Expr):
     first = Field(Expr)
     rest = ListField(CmpItem)
+    paren = True
+    prec = CMP
 
-    def show(self, ctx):
-        return '({} {})'.format(self.first.show(ctx), ' '.join(
-            '{} {}'.format(COMPARE_OPS[item.op], item.expr.show(ctx))
-            for item in self.rest
-        ))
+    def parts(self):
+        res = [(self.first, BOR)]
+        for item in self.rest:
+            res += [' ', COMPARE_OPS[item.op], ' ', (item.expr, BOR)]
+        return res
 
 
 # attributes, indexing
@@ -405,26 +486,24 @@ class ExprAttr(Expr):
     expr = Field(Expr)
     name = Field(str)
 
-    def show(self, ctx):
-        return '({}).{}'.format(self.expr.show(ctx), self.name)
+    def parts(self):
+        return [(self.expr, PRIMARY, True), '.', self.name]
 
 
 class ExprSubscr(Expr):
     e1 = Field(Expr)
     e2 = Field(Expr)
 
-    def show(self, ctx):
-        return '{}[{}]'.format(self.e1.show(ctx), self.e2.show(ctx))
+    def parts(self):
+        return [(self.e1, PRIMARY), '[', self.e2, ']']
 
 
 class ExprSlice2(Expr):
     start = Field(Expr, optional=True)
     end = Field(Expr, optional=True)
 
-    def show(self, ctx):
-        def maybe(x):
-            return x.show(ctx) if x is not None else ''
-        return '{}:{}'.format(maybe(self.start), maybe(self.end))
+    def parts(self):
+        return [_maybe(self.start), ':', _maybe(self.end)]
 
 
 class ExprSlice3(Expr):
@@ -432,10 +511,12 @@ class ExprSlice3(Expr):
     end = Field(Expr, optional=True)
     step = Field(Expr, optional=True)
 
-    def show(self, ctx):
-        def maybe(x):
-            return x.show(ctx) if x is not None else ''
-        return '{}:{}:{}'.format(maybe(self.start), maybe(self.end), maybe(self.step))
+    def parts(self):
+        return [_maybe(self.start), ':', _maybe(self.end), ':', _maybe(self.step)]
+
+
+def _maybe(expr):
+    return expr if expr is not None else ''
 
 
 # calls
@@ -444,11 +525,8 @@ class ExprCall(Expr):
     expr = Field(Expr)
     args = Field(CallArgs)
 
-    def show(self, ctx):
-        return '{}({})'.format(
-            self.expr.show(ctx),
-            self.args.show()
-        )
+    def parts(self):
+        return [(self.expr, PRIMARY), '('] + self.args.parts() + [')']
 
 
 # names
@@ -456,14 +534,14 @@ class ExprCall(Expr):
 class ExprName(Expr):
     name = Field(str)
 
-    def show(self, ctx):
+    def parts(self):
         return self.name
 
 
 class ExprGlobal(Expr):
     name = Field(str)
 
-    def show(self, ctx):
+    def parts(self):
         return '$global[{}]'.format(self.name)
 
 
@@ -471,7 +549,7 @@ class ExprFast(Expr):
     idx = Field(int)
     name = Field(str)
 
-    def show(self, ctx):
+    def parts(self):
         return '{}${}'.format(self.name, self.idx)
 
 
@@ -479,7 +557,7 @@ class ExprDeref(Expr):
     idx = Field(int)
     name = Field(str)
 
-    def show(self, ctx):
+    def parts(self):
         return '{}$d{}'.format(self.name, self.idx)
 
 # functions - to be cleaned up by prettifier
@@ -502,15 +580,17 @@ class ExprFunctionRaw(Expr):
     ann = DictField(str, Expr)
     closures = ListField(Expr)
 
-    def show(self, ctx):
+    def parts(self):
         # TODO some better idea?
         if self.defargs or self.closures:
-            return '($functionraw {} ; {} ; {} ; {})'.format(
-                ', '.join(arg.show(None) for arg in self.defargs),
-                ', '.join('{}={}'.format(name, arg.show(None)) for name, arg in self.defkwargs.items()),
-                ', '.join('{}:{}'.format(name, ann.show(None)) for name, ann in self.ann.items()),
-                ', '.join(c.show(None) for c in self.closures)
-            )
+            res = ['($functionraw '] + join(self.defargs, ', ') + [' ; ']
+            for i, (name, arg) in enumerate(self.defkwargs.items()):
+                res += [', ' if i else '', name, '=', arg]
+            res.append(' ; ')
+            for i, (name, ann) in enumerate(self.ann.items()):
+                res += [', ' if i else '', name, ':', ann]
+            res.append(' ; ')
+            return res + join(self.closures, ', ') + [')']
         return '$functionraw'
 
 
@@ -518,10 +598,12 @@ class ExprFunction(Expr):
     name = Field(str, optional=True)
     args = Field(FunArgs)
     block = Field(Block)
+    # firstlineno of the code object, if the version has line numbers
+    line = Field(int, optional=True)
 
-    def show(self, ctx):
+    def parts(self):
         # TODO some better idea?
-        return '$function {}({})'.format(self.name, self.args.show())
+        return ['$function {}('.format(self.name), self.args, ')']
 
 
 class ExprClassRaw(Expr):
@@ -530,37 +612,29 @@ class ExprClassRaw(Expr):
     code = Field(DecoCode)
     closures = ListField(Expr)
 
-    def show(self, ctx):
-        if self.args.args:
-            return '$classraw {}({})'.format(
-                self.name,
-                self.args.show()
-            )
-        else:
-            return '$classraw {}()'.format(self.name)
+    def parts(self):
+        return ['$classraw {}('.format(self.name), self.args, ')']
 
 
 class ExprClass(Expr):
     name = Field(str)
     args = Field(CallArgs)
     body = Field(Block)
+    # like in ExprFunction
+    line = Field(int, optional=True)
 
-    def show(self, ctx):
-        if self.args.args:
-            return '$class {}({})'.format(
-                self.name,
-                self.args.show()
-            )
-        else:
-            return '$class {}()'.format(self.name)
+    def parts(self):
+        return ['$class {}('.format(self.name), self.args, ')']
 
 
 class ExprLambda(Expr):
     args = Field(FunArgs)
     expr = Field(Expr)
+    paren = True
+    prec = ALWAYS
 
-    def show(self, ctx):
-        return '(lambda {}: {})'.format(self.args.show(), self.expr.show(None))
+    def parts(self):
+        return ['lambda ', self.args, ': ', self.expr]
 
 
 class ExprNewListCompRaw(Expr):
@@ -569,13 +643,12 @@ class ExprNewListCompRaw(Expr):
     items = ListField(CompItem)
     arg = Field(Expr)
 
-    def show(self, ctx):
-        return '$newlistcompraw({} top {} in {} {})'.format(
-            self.expr.show(None),
-            self.topdst.show(None),
-            self.arg.show(None),
-            ' '.join(item.show() for item in self.items),
-        )
+    def parts(self):
+        return [
+            '$newlistcompraw(', self.expr,
+            ' top ', self.topdst,
+            ' in ', self.arg, ' ',
+        ] + join(self.items, ' ') + [')']
 
 
 class ExprNewSetCompRaw(Expr):
@@ -584,13 +657,12 @@ class ExprNewSetCompRaw(Expr):
     items = ListField(CompItem)
     arg = Field(Expr)
 
-    def show(self, ctx):
-        return '$newsetcompraw({} top {} in {} {})'.format(
-            self.expr.show(None),
-            self.topdst.show(None),
-            self.arg.show(None),
-            ' '.join(item.show() for item in self.items),
-        )
+    def parts(self):
+        return [
+            '$newsetcompraw(', self.expr,
+            ' top ', self.topdst,
+            ' in ', self.arg, ' ',
+        ] + join(self.items, ' ') + [')']
 
 
 class ExprNewDictCompRaw(Expr):
@@ -600,28 +672,33 @@ class ExprNewDictCompRaw(Expr):
     items = ListField(CompItem)
     arg = Field(Expr)
 
-    def show(self, ctx):
-        return '$newdictcompraw({}: {} top {} in {} {})'.format(
-            self.key.show(None),
-            self.val.show(None),
-            self.topdst.show(None),
-            self.arg.show(None),
-            ' '.join(item.show() for item in self.items),
-        )
+    def parts(self):
+        return [
+            '$newdictcompraw(', self.key, ': ', self.val,
+            ' top ', self.topdst,
+            ' in ', self.arg, ' ',
+        ] + join(self.items, ' ') + [')']
 
 
 class ExprCallComp(Expr):
     fun = Field(ExprFunctionRaw)
     expr = Field(Expr)
 
-    def show(self, ctx):
-        return '$callcomp({})'.format(self.expr.show(None))
+    def parts(self):
+        return ['$callcomp(', self.expr, ')']
 
 
 class Frozenset(Node):
     exprs = ListField(Expr)
 
 
+def _from_marshal_seq(obj, version):
+    exprs = [from_marshal(sub, version) for sub in obj.val]
+    if isinstance(obj, MarshalTuple):
+        return ExprTuple(exprs)
+    return Frozenset(exprs)
+
+
 def from_marshal(obj, version):
     if isinstance(obj, MarshalNone):
         return ExprNone()
@@ -641,8 +718,9 @@ def from_marshal(obj, version):
         return ExprString(obj.val)
     if isinstance(obj, MarshalUnicode):
         return ExprUnicode(obj.val)
-    if isinstance(obj, MarshalTuple):
-        return ExprTuple([from_marshal(sub, version) for sub in obj.val])
-    if isinstance(obj, MarshalFrozenset):
-        return Frozenset([from_marshal(sub, version) for sub in obj.val])
+    if isinstance(obj, (MarshalTuple, MarshalFrozenset)):
+        interner = intern.ACTIVE.interner
+        if interner is not None:
+            return interner.convert(obj, lambda obj: _from_marshal_seq(obj, version))
+        return _from_marshal_seq(obj, version)
     raise PythonError("can't map {} to expression".format(type(obj)))
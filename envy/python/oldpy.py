@@ -0,0 +1,207 @@
+"""Persistent compile workers running old python versions.
+
+Compiling a test used to mean starting the old interpreter once per file
+(import-mode versions) or once per version (compileall).  Instead, a Worker
+keeps one old interpreter running per version, and feeds it files to compile
+over a pipe.  A worker compiles either by importing the module (the only way
+for pythons before 1.4), or with py_compile.
+
+The worker script below has to run on everything from 1.0 to 3.5, so it
+sticks to the common subset: no print, no string methods, no augmented
+assignment, no "except X as e".
+
+The protocol is three lines per request (command, directory, module or file
+name), answered with a single line: "ok", or "error" followed by the repr of
+the exception.
+"""
+
+from pathlib import Path
+import atexit
+import os
+import subprocess
+import tempfile
+import threading
+
+root_dir = (Path(__file__).parent / '..' / '..').resolve()
+
+if "OLDPY_PATH" in os.environ:
+    oldpy_dir = Path(os.environ["OLDPY_PATH"])
+else:
+    oldpy_dir = root_dir / '..' / 'oldpy'
+
+SCRIPT = r'''
+import sys
+out = sys.stdout
+null = open('/dev/null', 'w')
+
+def excinfo():
+    try:
+        return sys.exc_info()[:2]
+    except AttributeError:
+        return sys.exc_type, sys.exc_value
+
+def compile_import(dirname, name):
+    sys.path.insert(0, dirname)
+    try:
+        exec('import ' + name)
+    finally:
+        del sys.path[0]
+        try:
+            del sys.modules[name]
+        except KeyError:
+            pass
+
+def compile_file(dirname, name):
+    import py_compile
+    py_compile.compile(dirname + '/' + name)
+
+while 1:
+    cmd = sys.stdin.readline()
+    if not cmd:
+        break
+    dirname = sys.stdin.readline()[:-1]
+    name = sys.stdin.readline()[:-1]
+    sys.stdout = null
+    try:
+        if cmd == 'import\n':
+            compile_import(dirname, name)
+        else:
+            compile_file(dirname, name)
+        res = 'ok\n'
+    except:
+        t, v = excinfo()
+        res = 'error ' + repr(str(t) + ': ' + str(v)) + '\n'
+    sys.stdout = out
+    out.write(res)
+    out.flush()
+'''
+
+# the error of a request the interpreter didn't live to answer
+WORKER_DIED = 'worker died'
+
+# rversion -> Worker
+WORKERS = {}
+_workers_lock = threading.Lock()
+
+
+class Worker:
+    """A long-running old python.  Requests are serialized, so a worker can
+    be shared between threads."""
+
+    def __init__(self, rversion):
+        self.pydir = oldpy_dir / "Python-{}".format(rversion)
+        self.proc = None
+        self.lock = threading.Lock()
+
+    def _start(self):
+        # the whole point is writing bytecode
+        env = dict(os.environ)
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        self.proc = subprocess.Popen(
+            ['./python', '-c', SCRIPT],
+            cwd=str(self.pydir),
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def request(self, cmd, dirname, name):
+        """Sends a request, returns None on success or the error message.
+        If the interpreter dies (a test is free to crash it), it's restarted
+        on the next request."""
+        with self.lock:
+            if self.proc is None:
+                self._start()
+            try:
+                self.proc.stdin.write('{}\n{}\n{}\n'.format(cmd, dirname, name).encode())
+                self.proc.stdin.flush()
+                line = self.proc.stdout.readline().decode()
+            except BrokenPipeError:
+                line = ''
+            if not line:
+                self.close()
+                return WORKER_DIED
+        if line == 'ok\n':
+            return None
+        return line[len('error '):].rstrip('\n')
+
+    def import_(self, dirname, name):
+        """Compiles dirname/name.py by importing it."""
+        return self.request('import', str(dirname), name)
+
+    def compile(self, path):
+        """Compiles a file with py_compile."""
+        path = Path(path)
+        return self.request('compile', str(path.parent), path.name)
+
+    def close(self):
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                # it's dead already, with a request still buffered
+                pass
+            self.proc.wait()
+            self.proc.stdout.close()
+            self.proc = None
+
+
+def worker(rversion):
+    """Returns the shared worker for a python version."""
+    with _workers_lock:
+        try:
+            return WORKERS[rversion]
+        except KeyError:
+            res = WORKERS[rversion] = Worker(rversion)
+            return res
+
+
+@atexit.register
+def shutdown():
+    """Stops all workers."""
+    with _workers_lock:
+        for w in WORKERS.values():
+            w.close()
+        WORKERS.clear()
+
+
+def pyc_path(path, tag):
+    """Returns where the pyc for a given py file ends up."""
+    path = Path(path)
+    if tag:
+        return path.parent / '__pycache__' / '{}.{}.pyc'.format(path.stem, tag)
+    return path.with_suffix('.pyc')
+
+
+def compile_path(rversion, cmode, tag, path):
+    """Compiles a py file with the given python, the way the test harness
+    would.  Returns (pyc file, error), with pyc file None on failure."""
+    path = Path(path)
+    w = worker(rversion)
+    if cmode == 'import':
+        err = w.import_(path.parent, path.stem)
+    else:
+        err = w.compile(path)
+    pycfile = pyc_path(path, tag)
+    if not pycfile.exists():
+        return None, err or 'no pyc file written'
+    return pycfile, None
+
+
+def compile_source(v, source, name='snippet'):
+    """Compiles a piece of source with the python of a test harness VERSIONS
+    entry.  Returns the pyc contents, or raises ValueError with the error
+    message."""
+    version, rversion, cmode, tag, pycver, tests = v
+    if isinstance(source, str):
+        source = source.encode('utf-8')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / (name + '.py')
+        with path.open('wb') as fp:
+            fp.write(source)
+        pycfile, err = compile_path(rversion, cmode, tag, path)
+        if pycfile is None:
+            raise ValueError(err)
+        with pycfile.open('rb') as fp:
+            return fp.read()
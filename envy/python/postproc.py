@@ -1,3 +1,6 @@
+from envy import stats
+from envy.show import Emitter
+
 from .helpers import PythonError
 
 from .stmt import *
@@ -81,8 +84,20 @@ class RootExec:
     def __init__(self, block):
         self.block = block
 
+    def emit(self, em):
+        self.block.emit(em)
+
     def show(self):
-        return self.block.show()
+        # a top-level statement at a time, so that the lines of a big
+        # module aren't all kept around
+        lines = []
+        em = Emitter(lines.append)
+        for stmt in self.block.stmts:
+            stmt.emit(em)
+            yield from lines
+            lines.clear()
+        if not self.block.stmts:
+            yield 'pass'
 
 class RootEval:
     __slots__ = 'expr',
@@ -90,11 +105,76 @@ class RootEval:
     def __init__(self, expr):
         self.expr = expr
 
+    def emit(self, em):
+        em.line(self.expr.show(None))
+
     def show(self):
         yield self.expr.show(None)
 
 
-def ast_process(deco, version):
+def _walker(rewrite):
+    """Makes a bottom-up tree pass out of a node rewrite function.  If stats
+    are being collected, counts the nodes replaced by the rewrite.
+
+    Blocks of identical code objects are shared (see deco.memo), and the
+    rewrites don't depend on anything but the node, so every block object is
+    only processed once."""
+    st = stats.ACTIVE.stats
+    # id of block -> (block, result)
+    done = {}
+    def walk(root):
+        # iterative, so that long operator chains don't run out of stack:
+        # a node is pushed once to push its subnodes, and once more to be
+        # rebuilt from their results, which are kept on res
+        todo = [(root, None)]
+        res = []
+        while todo:
+            node, count = todo.pop()
+            shared = type(node) is Block
+            if count is None:
+                if shared and id(node) in done:
+                    res.append(done[id(node)][1])
+                    continue
+                subs = node.children()
+                todo.append((node, len(subs)))
+                todo += [(sub, None) for sub in reversed(subs)]
+                continue
+            vals = iter(res[len(res) - count:])
+            del res[len(res) - count:]
+            sub = node.subprocess(lambda _: next(vals))
+            new = rewrite(sub)
+            if st is not None and new is not sub:
+                st.rewrites += 1
+            if shared:
+                done[id(node)] = node, new
+            res.append(new)
+        return res[0]
+    return walk
+
+
+# top-level statements that postprocessing may merge the following
+# statements into (or drop) - see streamable
+_HOLD = (StmtIfDead, StmtExceptDead, StmtFinalContinue, StmtReturn)
+
+
+def streamable(stmts):
+    """Returns how many of the leading statements in a list of top-level
+    statements can be postprocessed on their own, with ast_passes - the rest,
+    and everything that follows, has to wait for the end."""
+    for idx, stmt in enumerate(stmts):
+        if isinstance(stmt, _HOLD):
+            return idx
+    return len(stmts)
+
+
+def _fallen(block):
+    # the body of a code object that couldn't be decompiled (see
+    # envy.python.deco.budget)
+    return len(block.stmts) == 1 and isinstance(block.stmts[0], StmtFallback)
+
+
+def ast_passes(deco, version):
+    """Runs the postprocessing passes on a DecoCode, returns the result."""
 
     # processing stage 1
     #
@@ -106,6 +186,8 @@ def ast_process(deco, version):
         if code.code.name != name:
             raise PythonError("class name doesn't match code object")
         block = code.block
+        if _fallen(block):
+            return block
         if code.varnames:
             raise PythonError("class has fast vars")
         if not block.stmts or not isinstance(block.stmts[-1], StmtEndClass):
@@ -115,6 +197,8 @@ def ast_process(deco, version):
     def process_class_body_new(code, name):
         if code.code.name != name:
             raise PythonError("class name doesn't match code object")
+        if _fallen(code.block):
+            return code.block
         stmts = code.block.stmts[:]
         if version.has_store_locals:
             if code.varnames != ['__locals__']:
@@ -152,8 +236,7 @@ def ast_process(deco, version):
             print(raw)
             raise PythonError("$loop with funny contents")
 
-    def process_1(node):
-        node = node.subprocess(process_1)
+    def rewrite_1(node):
         if isinstance(node, ExprCall) and isinstance(node.expr, ExprBuildClass):
             args = node.args.args
             if not (len(args) >= 2
@@ -168,9 +251,9 @@ def ast_process(deco, version):
             if fun.defargs or fun.defkwargs or fun.ann:
                 raise PythonError("class function has def args")
             # TODO closure information lost here
-            return ExprClass(name, CallArgs(args[2:]), process_class_body_new(fun.code, name))
+            return ExprClass(name, CallArgs(args[2:]), process_class_body_new(fun.code, name), fun.code.code.firstlineno)
         if isinstance(node, ExprClassRaw):
-            return ExprClass(node.name, node.args, process_class_body(node.code, node.name))
+            return ExprClass(node.name, node.args, process_class_body(node.code, node.name), node.code.code.firstlineno)
         if isinstance(node, ExprCallComp):
             stmts = node.fun.code.block.stmts
             if not stmts:
@@ -208,6 +291,7 @@ def ast_process(deco, version):
             return process_loop(node)
         return node
 
+    process_1 = _walker(rewrite_1)
     deco = process_1(deco)
 
     # processing stage 2
@@ -293,6 +377,10 @@ def ast_process(deco, version):
             for closure, free in zip(node.closures, node.code.code.freevars):
                 if closure.name != free:
                     raise PythonError("closures mismatch")
+        elif _fallen(node.code.block):
+            # old code without $args - the arguments are lost
+            args = FunArgs([], node.defargs, None, [], node.defkwargs, None, node.ann)
+            split = 0
         else:
             # old code - the first statement should be $args unpacking
             if not stmts or not isinstance(stmts[0], StmtArgs):
@@ -303,7 +391,8 @@ def ast_process(deco, version):
         return ExprFunction(
             node.code.code.name,
             args,
-            Block(stmts[split:])
+            Block(stmts[split:]),
+            node.code.code.firstlineno
         )
 
     def isdecorator(node):
@@ -344,18 +433,20 @@ def ast_process(deco, version):
                 return node
             if decorators and not version.has_fun_deco:
                 return node
-            stmts = fun.block.stmts
+            block = fun.block
+            stmts = block.stmts
             if stmts and isinstance(stmts[-1], StmtReturn) and isinstance(stmts[-1].val, ExprNone):
-                stmts.pop()
-            elif not version.has_return_squash:
+                # a new block - this one may be shared
+                block = Block(stmts[:-1])
+            elif not version.has_return_squash and not _fallen(block):
                 raise PythonError("function not terminated by return None")
-            return StmtDef(decorators, fun.name, fun.args, fun.block)
+            return StmtDef(decorators, fun.name, fun.args, block, fun.line)
         elif isinstance(fun, ExprClass):
             if not name.endswith(fun.name):
                 return node
             if decorators and not version.has_cls_deco:
                 return node
-            return StmtClass(decorators, fun.name, fun.args, fun.body)
+            return StmtClass(decorators, fun.name, fun.args, fun.body, fun.line)
         else:
             return node
 
@@ -373,8 +464,7 @@ def ast_process(deco, version):
             return StmtExcept(node.try_, node.items, node.any, None)
         return node
 
-    def process_2(node):
-        node = node.subprocess(process_2)
+    def rewrite_2(node):
         if isinstance(node, ExprFunctionRaw):
             return process_fun_body(node)
         if isinstance(node, StmtAssign):
@@ -387,6 +477,7 @@ def ast_process(deco, version):
             return process_block_2(node)
         return node
 
+    process_2 = _walker(rewrite_2)
     deco = process_2(deco)
 
     # processing stage 3
@@ -401,16 +492,15 @@ def ast_process(deco, version):
             raise PythonError("lambda with a name: {}".format(node.name))
         return ExprLambda(node.args, unreturn(node.block))
 
-    def process_3(node):
-        node = node.subprocess(process_3)
+    def rewrite_3(node):
         if isinstance(node, ExprFunction):
             return process_lambda(node)
         return node
 
+    process_3 = _walker(rewrite_3)
     deco = process_3(deco)
 
-    def process_4(node):
-        node = node.subprocess(process_4)
+    def rewrite_4(node):
         if isinstance(node, StmtIfRaw):
             return process_if(StmtIf([IfItem(node.cond, node.body)], node.else_))
         if isinstance(node, StmtIfDead):
@@ -435,10 +525,18 @@ def ast_process(deco, version):
             return process_block_3(node)
         return node
 
-    deco = process_4(deco)
+    process_4 = _walker(rewrite_4)
+    return process_4(deco)
+
+
+def ast_process(deco, version):
+    """Postprocesses a decompiled module, returns a RootExec or RootEval."""
+    deco = ast_passes(deco, version)
 
     # wrap the top level
     stmts = deco.block.stmts
+    if _fallen(deco.block):
+        return RootExec(deco.block)
     if not stmts:
         raise PythonError("empty top")
     ret = stmts[-1]
@@ -452,3 +550,50 @@ def ast_process(deco, version):
         return RootEval(ret.expr)
     else:
         return RootExec(Block(stmts[:-1]))
+
+
+def _fallback(stmts, err, listing):
+    st = stats.ACTIVE.stats
+    if st is not None:
+        st.fallbacks += 1
+    lines = [line for stmt in stmts for line in stmt.show()] if listing else []
+    return StmtFallback("postprocessing failed: {}".format(err), lines)
+
+
+def salvage_passes(deco, version, listing=False):
+    """Like ast_passes, but for top-level statements that can be processed
+    one at a time (see streamable): the ones that fail are replaced with a
+    StmtFallback, with their deco listing if listing is set."""
+    try:
+        return ast_passes(deco, version)
+    except PythonError:
+        pass
+    stmts = []
+    for stmt in deco.block.stmts:
+        try:
+            stmts += ast_passes(DecoCode(Block([stmt]), deco.code, deco.varnames), version).block.stmts
+        except PythonError as e:
+            stmts.append(_fallback([stmt], e, listing))
+    return DecoCode(Block(stmts), deco.code, deco.varnames)
+
+
+def salvage_process(deco, version, listing=False):
+    """Like ast_process, but falls back instead of failing - see
+    salvage_passes.  The statements that have to wait for the end fall back
+    together."""
+    try:
+        return ast_process(deco, version)
+    except PythonError:
+        pass
+    stmts = deco.block.stmts
+    count = streamable(stmts)
+    head = salvage_passes(DecoCode(Block(stmts[:count]), deco.code, deco.varnames), version, listing).block.stmts
+    try:
+        tail = ast_process(DecoCode(Block(stmts[count:]), deco.code, deco.varnames), version)
+        if isinstance(tail, RootEval) and head:
+            raise PythonError("top has non-None return and long body")
+    except PythonError as e:
+        tail = RootExec(Block([_fallback(stmts[count:], e, listing)]))
+    if isinstance(tail, RootEval):
+        return tail
+    return RootExec(Block(head + tail.block.stmts))
@@ -0,0 +1,139 @@
+"""Expression printing.
+
+Expressions don't build their own strings.  They describe themselves with
+parts: a string for leaves, or a list of fragments - strings and subnodes.
+write walks the tree with an explicit stack of iterators over partly
+written fragment lists and passes the fragments to an output callable, so
+every character is produced once, and deep expressions (long chains of +
+or and) don't run into the recursion limit.
+
+A subnode can come as (node, prec) or (node, prec, force): prec is the
+lowest precedence the node can have there without parentheses.  Expression
+classes have their own precedence in prec, and paren if they print in
+parentheses in full mode.  A bare subnode is (node, LOWEST).  Leaves never
+set paren, only the context can have them parenthesized.
+
+There are two modes:
+
+- full (the default): operators, compares, and the like are always
+  wrapped in parentheses (paren), and the objects of attribute accesses
+  get another pair on top (force), as in ((b + c)).d.  Unambiguous, and
+  what the test expectations are written in.
+- minimal: parentheses only where the precedence table calls for them.
+  Lambdas, conditional expressions and yields are always parenthesized,
+  since it's the statement around them that decides whether that's
+  needed.  Tuples always come with their parentheses, too.
+
+The mode is per thread, see install.
+"""
+
+from contextlib import contextmanager
+import threading
+
+# precedence levels, from lowest.  ALWAYS is for things that are always
+# wrapped in minimal mode.
+ALWAYS = -1
+(
+    LOWEST,
+    OR,
+    AND,
+    NOT,
+    CMP,
+    BOR,
+    BXOR,
+    BAND,
+    SHIFT,
+    ARITH,
+    TERM,
+    UNARY,
+    POWER,
+    # non-negative number literals - they're fine as operands, but 1.real
+    # is not an attribute access
+    NUMBER,
+    PRIMARY,
+) = range(15)
+
+
+class _Active(threading.local):
+    # if True, only the parentheses required by precedence are printed
+    minimal = False
+
+ACTIVE = _Active()
+
+
+@contextmanager
+def install(minimal):
+    """Selects the parenthesization mode for the duration of the with
+    block."""
+    prev = ACTIVE.minimal
+    ACTIVE.minimal = minimal
+    try:
+        yield
+    finally:
+        ACTIVE.minimal = prev
+
+
+def join(items, sep):
+    """Returns the fragments of items separated by sep."""
+    if not items:
+        return []
+    res = [sep] * (2 * len(items) - 1)
+    res[::2] = items
+    return res
+
+
+def write(node, out, need=LOWEST):
+    """Writes an expression (or a part of one) by calling out with its
+    fragments.  need is the precedence required by the context."""
+    minimal = ACTIVE.minimal
+    # iterators over the fragments being written, innermost last
+    stack = [iter([(node, need)])]
+    while stack:
+        for part in stack[-1]:
+            t = type(part)
+            if t is str:
+                out(part)
+                continue
+            if t is tuple:
+                if len(part) == 3:
+                    node, need, force = part
+                else:
+                    node, need = part
+                    force = False
+                sub = node.parts()
+                if minimal:
+                    wrap = node.prec < need
+                elif force and node.paren:
+                    # forced parens come on top of the node's own, as
+                    # in ((b + c)).d - only non-leaves set paren
+                    out('(')
+                    stack.append(iter(')'))
+                    wrap = True
+                else:
+                    wrap = node.paren or force
+                if type(sub) is str:
+                    out('(' + sub + ')' if wrap else sub)
+                    continue
+            else:
+                # the common case - leaves are only parenthesized when the
+                # context asks for it
+                node = part
+                sub = node.parts()
+                if type(sub) is str:
+                    out(sub)
+                    continue
+                wrap = (node.prec < LOWEST) if minimal else node.paren
+            if wrap:
+                out('(')
+                stack.append(iter(')'))
+            stack.append(iter(sub))
+            break
+        else:
+            stack.pop()
+
+
+def render(node, need=LOWEST):
+    """Returns an expression (or a part of one) as a string."""
+    chunks = []
+    write(node, chunks.append, need)
+    return ''.join(chunks)
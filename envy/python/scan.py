@@ -0,0 +1,275 @@
+"""Fast inventory of pyc files, without decompiling them.
+
+For triage, the interesting things about a pyc file are its metadata and a
+rough outline: version, timestamps, top-level names, what it defines and
+what it imports.  All of that can be read off the marshal data and a quick
+walk over the raw bytecode, without building opcode objects, let alone
+running the deco stage.
+
+Run as:
+
+    python -m envy.python.scan [-j JOBS] FILE_OR_DIR...
+
+Directories are searched for pyc files recursively.  Prints one JSON object
+per file:
+
+- file, bytes: the pyc file name and size
+- version, magic, timestamp, source_size: from the header (source_size is
+  null before 3.3)
+- filename: co_filename of the module
+- doc: the module docstring, or null
+- names: names stored at the top level, in order of first store
+- imports: imported modules, in order of first import, with leading dots
+  for relative imports
+- defs: functions and classes, nested ones too, as objects with kind
+  ("function" or "class"), name (dotted with the enclosing definitions),
+  line (null for pythons without line numbers), and doc
+
+If the file can't be read, the object has file and error instead.
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import os
+import sys
+
+from envy.format.helpers import FormatError
+from envy.format.marshal import MarshalCode, MarshalString, MarshalUnicode, MarshalInt
+from envy.format.pyc import PycFile
+
+from .helpers import PythonError
+from .session import Decompiler
+
+session = Decompiler()
+
+# version -> list of (opcode name, has param) or None, indexed by opcode
+_OPTABLES = {}
+
+
+def _optable(version):
+    try:
+        return _OPTABLES[version]
+    except KeyError:
+        pass
+    opcodes = session.tables(version).opcodes
+    res = []
+    for opc in range(256):
+        cls = opcodes[opc]
+        if cls is None:
+            res.append(None)
+        else:
+            res.append((cls.name, hasattr(cls, 'read_params')))
+    _OPTABLES[version] = res
+    return res
+
+
+def _ops(code, table):
+    """Yields (opcode name, param) for the raw bytecode of a code object."""
+    raw = code.code
+    pos = 0
+    ext = 0
+    end = len(raw)
+    while pos < end:
+        entry = table[raw[pos]]
+        if entry is None:
+            raise PythonError("unknown opcode {}".format(raw[pos]))
+        name, has_param = entry
+        if has_param:
+            if pos + 3 > end:
+                raise PythonError("bytecode ends in the middle of an opcode")
+            param = raw[pos + 1] | raw[pos + 2] << 8 | ext << 16
+            pos += 3
+        else:
+            param = None
+            pos += 1
+        if name == 'EXTENDED_ARG':
+            ext = param
+            continue
+        ext = 0
+        yield name, param
+
+
+def _text(val):
+    if isinstance(val, bytes):
+        return val.decode('utf-8', 'replace')
+    return val
+
+
+def _string(node):
+    """Returns the value of a string const, or None."""
+    if isinstance(node, (MarshalString, MarshalUnicode)):
+        return _text(node.val)
+    return None
+
+
+class _Scanner:
+    def __init__(self, version):
+        self.version = version
+        self.table = _optable(version)
+        self.imports = []
+        self.defs = []
+
+    def scan(self, code, prefix, kind):
+        """Walks a code object.  Returns the docstring and the stored names
+        (for module and class code).  Nested code objects are scanned as
+        well and added to defs."""
+        names = []
+        doc = None
+        classes = set()
+        # the last loaded const index, and the one before it
+        last = prev = None
+        last_code = None
+        # py3: the code object after LOAD_BUILD_CLASS is a class body
+        build_class = False
+        consts = code.consts
+        for name, param in _ops(code, self.table):
+            if name == 'LOAD_CONST':
+                if param >= len(consts):
+                    raise PythonError("Const index out of range")
+                prev, last = last, param
+                if isinstance(consts[param], MarshalCode):
+                    last_code = param
+                    if build_class:
+                        classes.add(param)
+                        build_class = False
+                continue
+            if name == 'LOAD_BUILD_CLASS':
+                build_class = True
+            elif name == 'BUILD_CLASS' and last_code is not None:
+                # py2: the last code object loaded is the class body
+                classes.add(last_code)
+            elif name in ('STORE_NAME', 'STORE_GLOBAL'):
+                stored = code.names[param]
+                if stored == '__doc__' and last is not None and doc is None:
+                    doc = _string(consts[last])
+                if stored not in names:
+                    names.append(stored)
+            elif name == 'IMPORT_NAME':
+                module = code.names[param]
+                if self.version.has_relative_import and prev is not None:
+                    level = consts[prev]
+                    if isinstance(level, MarshalInt) and level.val > 0:
+                        module = '.' * level.val + module
+                if module not in self.imports:
+                    self.imports.append(module)
+            last = prev = None
+        if kind == 'function' and consts:
+            doc = _string(consts[0])
+        for idx, const in enumerate(consts):
+            if not isinstance(const, MarshalCode):
+                continue
+            subname = _text(const.name)
+            if subname is None or subname.startswith('<'):
+                # lambdas, comprehensions, genexps
+                self.scan(const, prefix, None)
+                continue
+            subkind = 'class' if idx in classes else 'function'
+            item = {
+                'kind': subkind,
+                'name': prefix + subname,
+                'line': const.firstlineno,
+                'doc': None,
+            }
+            self.defs.append(item)
+            item['doc'], _ = self.scan(const, prefix + subname + '.', subkind)
+        return doc, names
+
+
+def scan(fp):
+    """Scans a pyc file given as a binary file object, returns the inventory
+    dict (without file and bytes)."""
+    pyc = PycFile(fp, session)
+    code = pyc.code
+    if not isinstance(code, MarshalCode):
+        raise PythonError("top level is not a code object")
+    scanner = _Scanner(pyc.version)
+    doc, names = scanner.scan(code, '', 'module')
+    return {
+        'version': pyc.version.name,
+        'magic': pyc.version.code,
+        'timestamp': pyc.timestamp,
+        'source_size': pyc.size,
+        'filename': _text(code.filename),
+        'doc': doc,
+        'names': names,
+        'imports': scanner.imports,
+        'defs': scanner.defs,
+    }
+
+
+def scan_file(fname):
+    """Scans a pyc file, returns the inventory dict, or a dict with the
+    error."""
+    res = {'file': fname}
+    try:
+        with open(fname, 'rb') as fp:
+            res['bytes'] = os.fstat(fp.fileno()).st_size
+            res.update(scan(fp))
+    except (PythonError, FormatError, OSError, IndexError) as e:
+        return {'file': fname, 'error': '{}: {}'.format(type(e).__name__, e)}
+    return res
+
+
+def find_files(paths):
+    """Yields the pyc files among paths, searching directories."""
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for fname in sorted(filenames):
+                    if fname.endswith('.pyc'):
+                        yield os.path.join(dirpath, fname)
+        else:
+            yield path
+
+
+# files per pool task - a single file takes less to scan than to send to
+# a worker and back
+CHUNK = 256
+
+
+def _scan_chunk(fnames):
+    return [scan_file(fname) for fname in fnames]
+
+
+def scan_files(fnames, jobs=1):
+    """Scans files, yields the results in order.  With more than one job,
+    the files are spread over a process pool in chunks, with only a few of
+    them in flight at a time - fnames is consumed as the results come out,
+    so they start coming before a large tree is fully walked."""
+    if jobs == 1:
+        for fname in fnames:
+            yield scan_file(fname)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    fnames = iter(fnames)
+    pending = collections.deque()
+    with ProcessPoolExecutor(jobs) as pool:
+        while True:
+            while len(pending) < 2 * jobs:
+                chunk = list(itertools.islice(fnames, CHUNK))
+                if not chunk:
+                    break
+                pending.append(pool.submit(_scan_chunk, chunk))
+            if not pending:
+                break
+            yield from pending.popleft().result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prints a JSON lines inventory of pyc files, without decompiling them.")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="number of processes (default 1, more only pay off on large trees)")
+    parser.add_argument('paths', nargs='+', metavar='FILE_OR_DIR')
+    args = parser.parse_args()
+    status = 0
+    for res in scan_files(find_files(args.paths), args.jobs):
+        if 'error' in res:
+            status = 1
+        print(json.dumps(res))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""Saving and loading pipeline results.
+
+Any stage output - a PycFile, a Code tree, a DecoCode tree, the
+postprocessed AST, or anything else built of nodes - can be saved to a file
+and loaded back, to re-render it, analyze it, or run the later stages on it
+without the original pyc file.
+
+The format is a pickle behind a short header: MAGIC and FORMAT, the latter
+bumped whenever node classes change in an incompatible way.  Nodes are saved
+as their constructor arguments (see Node.__reduce__), versions by name.
+Code objects refer to the resolved version tables of a session, which are
+not saved; loaded code objects get the tables of the session passed to load,
+or of a module-level default session.
+
+Run as:
+
+    python -m envy.python.serial save STAGE FILE.pyc OUT
+    python -m envy.python.serial run FILE
+
+save writes the output of a stage (pyc, code, deco, or source) of a pyc
+file.  run loads a saved file, runs the remaining stages, and prints the
+source - or the listing, for a PycFile or Code with --show.
+"""
+
+import argparse
+import io
+import pickle
+import struct
+import sys
+import threading
+
+from envy.format.helpers import FormatError
+from envy.format.pyc import PycFile
+
+from .code import Code
+from .deco import deco_code
+from .expr import DecoCode
+from .postproc import ast_process
+
+MAGIC = b'ENVY'
+
+# bump when saved results can no longer be loaded
+FORMAT = 1
+
+_HEADER = struct.Struct('<4sH')
+
+STAGES = ['pyc', 'code', 'deco', 'source']
+
+
+class _Active(threading.local):
+    # the session whose tables loaded code objects get, or None for the
+    # default one
+    session = None
+
+ACTIVE = _Active()
+
+_default = None
+
+
+def tables(version):
+    """Returns the tables for code objects being loaded."""
+    global _default
+    session = ACTIVE.session
+    if session is None:
+        if _default is None:
+            from .session import Decompiler
+            _default = Decompiler()
+        session = _default
+    return session.tables(version)
+
+
+def dump(obj, fp):
+    """Saves a pipeline result to a binary file object."""
+    fp.write(_HEADER.pack(MAGIC, FORMAT))
+    pickle.dump(obj, fp, pickle.HIGHEST_PROTOCOL)
+
+
+def dumps(obj):
+    fp = io.BytesIO()
+    dump(obj, fp)
+    return fp.getvalue()
+
+
+def load(fp, session=None):
+    """Loads a pipeline result from a binary file object.  Code objects get
+    the tables of session."""
+    header = fp.read(_HEADER.size)
+    if len(header) != _HEADER.size:
+        raise FormatError("truncated header")
+    magic, fmt = _HEADER.unpack(header)
+    if magic != MAGIC:
+        raise FormatError("not a saved pipeline result")
+    if fmt != FORMAT:
+        raise FormatError("unsupported format {} (expected {})".format(fmt, FORMAT))
+    prev = ACTIVE.session
+    ACTIVE.session = session
+    try:
+        return pickle.load(fp)
+    finally:
+        ACTIVE.session = prev
+
+
+def loads(data, session=None):
+    return load(io.BytesIO(data), session)
+
+
+def run_stage(stage, fp, session=None):
+    """Runs a pyc file through the pipeline up to a stage, returns its
+    output."""
+    if session is None:
+        from .session import Decompiler
+        session = Decompiler()
+    pyc = session.load(fp)
+    if stage == 'pyc':
+        return pyc
+    code = Code(pyc.code, pyc.version, session.tables(pyc.version))
+    if stage == 'code':
+        return code
+    deco = deco_code(code)
+    if stage == 'deco':
+        return deco
+    return ast_process(deco, pyc.version)
+
+
+def resume(obj):
+    """Runs a loaded result through the remaining stages, returns the
+    postprocessed AST."""
+    if isinstance(obj, PycFile):
+        obj = Code(obj.code, obj.version, tables(obj.version))
+    if isinstance(obj, Code):
+        obj = deco_code(obj)
+    if isinstance(obj, DecoCode):
+        obj = ast_process(obj, obj.code.version)
+    return obj
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Saves pipeline results, or runs saved ones through the rest of the pipeline.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    save = sub.add_parser('save', help="save the output of a stage")
+    save.add_argument('stage', choices=STAGES)
+    save.add_argument('pyc', metavar='FILE.pyc')
+    save.add_argument('out', metavar='OUT')
+    run = sub.add_parser('run', help="decompile a saved result")
+    run.add_argument('--show', action='store_true', help="print the saved result itself")
+    run.add_argument('file', metavar='FILE')
+    args = parser.parse_args()
+    if args.command == 'save':
+        with open(args.pyc, 'rb') as fp:
+            res = run_stage(args.stage, fp)
+        with open(args.out, 'wb') as fp:
+            dump(res, fp)
+        return 0
+    with open(args.file, 'rb') as fp:
+        res = load(fp)
+    if not args.show:
+        res = resume(res)
+    for line in res.show():
+        print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,387 @@
+"""Decompilation sessions.
+
+The marshal types, opcodes, visitors, and peepholes are kept in global
+registries, with version flags deciding which entries apply.  Looking them
+up means walking the candidates and matching the flags every time.
+VersionTables resolves the registries for a single version, on demand, so
+every lookup is done only once.
+
+A Decompiler holds the tables for all versions it has seen, along with its
+options, and can be reused for any number of files.  The module-level entry
+points (PycFile, Code, deco_code) still work without a session - they just
+start with cold tables every time.
+
+A session doesn't change any global state when decompiling, so it can be
+used from several threads at once.  The stats, trace and hooks machinery is
+per thread.
+
+The process pool, the parallel scheduler and the JSON export are only
+imported when a session first needs them - most runs don't.
+"""
+
+import io
+import os
+import threading
+
+from envy import hooks, intern, stats, trace
+from envy.format.marshal import MARSHAL_CODES
+from envy.format.pyc import PycFile
+from envy.python.ast import Block
+from envy.python.bytecode import OPCODES
+from envy.python.code import Code
+from envy.python.deco import budget, cfg, deco_code, memo
+from envy.python.deco.ctx import DecoCtx
+from envy.python.deco.peephole import PEEPHOLES
+from envy.python.deco.visitor import VISITORS, load_visitors
+from envy.python import printer
+from envy.python.expr import DecoCode
+from envy.python.helpers import PythonError
+from envy.python.postproc import RootEval, RootExec, ast_passes, ast_process, salvage_passes, salvage_process, streamable
+from envy.python.stmt import StmtFallback
+
+
+class _Resolver(dict):
+    """Maps registry keys to the first entry active in a version, or None.
+    Filled on first lookup of every key."""
+
+    def __init__(self, registry, version):
+        self.registry = registry
+        self.version = version
+
+    def __missing__(self, key):
+        for item, flag in self.registry.get(key, ()):
+            if self.version.match(flag):
+                break
+        else:
+            item = None
+        self[key] = item
+        return item
+
+
+class _VisitorResolver(dict):
+    """Maps opcode classes to the list of visitors (or peephole patterns) to
+    try, in order.  The entries of base classes come after the class's
+    own, unless a VisitorProfile (see envy.python.deco.order) reorders
+    them."""
+
+    def __init__(self, version, registry=VISITORS, profile=None):
+        self.version = version
+        self.registry = registry
+        self.profile = profile
+        # the visitor modules are imported on first lookup, unless load
+        # got to it first
+        self.loaded = registry is not VISITORS
+
+    def load(self):
+        """Imports the visitor modules the version needs."""
+        if not self.loaded:
+            load_visitors(self.version)
+            self.loaded = True
+
+    def __missing__(self, cls):
+        self.load()
+        res = [
+            visitor
+            for t in cls.mro()
+            for visitor in self.registry.get(t, ())
+            if self.version.match(visitor.flag)
+        ]
+        if self.profile is not None:
+            res = self.profile.order(self.version, cls, res)
+        self[cls] = res
+        return res
+
+
+class VersionTables:
+    """All registries, resolved for a single version.  profile is an
+    optional VisitorProfile to order the visitors by.  The visitor modules
+    are imported on first use, or by load."""
+    __slots__ = 'version', 'marshal', 'opcodes', 'visitors', 'peepholes'
+
+    def __init__(self, version, profile=None):
+        self.version = version
+        self.marshal = _Resolver(MARSHAL_CODES, version)
+        self.opcodes = _Resolver(OPCODES, version)
+        self.visitors = _VisitorResolver(version, profile=profile)
+        self.peepholes = _VisitorResolver(version, PEEPHOLES)
+
+    def load(self):
+        """Imports the visitor modules the version needs, if not done
+        yet."""
+        self.visitors.load()
+
+
+# what Decompiler can output, in pipeline order
+OUTPUTS = ['pyc', 'code', 'deco', 'source', 'json']
+
+# how expressions are parenthesized (see envy.python.printer)
+PARENS = ['full', 'minimal']
+
+
+def _printed(lines, minimal):
+    """Yields the lines of a show generator, printing expressions in the
+    given mode - installed only while a line is produced, never across a
+    yield."""
+    it = iter(lines)
+    while True:
+        with printer.install(minimal):
+            line = next(it, None)
+        if line is None:
+            return
+        yield line
+
+
+class Decompiler:
+    """A decompilation session.  Options:
+
+    - version: if not None, only pycs of this PycVersion are accepted
+    - strict: if False, junk after the marshal data is ignored
+    - output: what decompile yields - a list of OUTPUTS items, the
+      listings come in pipeline order; json is the final tree as JSON
+      lines (see envy.python.export)
+    - cache: if False, resolved tables are not kept between files
+    - intern: if True, equal immutable expression nodes are shared within
+      a file (see envy.intern) - saves memory on constant-heavy modules
+    - reuse: if True, identical code objects within a file are only
+      decompiled once (see envy.python.deco.memo)
+    - code_cache: a CodeCache (see envy.python.deco.cache) to look up code
+      objects in across files and runs, implies reuse
+    - jobs: if more than 1, the nested code objects of big modules are
+      decompiled on a pool of that many processes (see
+      envy.python.deco.parallel), implies reuse.  The pool is started on
+      first use, and stopped by close.
+    - parens: a PARENS item - full puts every operator expression in
+      parentheses, minimal only where precedence requires it
+    - stream: if True, the top-level statements of the source output are
+      yielded as soon as they're decompiled, instead of after the whole
+      module is.  Not available with the deco and json outputs, which need
+      the whole tree, nor with an engine other than stack - the top level
+      is run through the automaton piece by piece.
+    - limits: a Limits (see envy.python.deco.budget) - code objects that run
+      over them fail
+    - fallback: None, or a FALLBACKS item (see envy.python.deco.budget) -
+      code objects that fail are replaced with a stub, and so are top-level
+      statements that fail postprocessing, instead of failing the file
+    - engine: an ENGINES item (see envy.python.deco.cfg) - stack runs the
+      automaton on every code object, cfg and auto structure the control
+      flow graph first where they can
+    - profile: a VisitorProfile (see envy.python.deco.order) - the visitors
+      are tried most matched first, with the same results
+    """
+
+    def __init__(self, version=None, strict=True, output=('source',), cache=True, intern=False, reuse=True, code_cache=None, jobs=1, parens='full', stream=False, limits=None, fallback=None, engine='stack', profile=None):
+        for item in output:
+            if item not in OUTPUTS:
+                raise ValueError("unknown output {}".format(item))
+        if parens not in PARENS:
+            raise ValueError("unknown parens {}".format(parens))
+        if stream and ('deco' in output or 'json' in output):
+            raise ValueError("can't stream the deco or json output")
+        if stream and engine != 'stack':
+            raise ValueError("can't stream with the {} engine".format(engine))
+        if fallback is not None and fallback not in budget.FALLBACKS:
+            raise ValueError("unknown fallback {}".format(fallback))
+        if engine not in cfg.ENGINES:
+            raise ValueError("unknown engine {}".format(engine))
+        self.version = version
+        self.strict = strict
+        self.output = output
+        self.cache = cache
+        self.intern = intern
+        self.reuse = reuse or code_cache is not None or jobs > 1
+        self.code_cache = code_cache
+        self.jobs = jobs
+        self.parens = parens
+        self.stream = stream
+        self.limits = limits
+        self.fallback = fallback
+        self.engine = engine
+        self.profile = profile
+        self._pool = None
+        self._tables = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def tables(self, version):
+        """Returns the resolved tables for a version."""
+        with self._lock:
+            try:
+                res = self._tables[version]
+            except KeyError:
+                self.misses += 1
+                res = VersionTables(version, self.profile)
+                if self.cache:
+                    self._tables[version] = res
+            else:
+                self.hits += 1
+        return res
+
+    def cache_info(self):
+        """Returns the table cache statistics, as a dict."""
+        with self._lock:
+            tables = list(self._tables.values())
+        return {
+            'versions': len(tables),
+            'hits': self.hits,
+            'misses': self.misses,
+            'marshal': sum(len(t.marshal) for t in tables),
+            'opcodes': sum(len(t.opcodes) for t in tables),
+            'visitors': sum(len(t.visitors) for t in tables),
+        }
+
+    def pool(self):
+        """Returns the process pool, starting it if needed."""
+        with self._lock:
+            if self._pool is None:
+                from concurrent.futures import ProcessPoolExecutor
+                self._pool = ProcessPoolExecutor(self.jobs)
+            return self._pool
+
+    def close(self):
+        """Stops the process pool, if any."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def _process(self, deco, version):
+        if self.fallback is None:
+            return ast_process(deco, version)
+        return salvage_process(deco, version, self.fallback == 'listing')
+
+    def _passes(self, deco, version):
+        if self.fallback is None:
+            return ast_passes(deco, version)
+        return salvage_passes(deco, version, self.fallback == 'listing')
+
+    def load(self, fp):
+        """Reads a pyc file, returns a PycFile."""
+        return PycFile(fp, self)
+
+    def decompile(self, fp, name=None):
+        """Decompiles a pyc file given as a binary file object.  Yields the
+        output lines."""
+        data = None
+        if self.jobs > 1:
+            # the workers load the file again
+            data = fp.read()
+            fp = io.BytesIO(data)
+        with hooks.stage('pyc', name):
+            pyc = self.load(fp)
+        # the first file of a version imports its visitor modules - timed
+        # on its own, so that it isn't charged to the stage that needs them
+        with hooks.stage('load', name):
+            self.tables(pyc.version).load()
+        if 'pyc' in self.output:
+            yield from pyc.show()
+        # only installed around the stages that build nodes, never across
+        # a yield
+        interner = intern.Interner() if self.intern else None
+        with hooks.stage('code', name), intern.collect(interner):
+            code = Code(pyc.code, pyc.version, self.tables(pyc.version))
+        if 'code' in self.output:
+            yield from code.show()
+        if 'deco' not in self.output and 'source' not in self.output and 'json' not in self.output:
+            return
+        deco_memo = memo.DecoMemo(self.code_cache, self.engine) if self.reuse else None
+        if self.limits is not None or self.fallback is not None:
+            tracker = budget.Tracker(self.limits, self.fallback)
+        else:
+            tracker = None
+        with intern.collect(interner), memo.collect(deco_memo), budget.collect(tracker), cfg.install(self.engine):
+            # a trace is supposed to show every run of the automaton
+            if data is not None and trace.ACTIVE.tracer is None:
+                from envy.python.deco import parallel
+                with hooks.stage('deco', '<parallel>', len(data)):
+                    parallel.precompute(code, data, self.pool(), self.jobs, self.engine)
+            if not self.stream:
+                deco = deco_code(code)
+        if self.stream:
+            yield from self._stream(code, pyc.version, name, interner, deco_memo, tracker)
+            return
+        if self.code_cache is not None:
+            self.code_cache.flush()
+        minimal = self.parens == 'minimal'
+        if 'deco' in self.output:
+            yield from _printed(deco.show(), minimal)
+        if 'source' in self.output or 'json' in self.output:
+            with hooks.stage('postproc', name), intern.collect(interner):
+                ast = self._process(deco, pyc.version)
+            with hooks.stage('show', name):
+                if 'source' in self.output:
+                    yield from _printed(ast.show(), minimal)
+                if 'json' in self.output:
+                    from envy.python.export import json_lines
+                    yield from json_lines(ast)
+
+    def _stream(self, code, version, name, interner, deco_memo, tracker):
+        """The source output of decompile, streamed: top-level statements
+        are postprocessed and shown as soon as the automaton finishes them.
+        Shown statements are dropped, so the whole module is never kept
+        around."""
+        minimal = self.parens == 'minimal'
+        ctx = DecoCtx(code, stream=True)
+        steps = ctx.run()
+        varnames = ctx.varnames or []
+        # statements that have to wait for the end (see streamable)
+        held = []
+        shown = False
+        failed = None
+        # the deco stage of the top code object is run a step at a time,
+        # and paused in between
+        stage = hooks.Resumable('deco', code.name, len(code.rawcode), code)
+        try:
+            while True:
+                with stage.piece(), intern.collect(interner), memo.collect(deco_memo), budget.collect(tracker), cfg.install(self.engine):
+                    try:
+                        stmts = next(steps, None)
+                    except PythonError as e:
+                        if self.fallback is None:
+                            raise
+                        failed = e
+                        stage.finish()
+                        break
+                    if stmts is None:
+                        stage.finish()
+                if stmts is None:
+                    break
+                if not held:
+                    count = streamable(stmts)
+                    if count:
+                        with hooks.stage('postproc', name), intern.collect(interner):
+                            block = self._passes(DecoCode(Block(stmts[:count]), code, varnames), version).block
+                        with hooks.stage('show', name):
+                            yield from _printed(RootExec(block).show(), minimal)
+                        shown = True
+                        stmts = stmts[count:]
+                held += stmts
+        finally:
+            # if the output wasn't read to the end
+            stage.close()
+        if self.code_cache is not None:
+            self.code_cache.flush()
+        if failed is not None:
+            # the rest of the top level falls back, held statements included
+            st = stats.ACTIVE.stats
+            if st is not None:
+                st.fallbacks += 1
+            listing = list(code.show_ops()) if self.fallback == 'listing' else []
+            with hooks.stage('show', name):
+                yield from StmtFallback(str(failed), listing).show()
+            return
+        with hooks.stage('postproc', name), intern.collect(interner):
+            ast = self._process(DecoCode(Block(held), code, varnames), version)
+        if shown:
+            if isinstance(ast, RootEval):
+                raise PythonError("top has non-None return and long body")
+            if not ast.block.stmts:
+                return
+        with hooks.stage('show', name):
+            yield from _printed(ast.show(), minimal)
+
+    def decompile_file(self, fname):
+        """Like decompile, but takes a file name."""
+        with hooks.stage('file', fname, os.path.getsize(fname)):
+            with open(fname, 'rb') as fp:
+                yield from self.decompile(fp, fname)
@@ -1,6 +1,7 @@
-from envy.show import indent
+from envy.show import emitted
 from .helpers import PythonError
 from .expr import ExprFast
+from .printer import BOR, render
 
 from .ast import *
 
@@ -241,20 +242,22 @@ class StmtExec(Stmt):
     locals = Field(Expr, optional=True)
 
     def show(self):
+        # the code is an expr, not a test - exec a or b doesn't parse.  The
+        # rest are tests, so exec a in b in c means exec a in (b in c).
         if self.globals is None:
             yield "exec {}".format(
-                self.code.show(None)
+                render(self.code, BOR)
             )
         elif self.locals is None:
             yield "exec {} in {}".format(
-                self.code.show(None),
-                self.globals.show(None)
+                render(self.code, BOR),
+                render(self.globals)
             )
         else:
             yield "exec {} in {}, {}".format(
-                self.code.show(None),
-                self.globals.show(None),
-                self.locals.show(None)
+                render(self.code, BOR),
+                render(self.globals),
+                render(self.locals)
             )
 
 
@@ -263,28 +266,28 @@ class StmtIfRaw(Stmt):
     body = Field(Block)
     else_ = Field(Block, volatile=True)
 
-    def show(self):
-        yield "$if {}:".format(self.cond.show(None))
-        yield from indent(self.body.show())
-        yield "else:"
-        yield from indent(self.else_.show())
+    def emit(self, em):
+        em.line("$if {}:".format(self.cond.show(None)))
+        em.block(self.body)
+        em.line("else:")
+        em.block(self.else_)
 
 
 class StmtIfDead(Stmt):
     cond = Field(Expr)
     body = Field(Block)
 
-    def show(self):
-        yield "$if {}:".format(self.cond.show(None))
-        yield from indent(self.body.show())
+    def emit(self, em):
+        em.line("$if {}:".format(self.cond.show(None)))
+        em.block(self.body)
 
 
 class StmtJunk(Stmt):
     body = Field(Block)
 
-    def show(self):
-        yield "$junk:"
-        yield from indent(self.body.show())
+    def emit(self, em):
+        em.line("$junk:")
+        em.block(self.body)
 
 
 class IfItem(Node):
@@ -296,33 +299,33 @@ class StmtIf(Stmt):
     items = ListField(IfItem)
     else_ = Field(Block, optional=True)
 
-    def show(self):
+    def emit(self, em):
         for idx, item in enumerate(self.items):
-            yield "{} {}:".format('if' if idx == 0 else 'elif', item.cond.show(None))
-            yield from indent(item.body.show())
+            em.line("{} {}:".format('if' if idx == 0 else 'elif', item.cond.show(None)))
+            em.block(item.body)
         if self.else_:
-            yield "else:"
-            yield from indent(self.else_.show())
+            em.line("else:")
+            em.block(self.else_)
 
 
 class StmtLoop(Stmt):
     body = Field(Block)
     else_ = Field(Block, volatile=True, optional=True)
 
-    def show(self):
-        yield "$loop:"
-        yield from indent(self.body.show())
-        yield "else:"
-        yield from indent(self.else_.show())
+    def emit(self, em):
+        em.line("$loop:")
+        em.block(self.body)
+        em.line("else:")
+        em.block(self.else_)
 
 
 class StmtWhileRaw(Stmt):
     expr = Field(Expr)
     body = Field(Block)
 
-    def show(self):
-        yield "$while {}:".format(self.expr.show(None))
-        yield from indent(self.body.show())
+    def emit(self, em):
+        em.line("$while {}:".format(self.expr.show(None)))
+        em.block(self.body)
 
 
 class StmtWhile(Stmt):
@@ -330,12 +333,12 @@ class StmtWhile(Stmt):
     body = Field(Block)
     else_ = Field(Block, optional=True)
 
-    def show(self):
-        yield "while {}:".format(self.expr.show(None))
-        yield from indent(self.body.show())
+    def emit(self, em):
+        em.line("while {}:".format(self.expr.show(None)))
+        em.block(self.body)
         if self.else_ is not None:
-            yield "else:"
-            yield from indent(self.else_.show())
+            em.line("else:")
+            em.block(self.else_)
 
 
 class StmtForRaw(Stmt):
@@ -343,9 +346,9 @@ class StmtForRaw(Stmt):
     dst = Field(Expr)
     body = Field(Block)
 
-    def show(self):
-        yield "$for {} in {}:".format(self.dst.show(None), self.expr.show(None))
-        yield from indent(self.body.show())
+    def emit(self, em):
+        em.line("$for {} in {}:".format(self.dst.show(None), self.expr.show(None)))
+        em.block(self.body)
 
 
 class StmtForTop(Stmt):
@@ -353,9 +356,9 @@ class StmtForTop(Stmt):
     dst = Field(Expr)
     body = Field(Block)
 
-    def show(self):
-        yield "$top {} in {}:".format(self.dst.show(None), self.expr.show(None))
-        yield from indent(self.body.show())
+    def emit(self, em):
+        em.line("$top {} in {}:".format(self.dst.show(None), self.expr.show(None)))
+        em.block(self.body)
 
 
 class StmtFor(Stmt):
@@ -364,23 +367,23 @@ class StmtFor(Stmt):
     body = Field(Block)
     else_ = Field(Block, optional=True)
 
-    def show(self):
-        yield "for {} in {}:".format(self.dst.show(None), self.expr.show(None))
-        yield from indent(self.body.show())
+    def emit(self, em):
+        em.line("for {} in {}:".format(self.dst.show(None), self.expr.show(None)))
+        em.block(self.body)
         if self.else_ is not None:
-            yield "else:"
-            yield from indent(self.else_.show())
+            em.line("else:")
+            em.block(self.else_)
 
 
 class StmtFinally(Stmt):
     try_ = Field(Block)
     finally_  = Field(Block)
 
-    def show(self):
-        yield "try:"
-        yield from indent(self.try_.show())
-        yield "finally:"
-        yield from indent(self.finally_.show())
+    def emit(self, em):
+        em.line("try:")
+        em.block(self.try_)
+        em.line("finally:")
+        em.block(self.finally_)
 
 
 class ExceptClause(Node):
@@ -388,13 +391,16 @@ class ExceptClause(Node):
     dst = Field(Expr, optional=True)
     body = Field(Block)
 
-    def show(self):
+    def emit(self, em):
         if self.dst is None:
-            yield 'except {}:'.format(self.expr.show(None))
+            em.line('except {}:'.format(self.expr.show(None)))
         else:
             # TODO as
-            yield 'except {}, {}:'.format(self.expr.show(None), self.dst.show(None))
-        yield from indent(self.body.show())
+            em.line('except {}, {}:'.format(self.expr.show(None), self.dst.show(None)))
+        em.block(self.body)
+
+    def show(self):
+        return emitted(self)
 
 
 class StmtExcept(Stmt):
@@ -403,17 +409,17 @@ class StmtExcept(Stmt):
     any = Field(Block, optional=True)
     else_ = Field(Block, volatile=True, optional=True)
 
-    def show(self):
-        yield "try:"
-        yield from indent(self.try_.show())
+    def emit(self, em):
+        em.line("try:")
+        em.block(self.try_)
         for item in self.items:
-            yield from item.show()
+            item.emit(em)
         if self.any is not None:
-            yield "except:"
-            yield from indent(self.any.show())
+            em.line("except:")
+            em.block(self.any)
         if self.else_ is not None:
-            yield "else:"
-            yield from indent(self.else_.show())
+            em.line("else:")
+            em.block(self.else_)
 
 
 class StmtExceptDead(Stmt):
@@ -421,14 +427,14 @@ class StmtExceptDead(Stmt):
     items = ListField(ExceptClause)
     any = Field(Block, optional=True)
 
-    def show(self):
-        yield "$trydead:"
-        yield from indent(self.try_.show())
+    def emit(self, em):
+        em.line("$trydead:")
+        em.block(self.try_)
         for item in self.items:
-            yield from item.show()
+            item.emit(em)
         if self.any is not None:
-            yield "except:"
-            yield from indent(self.any.show())
+            em.line("except:")
+            em.block(self.any)
 
 
 class StmtBreak(Stmt):
@@ -486,18 +492,21 @@ class StmtClass(Stmt):
     name = Field(str)
     args = Field(CallArgs)
     body = Field(Block)
+    # firstlineno of the body's code object, if the version has line
+    # numbers - not printed, for envy.python.export
+    line = Field(int, optional=True)
 
-    def show(self):
+    def emit(self, em):
         for d in self.deco:
-            yield '@{}'.format(d.show(None))
+            em.line('@{}'.format(d.show(None)))
         if self.args.args:
-            yield 'class {}({}):'.format(
+            em.line('class {}({}):'.format(
                 self.name,
                 self.args.show()
-            )
+            ))
         else:
-            yield 'class {}:'.format(self.name)
-        yield from indent(self.body.show())
+            em.line('class {}:'.format(self.name))
+        em.block(self.body)
 
 
 class StmtEndClass(Stmt):
@@ -510,6 +519,19 @@ class StmtReturnClass(Stmt):
         yield '$returnclass'
 
 
+class StmtFallback(Stmt):
+    """Stands in for the body of a code object that couldn't be decompiled
+    (see envy.python.deco.budget)."""
+    reason = Field(str)
+    listing = ListField(str)
+
+    def show(self):
+        yield '# decompilation failed: {}'.format(self.reason)
+        for line in self.listing:
+            yield '#' + line
+        yield 'pass'
+
+
 class StmtStartClass(Stmt):
     def show(self):
         yield '$startclass'
@@ -520,25 +542,27 @@ class StmtDef(Stmt):
     name = Field(str)
     args = Field(FunArgs)
     body = Field(Block)
+    # like in StmtClass
+    line = Field(int, optional=True)
 
-    def show(self):
+    def emit(self, em):
         for d in self.deco:
-            yield '@{}'.format(d.show(None))
-        yield 'def {}({}){}:'.format(
+            em.line('@{}'.format(d.show(None)))
+        em.line('def {}({}){}:'.format(
             self.name,
             self.args.show(),
             ' -> {}'.format(self.args.ann['return'].show(None)) if 'return' in self.args.ann else '',
-        )
-        yield from indent(self.body.show())
+        ))
+        em.block(self.body)
 
 class StmtWith(Stmt):
     expr = Field(Expr)
     dst = Field(Expr, optional=True)
     body = Field(Block)
 
-    def show(self):
+    def emit(self, em):
         if self.dst:
-            yield "with {} as {}:".format(self.expr.show(None), self.dst.show(None))
+            em.line("with {} as {}:".format(self.expr.show(None), self.dst.show(None)))
         else:
-            yield "with {}:".format(self.expr.show(None))
-        yield from indent(self.body.show())
+            em.line("with {}:".format(self.expr.show(None)))
+        em.block(self.body)
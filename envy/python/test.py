@@ -1,27 +1,36 @@
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import argparse
+import hashlib
+import json
 import os
-import subprocess
 import sys
 import shutil
+import warnings
 
-from envy.format.pyc import PycFile
+from envy import hooks
 from envy.format.helpers import FormatError
 from envy.python.helpers import PythonError
 from envy.python.code import Code
-from envy.python.deco import deco_code
-from envy.python.postproc import ast_process
+from envy.python.crosscheck import compare_tree
+from envy.python.deco import budget, deco_code
+from envy.python.export import Unrepresentable, json_lines, to_ast
+from envy.python.oldpy import WORKER_DIED, oldpy_dir, compile_path
+from envy.python.postproc import RootEval, ast_process
+from envy.python.session import Decompiler
 from envy.python.version import *
 
 root_dir = (Path(__file__).parent / '..' / '..').resolve()
 
 test_dir = root_dir / 'testdata' / 'python'
 
-if "OLDPY_PATH" in os.environ:
-    oldpy_dir = Path(os.environ["OLDPY_PATH"])
-else:
-    oldpy_dir = root_dir / '..' / 'oldpy'
+session = Decompiler()
 
-wanted = sys.argv[1:]
+# sessions for the checks besides the expected output, by options
+_sessions = {}
+
+# compiled pycs, by python version, test name and source hash
+cache_dir = test_dir / 'work' / 'cache'
 
 TESTS_10 = {
     # marshal types exercises
@@ -385,6 +394,10 @@ TESTS_27.update({
     'stmt/while_const': '27',
     'stmt/if_logic_const': '27',
     'opt/if_and': '27',
+    'expr/deep_chain': '27',
+    'stmt/while_and': '27',
+    'expr/prec': '27',
+    'defs/budget': '27',
 })
 
 TESTS_30 = TESTS_26.copy()
@@ -478,6 +491,11 @@ TESTS_35.update({
     'stmt/inplace4': '35',
 })
 
+# tests decompiled with a budget - code objects over it fall back to stubs
+LIMITS = {
+    'defs/budget': budget.Limits(steps=200),
+}
+
 VERSIONS = [
     ("1.0", "1.0.1", 'import', None, Pyc10, TESTS_10),
     ("1.1", "1.1", 'import', None, Pyc11, TESTS_11),
@@ -507,91 +525,318 @@ VERSIONS = [
     ("3.5", "3.5.0a2", 'compile', 'cpython-35', Pyc35, TESTS_35),
 ]
 
-for v in VERSIONS:
+
+def prepare(v):
+    """Makes sure all tests of a version are compiled with the old python.
+    Returns {test: (pyc file, error log)}, with pyc file None if the
+    compilation failed, or None if the old python isn't available.
+
+    Compiled files are cached by python version, test name (which ends up
+    in co_filename) and source hash, so only new or changed sources are
+    compiled.  So are failures, along with their error log - except when
+    the old python died, which may not happen next time."""
     version, rversion, cmode, tag, pycver, tests = v
-    failed = 0
-    mismatch = 0
-    missing = 0
-    nopyc = 0
-    if wanted and version not in wanted:
-        continue
     subdir = test_dir / 'work' / version
     shutil.rmtree(str(subdir), ignore_errors=True)
     subdir.mkdir(parents=True)
-    print("version {} ({})...".format(version, rversion))
     pydir = oldpy_dir / "Python-{}".format(rversion)
     if not pydir.exists():
-        print("No python {}".format(rversion))
-        continue
-    # clear all pyc files
+        return None
+    vcache = cache_dir / rversion
+    vcache.mkdir(parents=True, exist_ok=True)
+    res = {}
+    todo = []
     for test in tests:
         srcfile = test_dir / (test + '.py')
         if not srcfile.exists():
+            res[test] = None, []
+            continue
+        with srcfile.open('rb') as fp:
+            digest = hashlib.sha1(test.encode('utf-8') + b'\0' + fp.read()).hexdigest()
+        res[test] = vcache / (digest + '.pyc'), []
+        if res[test][0].exists():
+            continue
+        errfile = res[test][0].with_suffix('.err')
+        if errfile.exists():
+            with errfile.open() as fp:
+                res[test] = None, fp.readlines()
             continue
+        todo.append(test)
         pyfile = subdir / (test + '.py')
-        try:
-            pyfile.parent.mkdir(parents=True)
-        except FileExistsError:
-            pass
+        pyfile.parent.mkdir(parents=True, exist_ok=True)
         shutil.copyfile(str(srcfile), str(pyfile))
-    # if compileall is present, use it now
-    if cmode == 'compile':
-        p = subprocess.Popen(['./python', 'Lib/compileall.py', str(subdir)], cwd=str(pydir), stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
-        p.wait()
-    # now, the actual tests
-    for test, exp in sorted(tests.items(), key=lambda x: x[0]):
-        if tag:
-            tdir, _, tname = test.rpartition('/')
-            pycfile = subdir / tdir / '__pycache__' / ('{}.{}.pyc'.format(tname, tag))
-        else:
-            pycfile = subdir / (test + '.pyc')
-        if cmode == 'import':
-            errfile = subdir / (test + '.log')
-            with errfile.open('wb') as err:
-                p = subprocess.Popen([str(pydir / 'python'), '-c', 'import {}'.format(pycfile.stem)], cwd=str(pycfile.parent), stderr=err, stdout=subprocess.DEVNULL)
-            p.wait()
-            if not pycfile.exists():
-                print("compiling {} did not succeed:".format(test))
-                with errfile.open() as err:
-                    for line in err.readlines():
-                        print('\t{}'.format(line))
-                nopyc += 1
+    for test in todo:
+        pycfile, err = compile_path(rversion, cmode, tag, subdir / (test + '.py'))
+        cfile = res[test][0]
+        # other runs may be filling the cache at the same time
+        tmpfile = cfile.with_suffix('.{}.tmp'.format(os.getpid()))
+        if pycfile is None:
+            # py_compile doesn't raise, so there's nothing to say in
+            # compile mode - unless the interpreter crashed
+            log = [err + '\n'] if cmode == 'import' or err == WORKER_DIED else []
+            res[test] = None, log
+            if err == WORKER_DIED:
                 continue
-            errfile.unlink()
-        if not pycfile.exists():
-            print("compiling {} did not succeed".format(test))
-            nopyc += 1
-            continue
+            with tmpfile.open('w') as fp:
+                fp.writelines(log)
+            os.replace(str(tmpfile), str(cfile.with_suffix('.err')))
+        else:
+            shutil.copyfile(str(pycfile), str(tmpfile))
+            os.replace(str(tmpfile), str(cfile))
+    return res
+
+
+def get_session(limits=None, **options):
+    """Returns a session with the given options, budgeted with limits (see
+    LIMITS)."""
+    key = limits, tuple(sorted(options.items()))
+    res = _sessions.get(key)
+    if res is None:
+        fallback = None if limits is None else 'stub'
+        res = _sessions[key] = Decompiler(limits=limits, fallback=fallback, **options)
+    return res
+
+
+def decompile(pycfile, limits=None):
+    """Runs the whole pipeline on a pyc file, returns its version, the
+    output lines, and the final tree.  With limits, code objects over them
+    are stubbed out."""
+    with hooks.stage('pyc', str(pycfile)):
+        with pycfile.open('rb') as fp:
+            pyc = session.load(fp)
+    with hooks.stage('load', str(pycfile)):
+        session.tables(pyc.version).load()
+    with hooks.stage('code', str(pycfile)):
+        code = Code(pyc.code, pyc.version, session.tables(pyc.version))
+    tracker = None if limits is None else budget.Tracker(limits, 'stub')
+    with budget.collect(tracker):
+        deco = deco_code(code)
+    with hooks.stage('postproc', str(pycfile)):
+        ast = ast_process(deco, pyc.version)
+    with hooks.stage('show', str(pycfile)):
+        return pyc.version, [line + '\n' for line in ast.show()], ast
+
+
+def check_engines(pycfile):
+    """Cross-checks the deco engines on every code object of a pyc file (see
+    envy.python.crosscheck).  Returns the names of the ones that differ."""
+    with pycfile.open('rb') as fp:
+        pyc = session.load(fp)
+    top = Code(pyc.code, pyc.version, session.tables(pyc.version))
+    return [code.name for code, kind, _, _ in compare_tree(top) if kind == 'differ']
+
+
+def check_export(root):
+    """Checks the machine-readable outputs of a final tree (see
+    envy.python.export): the JSON lines have to parse back to one object
+    per top-level node, and the ast has to compile, unless the tree has
+    something without an ast counterpart.  Returns a list of problems."""
+    res = []
+    nodes = [root.expr] if isinstance(root, RootEval) else root.block.stmts
+    try:
+        lines = list(json_lines(root))
+    except PythonError as e:
+        return ['json: {}'.format(e)]
+    if len(lines) != len(nodes):
+        res.append('json: {} lines for {} nodes'.format(len(lines), len(nodes)))
+    for line, node in zip(lines, nodes):
         try:
-            with pycfile.open('rb') as fp:
-                pyc = PycFile(fp)
-            if pyc.version is not pycver:
-                print("pyc tag mismatch")
-            code = Code(pyc.code, pyc.version)
-            deco = deco_code(code)
-            ast = ast_process(deco, pyc.version)
-            res = [line + '\n' for line in ast.show()]
-        except (PythonError, FormatError) as e:
-            print("FAIL {}: {}".format(test, e))
-            failed += 1
+            obj = json.loads(line)
+        except ValueError as e:
+            res.append('json: {}'.format(e))
+            break
+        if obj.get('_type') != type(node).__name__:
+            res.append('json: {} read back as {}'.format(type(node).__name__, obj.get('_type')))
+            break
+    try:
+        tree = to_ast(root)
+    except Unrepresentable:
+        return res
+    except PythonError as e:
+        return res + ['ast: {}'.format(e)]
+    try:
+        # the tests are full of things like x is 1
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', SyntaxWarning)
+            compile(tree, '<export>', 'eval' if isinstance(root, RootEval) else 'exec')
+    except RecursionError:
+        # past the compiler's own limits, as the source would be
+        pass
+    except (SyntaxError, ValueError, TypeError) as e:
+        res.append('ast: {}'.format(e))
+    return res
+
+
+def _unparen(lines):
+    return [line.replace('(', '').replace(')', '') for line in lines]
+
+
+def _parens(lines):
+    return sum(line.count('(') for line in lines)
+
+
+def check_parens(full, minimal):
+    """Returns True if the minimal parens output of a test only drops some
+    of the parens of its full output."""
+    return _unparen(minimal) == _unparen(full) and _parens(minimal) <= _parens(full)
+
+
+def check(v, test, fixture):
+    """Decompiles a test and compares the result with the expected output.
+    Then checks the deco engines against each other, the JSON and ast
+    exports (see check_export), and that streaming gives the same output,
+    and minimal parens the same output but for the parens (and its
+    expected output, <test>.exp-<suffix>.min.py, if there is one).  Returns
+    the outcomes (one of ok, failed, mismatch, missing, or nopyc, plus
+    differ, export, stream and parens for the other checks that failed)
+    and a list of messages."""
+    version, rversion, cmode, tag, pycver, tests = v
+    exp = tests[test]
+    pycfile, log = fixture
+    msgs = []
+    if pycfile is None:
+        if log:
+            msgs.append("compiling {} did not succeed:".format(test))
+            msgs += ['\t{}'.format(line) for line in log]
         else:
-            expfile = test_dir / (test + '.exp-{}.py'.format(exp))
-            resfile = subdir / (test + '.res.py')
-            if resfile.exists():
-                resfile.unlink()
-            if not expfile.exists():
-                print("no expected result for {}".format(test))
-                exp = None
-                missing += 1
+            msgs.append("compiling {} did not succeed".format(test))
+        return ['nopyc'], msgs
+    outcomes = []
+    try:
+        differ = check_engines(pycfile)
+    except (PythonError, FormatError) as e:
+        differ = [str(e)]
+    if differ:
+        msgs.append("Engines differ for {}: {}".format(test, ', '.join(differ)))
+        outcomes.append('differ')
+    limits = LIMITS.get(test)
+    try:
+        pyver, res, root = decompile(pycfile, limits)
+    except (PythonError, FormatError) as e:
+        msgs.insert(0, "FAIL {}: {}".format(test, e))
+        return ['failed'] + outcomes, msgs
+    problems = check_export(root)
+    if problems:
+        msgs.append("Export mismatch for {}: {}".format(test, '; '.join(problems)))
+        outcomes.append('export')
+    if pyver is not pycver:
+        msgs.append("pyc tag mismatch")
+    outcome = 'ok'
+    expfile = test_dir / (test + '.exp-{}.py'.format(exp))
+    resfile = test_dir / 'work' / version / (test + '.res.py')
+    resfile.parent.mkdir(parents=True, exist_ok=True)
+    if resfile.exists():
+        resfile.unlink()
+    if not expfile.exists():
+        msgs.append("no expected result for {}".format(test))
+        outcome = 'missing'
+    else:
+        with expfile.open() as expf:
+            explines = list(expf.readlines())
+        if explines != res:
+            msgs.append("Result mismatch for {}".format(test))
+            outcome = 'mismatch'
+    with resfile.open("w") as resf:
+        for line in res:
+            resf.write(line)
+    try:
+        streamed = [line + '\n' for line in get_session(limits, stream=True).decompile_file(str(pycfile))]
+    except (PythonError, FormatError) as e:
+        streamed = ["FAIL {}\n".format(e)]
+    if streamed != res:
+        msgs.append("Stream mismatch for {}".format(test))
+        outcomes.append('stream')
+    try:
+        minimal = [line + '\n' for line in get_session(limits, parens='minimal').decompile_file(str(pycfile))]
+    except (PythonError, FormatError) as e:
+        minimal = ["FAIL {}\n".format(e)]
+    minexpfile = test_dir / (test + '.exp-{}.min.py'.format(exp))
+    with resfile.with_suffix('.min.py').open("w") as resf:
+        for line in minimal:
+            resf.write(line)
+    if not check_parens(res, minimal):
+        msgs.append("Parens mismatch for {}".format(test))
+        outcomes.append('parens')
+    elif minexpfile.exists():
+        with minexpfile.open() as expf:
+            if list(expf.readlines()) != minimal:
+                msgs.append("Minimal parens mismatch for {}".format(test))
+                outcomes.append('parens')
+    return [outcome] + outcomes, msgs
+
+
+def report(v, results):
+    """Prints the outcomes of a version's tests, given as an iterable of
+    check results."""
+    counts = dict.fromkeys(['ok', 'failed', 'mismatch', 'missing', 'nopyc', 'differ', 'export', 'stream', 'parens'], 0)
+    for outcomes, msgs in results:
+        for msg in msgs:
+            print(msg)
+        for outcome in outcomes:
+            counts[outcome] += 1
+    if any(count for outcome, count in counts.items() if outcome != 'ok'):
+        print("STATS: {failed} failed, {missing} missing, {mismatch} mismatch, {nopyc} no pyc, {differ} engines differ, {export} export mismatch, {stream} stream mismatch, {parens} parens mismatch".format(**counts))
+
+
+def run_version(v):
+    version, rversion, cmode, tag, pycver, tests = v
+    print("version {} ({})...".format(version, rversion))
+    fixtures = prepare(v)
+    if fixtures is None:
+        print("No python {}".format(rversion))
+        return
+    report(v, (
+        check(v, test, fixtures[test])
+        for test in sorted(tests)
+    ))
+
+
+# process pool entry points - versions are passed by index, since the
+# PycVersion objects must stay unique
+def _prepare(idx):
+    return prepare(VERSIONS[idx])
+
+def _check(idx, test, fixture):
+    return check(VERSIONS[idx], test, fixture)
+
+
+def run_parallel(idxs, jobs):
+    """Like run_version for all given versions, but compiles the versions
+    and checks the tests on a process pool.  The output is the same as for
+    a serial run."""
+    with ProcessPoolExecutor(jobs) as pool:
+        preps = [pool.submit(_prepare, idx) for idx in idxs]
+        checks = []
+        for idx, prep in zip(idxs, preps):
+            fixtures = prep.result()
+            if fixtures is None:
+                checks.append(None)
             else:
-                with expfile.open() as expf:
-                    exp = list(expf.readlines())
-                if exp != res:
-                    print("Result mismatch for {}".format(test))
-                    mismatch += 1
-            with resfile.open("w") as resf:
-                for line in res:
-                    resf.write(line)
-
-    if failed or mismatch or missing or nopyc:
-        print("STATS: {} failed, {} missing, {} mismatch, {} no pyc".format(failed, missing, mismatch, nopyc))
+                checks.append([
+                    pool.submit(_check, idx, test, fixtures[test])
+                    for test in sorted(VERSIONS[idx][5])
+                ])
+        for idx, futs in zip(idxs, checks):
+            version, rversion = VERSIONS[idx][:2]
+            print("version {} ({})...".format(version, rversion))
+            if futs is None:
+                print("No python {}".format(rversion))
+                continue
+            report(VERSIONS[idx], (fut.result() for fut in futs))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs the decompiler tests.")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="number of worker processes")
+    parser.add_argument('versions', nargs='*', metavar='VERSION')
+    args = parser.parse_args()
+    idxs = [
+        idx
+        for idx, v in enumerate(VERSIONS)
+        if not args.versions or v[0] in args.versions
+    ]
+    if args.jobs > 1:
+        run_parallel(idxs, args.jobs)
+    else:
+        for idx in idxs:
+            run_version(VERSIONS[idx])
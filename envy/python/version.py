@@ -34,36 +34,87 @@ Anyhow, it's a mess.  If you somehow happen to come across such a file, you're
 on your own.
 """
 
+from collections import namedtuple
+
 PYC_VERSIONS = {}
 
 def _v(x):
     """Build 1.3+ signature."""
     return x | 0x0a0d0000
 
+# all flag names defined by any version
+FLAGS = set()
+
+# A compiled flag expression: the flags that must be set, and the flags that
+# must be clear.
+Flags = namedtuple('Flags', ['required', 'forbidden'])
+
+_COMPILED = {}
+
+def compile_flags(flags):
+    """Compiles a flag expression into Flags.  The expression is None
+    (always true), a flag name, or a list or tuple of them, all of which
+    have to be true.  A name prefixed with '!' is negated.  Already compiled
+    Flags are passed through."""
+    if isinstance(flags, Flags):
+        return flags
+    if isinstance(flags, list):
+        flags = tuple(flags)
+    try:
+        return _COMPILED[flags]
+    except KeyError:
+        pass
+    if flags is None:
+        items = ()
+    elif isinstance(flags, tuple):
+        items = flags
+    else:
+        items = flags,
+    required = set()
+    forbidden = set()
+    for flag in items:
+        if flag.startswith('!'):
+            flag = flag[1:]
+            dst = forbidden
+        else:
+            dst = required
+        if flag not in FLAGS:
+            raise AttributeError("unknown version flag {}".format(flag))
+        dst.add(flag)
+    res = _COMPILED[flags] = Flags(frozenset(required), frozenset(forbidden))
+    return res
+
+def join_flags(a, b):
+    """Returns compiled Flags true iff both expressions are true."""
+    a = compile_flags(a)
+    b = compile_flags(b)
+    return Flags(a.required | b.required, a.forbidden | b.forbidden)
+
 class PycVersion:
     def __init__(self, name, bases, namespace):
         for base in bases:
             self.__dict__.update(base.__dict__)
         self.__dict__.update(namespace)
+        names = [
+            key
+            for key, val in self.__dict__.items()
+            if isinstance(val, bool)
+        ]
+        FLAGS.update(names)
+        # the flags that are set, for match
+        self.flags = frozenset(name for name in names if self.__dict__[name])
         if hasattr(self, 'code'):
             PYC_VERSIONS[self.code] = self
             if self.has_U:
                 PYC_VERSIONS[self.code + 1] = self
 
     def match(self, flags):
-        if flags is None:
-            flags = []
-        if not isinstance(flags, (list, tuple)):
-            flags = [flags]
-        ok = True
-        for flag in flags:
-            if flag.startswith('!'):
-                if getattr(self, flag[1:]):
-                    return False
-            else:
-                if not getattr(self, flag):
-                    return False
-        return True
+        required, forbidden = compile_flags(flags)
+        return required <= self.flags and self.flags.isdisjoint(forbidden)
+
+    def __reduce__(self):
+        # versions are singletons, pickled by name
+        return self.__qualname__
 
 # 0x949494 used in 0.9.8, ??? used before
 # 0x999901 used in 0.9.9
@@ -7,3 +7,45 @@ def preindent(pref, lines):
     yield "{}: {}".format(pref, next(it))
     for line in it:
         yield '\t' + line
+
+
+class Emitter:
+    """Writes source lines at the current indentation depth.  Statements
+    write their own lines and have their blocks written one level deeper
+    (see block), so every line is produced once, already indented - unlike
+    show generators, which pass every line up through every enclosing
+    statement.  out is called with each line followed by end, so an emitter
+    can write straight to a file (Emitter(fp.write, '\\n')) or collect the
+    lines in a list (Emitter(lines.append))."""
+    __slots__ = 'out', 'end', 'depth', 'prefix'
+
+    def __init__(self, out, end='', depth=0):
+        self.out = out
+        self.end = end
+        self.depth = depth
+        self.prefix = '\t' * depth
+
+    def line(self, text):
+        self.out(self.prefix + text + self.end)
+
+    def lines(self, lines):
+        for text in lines:
+            self.out(self.prefix + text + self.end)
+
+    def block(self, node):
+        """Emits a node (normally a Block) one level deeper."""
+        self.depth += 1
+        self.prefix = '\t' * self.depth
+        try:
+            node.emit(self)
+        finally:
+            self.depth -= 1
+            self.prefix = '\t' * self.depth
+
+
+def emitted(node):
+    """Returns the lines emitted by a node, as a list - the show of nodes
+    that implement emit."""
+    res = []
+    node.emit(Emitter(res.append))
+    return res
@@ -0,0 +1,138 @@
+"""Lightweight instrumentation of the decompilation pipeline.
+
+Counters are collected into a Stats object while it's installed as the
+active collector (see collect).  When no collector is active, ACTIVE.stats
+is None and every instrumented spot boils down to a lookup and comparison,
+so it's fine to leave the hooks in the hot paths.  The active collector is
+per thread.
+
+Stage timings come from the envy.hooks stages - an installed Stats object
+is also a hook.  Only the outermost occurrence of a stage is timed, so nested
+code and deco stages of inner code objects aren't counted twice.
+"""
+
+from contextlib import contextmanager
+import threading
+import time
+
+from envy import hooks
+
+class _Active(threading.local):
+    # the active collector, or None if instrumentation is disabled
+    stats = None
+
+ACTIVE = _Active()
+
+STAGES = ['pyc', 'load', 'code', 'deco', 'postproc', 'show']
+
+# counter name, description, how to merge
+COUNTERS = [
+    ('bytes', 'bytes read', 'sum'),
+    ('codes', 'code objects', 'sum'),
+    ('ops', 'opcodes parsed', 'sum'),
+    ('attempts', 'visitor attempts', 'sum'),
+    ('matches', 'visitor matches', 'sum'),
+    ('nomatch', 'NoMatch raised', 'sum'),
+    ('regurgitate_depth', 'max regurgitation depth', 'max'),
+    ('nodes', 'nodes allocated', 'sum'),
+    ('rewrites', 'postproc rewrites', 'sum'),
+    ('shared', 'nodes shared by interning', 'sum'),
+    ('reused', 'code objects reused', 'sum'),
+    ('cache_hits', 'code cache hits', 'sum'),
+    ('cache_misses', 'code cache misses', 'sum'),
+    ('parallel', 'code objects decompiled in parallel', 'sum'),
+    ('fallbacks', 'code objects fallen back', 'sum'),
+    ('structured', 'code objects structured from the CFG', 'sum'),
+]
+
+
+class Stats(hooks.Hook):
+    """Timings and counters for a single file, or an aggregate of several."""
+    __slots__ = ['name', 'files', 'times', '_started'] + [name for name, _, _ in COUNTERS]
+
+    def __init__(self, name=None):
+        self.name = name
+        self.files = 1 if name is not None else 0
+        self.times = {}
+        self._started = {}
+        for counter, _, _ in COUNTERS:
+            setattr(self, counter, 0)
+
+    def enter(self, stage, info):
+        if stage in STAGES:
+            start, depth = self._started.get(stage, (None, 0))
+            if not depth:
+                start = time.perf_counter()
+            self._started[stage] = start, depth + 1
+
+    def exit(self, stage, info):
+        if stage in STAGES:
+            start, depth = self._started[stage]
+            if depth == 1:
+                del self._started[stage]
+                self.times[stage] = self.times.get(stage, 0) + time.perf_counter() - start
+            else:
+                self._started[stage] = start, depth - 1
+
+    # the time a stage is paused isn't counted
+    pause = exit
+    resume = enter
+
+    def merge(self, other):
+        """Adds the counters of other to this object."""
+        self.files += other.files
+        for name, val in other.times.items():
+            self.times[name] = self.times.get(name, 0) + val
+        for counter, _, how in COUNTERS:
+            mine = getattr(self, counter)
+            theirs = getattr(other, counter)
+            if how == 'max':
+                setattr(self, counter, max(mine, theirs))
+            else:
+                setattr(self, counter, mine + theirs)
+
+    def as_dict(self):
+        res = {
+            'name': self.name,
+            'files': self.files,
+            'times': {
+                stage: self.times[stage]
+                for stage in STAGES
+                if stage in self.times
+            },
+        }
+        for counter, _, _ in COUNTERS:
+            res[counter] = getattr(self, counter)
+        return res
+
+    def show(self):
+        if self.name is not None:
+            yield "stats for {}:".format(self.name)
+        else:
+            yield "total for {} files:".format(self.files)
+        total = sum(self.times.values())
+        for stage in STAGES:
+            if stage in self.times:
+                yield "\t{:<10} {:10.3f} ms".format(stage, self.times[stage] * 1000)
+        yield "\t{:<10} {:10.3f} ms".format('all', total * 1000)
+        for counter, desc, _ in COUNTERS:
+            yield "\t{:<24} {}".format(desc, getattr(self, counter))
+        lookups = self.cache_hits + self.cache_misses
+        if lookups:
+            yield "\t{:<24} {:.1%}".format('code cache hit rate', self.cache_hits / lookups)
+
+
+@contextmanager
+def collect(stats):
+    """Installs stats as the active collector for the duration of the
+    with block.  None is allowed and disables collection."""
+    prev = ACTIVE.stats
+    ACTIVE.stats = stats
+    try:
+        if stats is None:
+            yield stats
+        else:
+            with hooks.install(stats):
+                yield stats
+    finally:
+        ACTIVE.stats = prev
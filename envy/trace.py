@@ -0,0 +1,194 @@
+"""Structured tracing of the stack automaton.
+
+While a Tracer is installed as the active tracer (see collect), the deco
+stage records an event for every matched visitor and for every failure to
+match.  When no tracer is active, ACTIVE.tracer is None and the automaton
+pays for a single lookup per processed opcode.  The active tracer is per
+thread.
+
+Events are kept as compact records in a ring buffer (if a size is given, only
+the last that many events survive), or streamed straight to a binary file.
+The binary format is a sequence of little-endian records:
+
+- NAME: kind (u8), id (u32), length (u16), utf-8 bytes.  Defines a string
+  (code object, opcode class, or visitor name) referenced by later records.
+  Every string is defined before its first use.
+- START, VISIT, FAIL, END: kind (u8), pos (u32), cls (u32), visitor (u32),
+  delta (i32), depth (u32).
+
+For START and END, pos is the first line number of the code object and cls
+is its name.  For VISIT and FAIL, pos is the bytecode position of the opcode
+(0 for fake opcodes that don't have one), cls is the opcode class, visitor
+is the matched visitor (0 for FAIL), delta is the change in stack size, and
+depth is the stack size before the visit.
+
+Run this module with trace files as the arguments to view them.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+import argparse
+import struct
+import sys
+import threading
+
+class _Active(threading.local):
+    # the active tracer, or None if tracing is disabled
+    tracer = None
+
+ACTIVE = _Active()
+
+NAME, START, VISIT, FAIL, END = range(5)
+
+MAGIC = b'ENVYTRC1'
+
+_NAME = struct.Struct('<BIH')
+_RECORD = struct.Struct('<BIIIiI')
+
+
+class Tracer:
+    """Collects trace records.  If fp is given, records are written to it as
+    they come.  Otherwise, they're kept in memory, in a ring buffer if size
+    is given."""
+
+    def __init__(self, fp=None, size=None):
+        self.fp = fp
+        self.records = deque(maxlen=size)
+        self.ids = {}
+        self.texts = []
+        if fp is not None:
+            fp.write(MAGIC)
+
+    def name(self, key, text):
+        try:
+            return self.ids[key]
+        except KeyError:
+            pass
+        self.texts.append(text)
+        idx = self.ids[key] = len(self.texts)
+        if self.fp is not None:
+            _write_name(self.fp, idx, text)
+        return idx
+
+    def record(self, kind, pos, cls, visitor, delta, depth):
+        rec = (kind, pos, cls, visitor, delta, depth)
+        if self.fp is not None:
+            self.fp.write(_RECORD.pack(*rec))
+        else:
+            self.records.append(rec)
+
+    def start(self, code):
+        name = self.name(('code', code.name), str(code.name))
+        self.record(START, code.firstlineno or 0, name, 0, 0, 0)
+
+    def end(self, code):
+        name = self.name(('code', code.name), str(code.name))
+        self.record(END, code.firstlineno or 0, name, 0, 0, 0)
+
+    def visit(self, op, visitor, delta, depth):
+        cls = type(op)
+        self.record(
+            VISIT,
+            getattr(op, 'pos', 0),
+            self.name(cls, cls.__name__),
+            self.name(visitor, visitor.name),
+            delta,
+            depth,
+        )
+
+    def fail(self, op, depth):
+        cls = type(op)
+        self.record(
+            FAIL,
+            getattr(op, 'pos', 0),
+            self.name(cls, cls.__name__),
+            0,
+            0,
+            depth,
+        )
+
+    def dump(self, fp):
+        """Writes the in-memory records to a binary trace file."""
+        fp.write(MAGIC)
+        for idx, text in enumerate(self.texts, 1):
+            _write_name(fp, idx, text)
+        for rec in self.records:
+            fp.write(_RECORD.pack(*rec))
+
+
+def _write_name(fp, idx, text):
+    raw = text.encode('utf-8')
+    fp.write(_NAME.pack(NAME, idx, len(raw)))
+    fp.write(raw)
+
+
+@contextmanager
+def collect(tracer):
+    """Installs tracer as the active tracer for the duration of the with
+    block."""
+    prev = ACTIVE.tracer
+    ACTIVE.tracer = tracer
+    try:
+        yield tracer
+    finally:
+        ACTIVE.tracer = prev
+
+
+def read_trace(fp):
+    """Reads a binary trace file, yields (kind, pos, cls, visitor, delta,
+    depth) tuples with names resolved to strings."""
+    if fp.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not a trace file")
+    names = {0: None}
+    while True:
+        kind = fp.read(1)
+        if not kind:
+            return
+        if kind[0] == NAME:
+            rest = fp.read(_NAME.size - 1)
+            _, idx, len_ = _NAME.unpack(kind + rest)
+            names[idx] = fp.read(len_).decode('utf-8')
+        else:
+            rest = fp.read(_RECORD.size - 1)
+            if len(rest) != _RECORD.size - 1:
+                raise ValueError("truncated trace file")
+            kind, pos, cls, visitor, delta, depth = _RECORD.unpack(kind + rest)
+            yield kind, pos, names[cls], names[visitor], delta, depth
+
+
+def show_trace(fp):
+    for kind, pos, cls, visitor, delta, depth in read_trace(fp):
+        if kind == START:
+            yield "START {} {}".format(cls, pos)
+        elif kind == END:
+            yield "END {}".format(cls)
+        elif kind == VISIT:
+            yield "\tVISIT {:>6} {:<28} {:+d} [{}] {}".format(pos, cls, delta, depth, visitor)
+        else:
+            yield "\tFAIL  {:>6} {:<28} [{}]".format(pos, cls, depth)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prints the events of binary trace files (see unpyc.py --trace).")
+    parser.add_argument('files', nargs='+', metavar='FILE')
+    args = parser.parse_args()
+    status = 0
+    for fname in args.files:
+        try:
+            fp = open(fname, 'rb')
+        except OSError as e:
+            print("{}: {}".format(fname, e), file=sys.stderr)
+            status = 1
+            continue
+        with fp:
+            try:
+                for line in show_trace(fp):
+                    print(line)
+            except ValueError as e:
+                print("{}: {}".format(fname, e), file=sys.stderr)
+                status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
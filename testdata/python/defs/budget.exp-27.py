@@ -0,0 +1,7 @@
+def small(a$0, b$1):
+	return (a$0 + b$1)
+def big(a$0, b$1):
+	# decompilation failed: over 200 visitor steps
+	pass
+def after(a$0):
+	return (-a$0)
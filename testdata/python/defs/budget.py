@@ -0,0 +1,68 @@
+def small(a, b):
+    return a + b
+
+def big(a, b):
+    x0 = a * 0 + b
+    x1 = a * 1 + b
+    x2 = a * 2 + b
+    x3 = a * 3 + b
+    x4 = a * 4 + b
+    x5 = a * 5 + b
+    x6 = a * 6 + b
+    x7 = a * 7 + b
+    x8 = a * 8 + b
+    x9 = a * 9 + b
+    x10 = a * 10 + b
+    x11 = a * 11 + b
+    x12 = a * 12 + b
+    x13 = a * 13 + b
+    x14 = a * 14 + b
+    x15 = a * 15 + b
+    x16 = a * 16 + b
+    x17 = a * 17 + b
+    x18 = a * 18 + b
+    x19 = a * 19 + b
+    x20 = a * 20 + b
+    x21 = a * 21 + b
+    x22 = a * 22 + b
+    x23 = a * 23 + b
+    x24 = a * 24 + b
+    x25 = a * 25 + b
+    x26 = a * 26 + b
+    x27 = a * 27 + b
+    x28 = a * 28 + b
+    x29 = a * 29 + b
+    x30 = a * 30 + b
+    x31 = a * 31 + b
+    x32 = a * 32 + b
+    x33 = a * 33 + b
+    x34 = a * 34 + b
+    x35 = a * 35 + b
+    x36 = a * 36 + b
+    x37 = a * 37 + b
+    x38 = a * 38 + b
+    x39 = a * 39 + b
+    x40 = a * 40 + b
+    x41 = a * 41 + b
+    x42 = a * 42 + b
+    x43 = a * 43 + b
+    x44 = a * 44 + b
+    x45 = a * 45 + b
+    x46 = a * 46 + b
+    x47 = a * 47 + b
+    x48 = a * 48 + b
+    x49 = a * 49 + b
+    x50 = a * 50 + b
+    x51 = a * 51 + b
+    x52 = a * 52 + b
+    x53 = a * 53 + b
+    x54 = a * 54 + b
+    x55 = a * 55 + b
+    x56 = a * 56 + b
+    x57 = a * 57 + b
+    x58 = a * 58 + b
+    x59 = a * 59 + b
+    return x0
+
+def after(a):
+    return -a
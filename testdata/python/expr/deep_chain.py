@@ -0,0 +1,3 @@
+x = a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a + a
+y = a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a and a
+z = b0 or b1 or b2 or b3 or b4 or b5 or b6 or b7 or b8 or b9 or b10 or b11 or b12 or b13 or b14 or b15 or b16 or b17 or b18 or b19 or b20 or b21 or b22 or b23 or b24 or b25 or b26 or b27 or b28 or b29 or b30 or b31 or b32 or b33 or b34 or b35 or b36 or b37 or b38 or b39 or b40 or b41 or b42 or b43 or b44 or b45 or b46 or b47 or b48 or b49 or b50 or b51 or b52 or b53 or b54 or b55 or b56 or b57 or b58 or b59 or b60 or b61 or b62 or b63 or b64 or b65 or b66 or b67 or b68 or b69 or b70 or b71 or b72 or b73 or b74 or b75 or b76 or b77 or b78 or b79 or b80 or b81 or b82 or b83 or b84 or b85 or b86 or b87 or b88 or b89 or b90 or b91 or b92 or b93 or b94 or b95 or b96 or b97 or b98 or b99 or b100 or b101 or b102 or b103 or b104 or b105 or b106 or b107 or b108 or b109 or b110 or b111 or b112 or b113 or b114 or b115 or b116 or b117 or b118 or b119 or b120 or b121 or b122 or b123 or b124 or b125 or b126 or b127 or b128 or b129 or b130 or b131 or b132 or b133 or b134 or b135 or b136 or b137 or b138 or b139 or b140 or b141 or b142 or b143 or b144 or b145 or b146 or b147 or b148 or b149 or b150 or b151 or b152 or b153 or b154 or b155 or b156 or b157 or b158 or b159 or b160 or b161 or b162 or b163 or b164 or b165 or b166 or b167 or b168 or b169 or b170 or b171 or b172 or b173 or b174 or b175 or b176 or b177 or b178 or b179 or b180 or b181 or b182 or b183 or b184 or b185 or b186 or b187 or b188 or b189 or b190 or b191 or b192 or b193 or b194 or b195 or b196 or b197 or b198 or b199 or b200 or b201 or b202 or b203 or b204 or b205 or b206 or b207 or b208 or b209 or b210 or b211 or b212 or b213 or b214 or b215 or b216 or b217 or b218 or b219 or b220 or b221 or b222 or b223 or b224 or b225 or b226 or b227 or b228 or b229 or b230 or b231 or b232 or b233 or b234 or b235 or b236 or b237 or b238 or b239 or b240 or b241 or b242 or b243 or b244 or b245 or b246 or b247 or b248 or b249 or b250 or b251 or b252 or b253 or b254 or b255 or b256 or b257 or b258 or b259 or b260 or b261 or b262 or b263 or b264 or b265 or b266 or b267 or b268 or b269 or b270 or b271 or b272 or b273 or b274 or b275 or b276 or b277 or b278 or b279 or b280 or b281 or b282 or b283 or b284 or b285 or b286 or b287 or b288 or b289 or b290 or b291 or b292 or b293 or b294 or b295 or b296 or b297 or b298 or b299 or b300 or b301 or b302 or b303 or b304 or b305 or b306 or b307 or b308 or b309 or b310 or b311 or b312 or b313 or b314 or b315 or b316 or b317 or b318 or b319 or b320 or b321 or b322 or b323 or b324 or b325 or b326 or b327 or b328 or b329 or b330 or b331 or b332 or b333 or b334 or b335 or b336 or b337 or b338 or b339 or b340 or b341 or b342 or b343 or b344 or b345 or b346 or b347 or b348 or b349 or b350 or b351 or b352 or b353 or b354 or b355 or b356 or b357 or b358 or b359 or b360 or b361 or b362 or b363 or b364 or b365 or b366 or b367 or b368 or b369 or b370 or b371 or b372 or b373 or b374 or b375 or b376 or b377 or b378 or b379 or b380 or b381 or b382 or b383 or b384 or b385 or b386 or b387 or b388 or b389 or b390 or b391 or b392 or b393 or b394 or b395 or b396 or b397 or b398 or b399 or b400 or b401 or b402 or b403 or b404 or b405 or b406 or b407 or b408 or b409 or b410 or b411 or b412 or b413 or b414 or b415 or b416 or b417 or b418 or b419 or b420 or b421 or b422 or b423 or b424 or b425 or b426 or b427 or b428 or b429 or b430 or b431 or b432 or b433 or b434 or b435 or b436 or b437 or b438 or b439 or b440 or b441 or b442 or b443 or b444 or b445 or b446 or b447 or b448 or b449 or b450 or b451 or b452 or b453 or b454 or b455 or b456 or b457 or b458 or b459 or b460 or b461 or b462 or b463 or b464 or b465 or b466 or b467 or b468 or b469 or b470 or b471 or b472 or b473 or b474 or b475 or b476 or b477 or b478 or b479 or b480 or b481 or b482 or b483 or b484 or b485 or b486 or b487 or b488 or b489 or b490 or b491 or b492 or b493 or b494 or b495 or b496 or b497 or b498 or b499
@@ -0,0 +1,28 @@
+a = b + c * d
+a = (b + c) * d
+a = b - (c - d)
+a = b - c - d
+a = -b ** c
+a = (-b) ** c
+a = b ** c ** d
+a = (b ** c) ** d
+a = not b == c
+a = (not b) == c
+a = b < c < d
+a = (b < c) < d
+a = b | c ^ d & e
+a = (b | c) & d
+a = b and not c or d
+a = (b or c) and not d
+a = b and c and d
+a = b or c or d
+a = b[c + d].e(f * g)
+a = (b + c).d
+a = -(b + c)
+a = ~b * c
+a = (lambda x$0: (x$0 + 1) * 2)
+a = (lambda x$0: x$0)(b)
+exec (a or b)
+exec (a in b) in g
+exec a in b in g
+exec a + b in g or h, not l
@@ -0,0 +1,21 @@
+while (a and b):
+	x = 1
+while (a and (b and c)):
+	x = 2
+while (a and (not b)):
+	x = 3
+else:
+	x = 4
+def f(l$0):
+	while (l$0 and (not l$0[-1])):
+		del l$0[-1]
+	return l$0
+def g(a$0, b$1):
+	while (a$0 and b$1):
+		if a$0:
+			break
+		a$0 = (a$0 - 1)
+while a:
+	if b:
+		x = 5
+	y = 6
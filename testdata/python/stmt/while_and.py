@@ -0,0 +1,26 @@
+while a and b:
+    x = 1
+
+while a and b and c:
+    x = 2
+
+while a and not b:
+    x = 3
+else:
+    x = 4
+
+def f(l):
+    while l and not l[-1]:
+        del l[-1]
+    return l
+
+def g(a, b):
+    while a and b:
+        if a:
+            break
+        a = a - 1
+
+while a:
+    if b:
+        x = 5
+    y = 6
@@ -66,35 +66,186 @@ While decompilation is fairly accurate, some information is irreversibly lost:
 8. 'in' optimization: x in [1, 2, 3] is optimized to x in (1, 2, 3).
 """
 
+import argparse
+from contextlib import ExitStack
+import json
 import sys
-
-from envy.format.pyc import PycFile
-from envy.python.code import Code
-from envy.python.deco import deco_code
-from envy.python.postproc import ast_process
-
-if sys.argv[1] == '-t':
-    import envy.python.deco
-    envy.python.deco.TRACE = True
-    del sys.argv[1]
-
-for fname in sys.argv[1:]:
-    print("{}...".format(fname))
-
-    with open(fname, 'rb') as fp:
-        pyc = PycFile(fp)
-
-    #for line in pyc.show():
-    #    print(line)
-
-    code = Code(pyc.code, pyc.version)
-    for line in code.show():
-        print(line)
-
-    deco = deco_code(code)
-    #for line in deco.show():
-    #    print(line)
-
-    ast = ast_process(deco, pyc.version)
-    for line in ast.show():
-        print(line)
+import time
+
+from envy import hooks, stats, trace
+from envy.python.session import Decompiler
+
+parser = argparse.ArgumentParser(description="Decompiles pyc files.")
+parser.add_argument('-t', '--trace', metavar='FILE', help="write a binary trace of the stack automaton to FILE (view with python -m envy.trace)")
+parser.add_argument('--trace-ring', type=int, metavar='N', help="only keep the last N trace events")
+parser.add_argument('--stats', action='store_const', const='text', help="print per-stage timings and counters to stderr")
+parser.add_argument('--stats-json', action='store_const', const='json', dest='stats', help="like --stats, but dump them as JSON")
+parser.add_argument('--profile', metavar='OUT', help="profile with cProfile, write pstats data to OUT")
+parser.add_argument('--profile-stage', action='append', choices=['file', 'pyc', 'load', 'code', 'deco', 'postproc', 'show'], help="stage to profile (default: file, may be repeated)")
+parser.add_argument('--profile-slow', type=float, metavar='SECONDS', help="only profile files that take longer than SECONDS to decompile")
+parser.add_argument('--slow-codes', type=int, metavar='N', help="print the N code objects that took longest to decompile")
+parser.add_argument('--memory', action='store_true', help="track memory use per stage and print the biggest consumers; slow")
+parser.add_argument('--memory-top', type=int, default=10, metavar='N', help="how many of the biggest consumers --memory prints (default 10)")
+parser.add_argument('--intern', action='store_true', help="share equal immutable expression nodes, saves memory on constant-heavy modules")
+parser.add_argument('--code-cache', action='store_true', help="keep decompiled code objects in a persistent cache")
+parser.add_argument('--code-cache-path', metavar='PATH', help="where the code cache is kept (default: ~/.cache/envy/codes.sqlite), implies --code-cache")
+parser.add_argument('--code-cache-size', type=int, default=256, metavar='MB', help="maximum size of the code cache (default 256 MB)")
+parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N', help="decompile the functions and classes of big modules on N processes (ignored with --scan)")
+parser.add_argument('--json', action='store_true', help="print the decompiled tree as JSON lines instead of source (see envy.python.export)")
+parser.add_argument('--min-parens', action='store_const', const='minimal', default='full', dest='parens', help="only parenthesize expressions where operator precedence requires it")
+parser.add_argument('--stream', action='store_true', help="print top-level statements as soon as they're decompiled (not with --json or --engine cfg/auto)")
+parser.add_argument('--fallback', choices=['stub', 'listing'], help="replace code objects that can't be decompiled with a stub, or a stub with their disassembly, instead of giving up on the file (the default with budgets is stub)")
+parser.add_argument('--engine', choices=['stack', 'cfg', 'auto'], default='stack', help="decompile code objects with the stack automaton, by structuring their control flow graph where possible, or the latter only for large code objects")
+parser.add_argument('--visitor-profile', metavar='PROFILE', help="try the visitors in the order of a profile made by python -m envy.python.census (same results, fewer attempts)")
+parser.add_argument('--budget-time', type=float, metavar='SECONDS', help="give up on code objects that take longer than SECONDS to decompile")
+parser.add_argument('--budget-steps', type=int, metavar='N', help="give up on code objects that take more than N visitor steps")
+parser.add_argument('--budget-nodes', type=int, metavar='N', help="give up on code objects that allocate more than N nodes")
+parser.add_argument('--file-budget-time', type=float, metavar='SECONDS', help="give up on code objects that start after SECONDS spent on a file")
+parser.add_argument('--scan', action='store_true', help="don't decompile, print a JSON lines inventory of the files instead (see envy.python.scan)")
+parser.add_argument('files', nargs='+', metavar='FILE')
+args = parser.parse_args()
+if args.stream and args.json:
+    parser.error("--stream doesn't work with --json")
+if args.stream and args.engine != 'stack':
+    parser.error("--stream only works with --engine stack")
+
+if args.scan:
+    from envy.python.scan import scan_files
+    status = 0
+    # scanning a file is cheaper than handing it to another process, so
+    # this is always done serially
+    for res in scan_files(args.files):
+        if 'error' in res:
+            status = 1
+        print(json.dumps(res))
+    sys.exit(status)
+
+total = stats.Stats()
+per_file = []
+
+# the optional features are only imported when they're asked for, so
+# that they don't slow down starting up
+if args.code_cache or args.code_cache_path is not None:
+    from envy.python.deco.cache import CodeCache
+    code_cache = CodeCache(args.code_cache_path, args.code_cache_size * 2**20)
+else:
+    code_cache = None
+
+budgets = args.budget_time, args.budget_steps, args.budget_nodes, args.file_budget_time
+if any(budget is not None for budget in budgets):
+    from envy.python.deco.budget import Limits
+    limits = Limits(*budgets)
+    fallback = args.fallback or 'stub'
+else:
+    limits = None
+    fallback = args.fallback
+
+if args.visitor_profile is not None:
+    from envy.python.deco.order import VisitorProfile
+    visitor_profile = VisitorProfile.load(args.visitor_profile)
+else:
+    visitor_profile = None
+
+session = Decompiler(output=('json',) if args.json else ('code', 'source'), intern=args.intern, code_cache=code_cache, jobs=args.jobs, parens=args.parens, stream=args.stream, limits=limits, fallback=fallback, engine=args.engine, profile=visitor_profile)
+
+def decompile(fname, out):
+    if args.json:
+        out(json.dumps({'file': fname}))
+    else:
+        out("{}...".format(fname))
+    for line in session.decompile_file(fname):
+        out(line)
+
+def _discard(line):
+    pass
+
+if args.profile:
+    from envy.profiling import Profiler
+    profiler = Profiler(args.profile_stage or ['file'])
+else:
+    profiler = None
+
+def run(fname):
+    st = stats.Stats(fname) if args.stats else None
+    start = time.perf_counter()
+    with stats.collect(st):
+        if profiler is not None and args.profile_slow is None:
+            with hooks.install(profiler):
+                decompile(fname, print)
+        else:
+            decompile(fname, print)
+    elapsed = time.perf_counter() - start
+    if profiler is not None and args.profile_slow is not None and elapsed > args.profile_slow:
+        print("profiling {} ({:.3f} s)".format(fname, elapsed), file=sys.stderr)
+        # the other hooks and the tracer have seen this file already
+        with hooks.only(profiler), trace.collect(None):
+            decompile(fname, _discard)
+
+    if st is not None:
+        total.merge(st)
+        per_file.append(st)
+        if args.stats == 'text':
+            for line in st.show():
+                print(line, file=sys.stderr)
+
+def run_all():
+    timer = memory = None
+    if args.slow_codes:
+        from envy.profiling import CodeTimer
+        timer = CodeTimer()
+    if args.memory:
+        from envy.memory import MemoryReport
+        memory = MemoryReport()
+    with ExitStack() as stack:
+        for hook in timer, memory:
+            if hook is not None:
+                stack.enter_context(hooks.install(hook))
+        for fname in args.files:
+            run(fname)
+            if memory is not None:
+                for line in memory.files[-1].show(args.memory_top):
+                    print(line, file=sys.stderr)
+    if timer is not None:
+        for line in timer.show(args.slow_codes):
+            print(line, file=sys.stderr)
+    if memory is not None:
+        for line in memory.show(args.memory_top):
+            print(line, file=sys.stderr)
+
+if args.trace is None:
+    run_all()
+elif args.trace_ring is None:
+    with open(args.trace, 'wb') as tfp:
+        with trace.collect(trace.Tracer(tfp)):
+            run_all()
+else:
+    tracer = trace.Tracer(size=args.trace_ring)
+    try:
+        with trace.collect(tracer):
+            run_all()
+    finally:
+        with open(args.trace, 'wb') as tfp:
+            tracer.dump(tfp)
+
+if profiler is not None:
+    profiler.dump(args.profile)
+
+if args.stats == 'text' and len(per_file) > 1:
+    for line in total.show():
+        print(line, file=sys.stderr)
+elif args.stats == 'json':
+    res = {
+        'files': [st.as_dict() for st in per_file],
+        'total': total.as_dict(),
+    }
+    if code_cache is not None:
+        res['code_cache'] = code_cache.info()
+    json.dump(res, sys.stderr, indent=1)
+    print(file=sys.stderr)
+
+if code_cache is not None:
+    if args.stats == 'text':
+        for line in code_cache.show():
+            print(line, file=sys.stderr)
+    code_cache.close()
+session.close()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+"""Thin client for the decompilation daemon (see envy/daemon.py).
+
+Takes the same arguments and prints the same output as unpyc.py, but leaves
+the work to a running daemon, so it doesn't import the decompiler at all.
+The options that change what's decompiled and how (--json, --min-parens,
+--engine, --fallback, --intern and the budgets) are passed on to the daemon.
+With any other unpyc.py option (the instrumentation, --stream, --jobs, ...),
+or if no daemon is listening, it runs unpyc.py with the same arguments
+instead.
+
+Two options of its own come before the rest:
+
+- --socket PATH: the daemon's socket (default $ENVY_SOCKET or
+  /tmp/envy-UID.sock)
+- --raw: print the daemon's replies as they are, one JSON line per file
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+parser = argparse.ArgumentParser(description="Decompiles pyc files on a running daemon.", allow_abbrev=False)
+parser.add_argument('--socket', default=os.environ.get('ENVY_SOCKET') or '/tmp/envy-{}.sock'.format(os.getuid()), metavar='PATH', help="the daemon's socket (default: $ENVY_SOCKET or /tmp/envy-UID.sock)")
+parser.add_argument('--raw', action='store_true', help="print the daemon's replies as they are")
+parser.add_argument('--json', action='store_true', help="print the decompiled tree as JSON lines instead of source")
+parser.add_argument('--min-parens', action='store_const', const='minimal', default='full', dest='parens', help="only parenthesize expressions where operator precedence requires it")
+parser.add_argument('--intern', action='store_true', help="share equal immutable expression nodes")
+parser.add_argument('--fallback', choices=['stub', 'listing'], help="replace code objects that can't be decompiled with a stub")
+parser.add_argument('--engine', choices=['stack', 'cfg', 'auto'], default='stack', help="the deco engine")
+parser.add_argument('--budget-time', type=float, metavar='SECONDS')
+parser.add_argument('--budget-steps', type=int, metavar='N')
+parser.add_argument('--budget-nodes', type=int, metavar='N')
+parser.add_argument('--file-budget-time', type=float, metavar='SECONDS')
+parser.add_argument('files', nargs='+', metavar='FILE')
+
+
+def local(argv):
+    """Runs unpyc.py with argv, minus the client's own options."""
+    args = []
+    it = iter(argv)
+    for arg in it:
+        if arg == '--socket':
+            next(it, None)
+        elif arg != '--raw' and not arg.startswith('--socket='):
+            args.append(arg)
+    unpyc = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'unpyc.py')
+    os.execv(sys.executable, [sys.executable, unpyc] + args)
+
+
+def options(args):
+    """Returns the daemon request options for the parsed arguments, like
+    unpyc.py makes its Decompiler."""
+    res = {}
+    if args.intern:
+        res['intern'] = True
+    if args.parens != 'full':
+        res['parens'] = args.parens
+    if args.engine != 'stack':
+        res['engine'] = args.engine
+    fallback = args.fallback
+    budgets = {
+        'time': args.budget_time,
+        'steps': args.budget_steps,
+        'nodes': args.budget_nodes,
+        'file_time': args.file_budget_time,
+    }
+    if any(val is not None for val in budgets.values()):
+        res['limits'] = {name: val for name, val in budgets.items() if val is not None}
+        fallback = fallback or 'stub'
+    if fallback is not None:
+        res['fallback'] = fallback
+    return res
+
+
+def main(argv):
+    args, rest = parser.parse_known_args(argv)
+    if rest:
+        # something only unpyc.py itself does
+        local(argv)
+    sock = socket.socket(socket.AF_UNIX)
+    try:
+        sock.connect(args.socket)
+    except OSError:
+        sock.close()
+        if args.raw:
+            sys.exit("no daemon listening on {}".format(args.socket))
+        local(argv)
+    output = ['json'] if args.json else ['code', 'source']
+    opts = options(args)
+    rfile = sock.makefile('rb')
+    status = 0
+    for fname in args.files:
+        req = {'path': os.path.abspath(fname), 'output': output, 'options': opts}
+        sock.sendall(json.dumps(req).encode('utf-8') + b'\n')
+        line = rfile.readline()
+        if not line:
+            sys.exit("daemon closed the connection")
+        if args.raw:
+            sys.stdout.write(line.decode('utf-8'))
+            continue
+        reply = json.loads(line.decode('utf-8'))
+        if args.json:
+            print(json.dumps({'file': fname}))
+        else:
+            print("{}...".format(fname))
+        if reply['ok']:
+            for line in reply['lines']:
+                print(line)
+        else:
+            print(reply['error'], file=sys.stderr)
+            status = 1
+    sock.close()
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))